@@ -20,6 +20,21 @@ config_manager = ConfigurationManager()
 QDRANT_URL = config_manager.qdrant_url
 COLLECTION_NAME = config_manager.collection_name
 EMBEDDING_MODEL = config_manager.embedding_model
+EMBEDDING_CHUNKING = config_manager.embedding_chunking
+EMBEDDING_CHUNK_SIZE = config_manager.embedding_chunk_size
+EMBEDDING_CHUNK_OVERLAP = config_manager.embedding_chunk_overlap
+EMBEDDING_MAX_CHUNKS = config_manager.embedding_max_chunks
+EMBEDDING_CHUNK_POOLING = config_manager.embedding_chunk_pooling
+RETRIEVAL_MODE = config_manager.retrieval_mode
+RETRIEVAL_CANDIDATES = config_manager.retrieval_candidates
+RRF_K = config_manager.rrf_k
+LEXICAL_REFRESH_INTERVAL = config_manager.lexical_refresh_interval
+PREDICTION_MODE = config_manager.prediction_mode
+MODEL_PATH = config_manager.model_path
+LABEL_PATH = config_manager.label_path
+SCALER_PATH = config_manager.scaler_path
+TENANCY_MODE = config_manager.tenancy_mode
+TENANT_FALLBACK = config_manager.tenant_fallback
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
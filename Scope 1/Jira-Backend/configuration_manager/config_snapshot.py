@@ -0,0 +1,95 @@
+import os
+from dataclasses import dataclass, fields
+from decouple import RepositoryEnv
+
+_TRUE_VALUES = ("true", "1", "yes", "on", "y", "t")
+_FALSE_VALUES = ("false", "0", "no", "off", "n", "f", "")
+
+
+def _to_bool(value) -> bool:
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise ValueError(f"Invalid boolean value: {value!r}")
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """
+    Immutable, validated view of config.env.
+    Each field is read once from the environment, then the file, then the default below.
+    """
+    qdrant_url: str = "http://localhost:6333"
+    collection_name: str = "ticket_embeddings_django"
+    embedding_model: str = "sentence-transformers/paraphrase-MiniLM-L3-v2"
+    model_path: str = ""
+    label_path: str = ""
+    scaler_path: str = ""
+    embedding_chunking: bool = False
+    embedding_chunk_size: int = 96
+    embedding_chunk_overlap: int = 24
+    embedding_max_chunks: int = 8
+    embedding_chunk_pooling: str = "mean"
+    retrieval_mode: str = "dense"
+    retrieval_candidates: int = 20
+    rrf_k: int = 60
+    lexical_refresh_interval: float = 30.0
+    prediction_mode: str = "knn"
+    tenancy_mode: str = "none"
+    tenant_fallback: bool = False
+    config_watch_interval: float = 2.0
+
+    # Fields that are baked into loaded resources and only take effect after a restart
+    RESTART_REQUIRED = ("qdrant_url", "collection_name", "embedding_model", "embedding_chunking", "tenancy_mode")
+
+    @classmethod
+    def load(cls, file_path: str, base_dir: str) -> "ConfigSnapshot":
+        """Parses and validates the config file, raising ValueError on bad values."""
+        repository = RepositoryEnv(file_path).data if os.path.isfile(file_path) else {}
+        defaults = {
+            "model_path": os.path.join(base_dir, "model.pkl"),
+            "label_path": os.path.join(base_dir, "label_encoders.pkl"),
+            "scaler_path": os.path.join(base_dir, "scaler.pkl"),
+        }
+
+        values = {}
+        for field in fields(cls):
+            key = field.name.upper()
+            if key in os.environ:
+                raw = os.environ[key]
+            elif key in repository:
+                raw = repository[key]
+            else:
+                values[field.name] = defaults.get(field.name, field.default)
+                continue
+            try:
+                values[field.name] = _to_bool(raw) if field.type is bool else field.type(raw)
+            except ValueError as e:
+                raise ValueError(f"{key}: {e}") from e
+
+        snapshot = cls(**values)
+        snapshot.validate()
+        return snapshot
+
+    def validate(self):
+        if self.embedding_chunk_pooling not in ("mean", "max"):
+            raise ValueError(f"EMBEDDING_CHUNK_POOLING must be 'mean' or 'max', got {self.embedding_chunk_pooling!r}")
+        if self.retrieval_mode not in ("dense", "hybrid"):
+            raise ValueError(f"RETRIEVAL_MODE must be 'dense' or 'hybrid', got {self.retrieval_mode!r}")
+        if self.prediction_mode not in ("knn", "head"):
+            raise ValueError(f"PREDICTION_MODE must be 'knn' or 'head', got {self.prediction_mode!r}")
+        if self.tenancy_mode not in ("none", "collection", "payload"):
+            raise ValueError(f"TENANCY_MODE must be 'none', 'collection' or 'payload', got {self.tenancy_mode!r}")
+        for name in ("embedding_chunk_size", "embedding_max_chunks", "retrieval_candidates", "rrf_k"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name.upper()} must be positive")
+        if self.lexical_refresh_interval < 0:
+            raise ValueError("LEXICAL_REFRESH_INTERVAL must not be negative")
+        if not 0 <= self.embedding_chunk_overlap < self.embedding_chunk_size:
+            raise ValueError("EMBEDDING_CHUNK_OVERLAP must be between 0 and EMBEDDING_CHUNK_SIZE")
+
+    def changed_fields(self, other: "ConfigSnapshot"):
+        """Returns the names of the fields whose values differ between two snapshots."""
+        return [field.name for field in fields(self) if getattr(self, field.name) != getattr(other, field.name)]
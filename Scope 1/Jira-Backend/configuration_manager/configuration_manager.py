@@ -1,6 +1,9 @@
 import os
+import signal
+import threading
+import time
 from pathlib import Path
-from decouple import Config, RepositoryEnv
+from .config_snapshot import ConfigSnapshot
 from .configuration_manager_base import ConfigurationManagerBase
 
 
@@ -9,44 +12,171 @@ class ConfigurationManager(ConfigurationManagerBase):
     _FILE_NAME = 'config.env'
     _FILE_PATH = os.path.join(_BASE_DIR, _FILE_NAME)
 
-    # Load configuration from the .env file or fallback to default
-    try:
-        config = Config(RepositoryEnv(_FILE_PATH))
-    except Exception:
-        config = None
+    def __init__(self):
+        self.file_path = self._FILE_PATH
+        self._subscribers = []
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._mtime = self._file_mtime()
+        # Parse config.env once; every property below reads from this immutable snapshot
+        self._snapshot = ConfigSnapshot.load(self.file_path, self._BASE_DIR)
+
+    @property
+    def snapshot(self) -> ConfigSnapshot:
+        """Returns the current configuration snapshot. Read it once per request for a consistent view."""
+        return self._snapshot
+
+    def subscribe(self, callback):
+        """Registers callback(old_snapshot, new_snapshot), called after every configuration change."""
+        self._subscribers.append(callback)
+
+    def reload(self) -> bool:
+        """
+        Re-parses config.env and atomically swaps in the new snapshot.
+        Invalid files are rejected and the current snapshot is kept. Returns True if anything changed.
+        """
+        with self._reload_lock:
+            self._mtime = self._file_mtime()
+            try:
+                new_snapshot = ConfigSnapshot.load(self.file_path, self._BASE_DIR)
+            except ValueError as e:
+                print(f"Ignoring invalid configuration in {self.file_path}: {e}")
+                return False
+
+            old_snapshot = self._snapshot
+            changed = new_snapshot.changed_fields(old_snapshot)
+            if not changed:
+                return False
+            self._snapshot = new_snapshot
+
+        print(f"Configuration reloaded, changed: {', '.join(changed)}")
+        for callback in list(self._subscribers):
+            try:
+                callback(old_snapshot, new_snapshot)
+            except Exception as e:
+                print(f"Configuration subscriber {callback!r} failed: {e}")
+        return True
+
+    def watch(self, interval: float = None):
+        """
+        Starts a daemon thread that reloads the configuration when config.env changes,
+        and reloads on SIGHUP when called from the main thread.
+        """
+        if self._watcher is not None:
+            return
+        interval = interval or self._snapshot.config_watch_interval
+
+        def poll():
+            while True:
+                time.sleep(interval)
+                if self._file_mtime() != self._mtime:
+                    self.reload()
+
+        self._watcher = threading.Thread(target=poll, name="config-watcher", daemon=True)
+        self._watcher.start()
+
+        if hasattr(signal, "SIGHUP") and threading.current_thread() is threading.main_thread():
+            # Reload off the signal handler so it can never block on a lock held by the interrupted code
+            signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(target=self.reload, daemon=True).start())
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.file_path).st_mtime_ns
+        except OSError:
+            return None
 
     @property
     def model_path(self) -> str:
         """
         Returns the path to the pickled ML model.
         """
-        return self.config('MODEL_PATH', default=os.path.join(self._BASE_DIR, 'model.pkl'))
+        return self._snapshot.model_path
 
     @property
     def label_path(self) -> str:
         """
         Returns the path to the label encoder.
         """
-        return self.config('LABEL_PATH', default=os.path.join(self._BASE_DIR, 'label_encoders.pkl'))
+        return self._snapshot.label_path
 
     @property
     def scaler_path(self) -> str:
         """
         Returns the path to the scaler.
         """
-        return self.config('SCALER_PATH', default=os.path.join(self._BASE_DIR, 'scaler.pkl'))
-    
+        return self._snapshot.scaler_path
+
     @property
     def qdrant_url(self) -> str:
         """Returns the Qdrant database URL."""
-        return self.config.get("QDRANT_URL", "http://localhost:6333") if self.config else os.getenv("QDRANT_URL", "http://localhost:6333")
+        return self._snapshot.qdrant_url
 
     @property
     def collection_name(self) -> str:
         """Returns the Qdrant collection name."""
-        return self.config.get("COLLECTION_NAME", "ticket_embeddings_django") if self.config else os.getenv("COLLECTION_NAME", "ticket_embeddings_django")
+        return self._snapshot.collection_name
 
     @property
     def embedding_model(self) -> str:
         """Returns the embedding model path."""
-        return self.config.get("EMBEDDING_MODEL", "sentence-transformers/paraphrase-MiniLM-L3-v2") if self.config else os.getenv("EMBEDDING_MODEL", "sentence-transformers/paraphrase-MiniLM-L3-v2")
+        return self._snapshot.embedding_model
+
+    @property
+    def embedding_chunking(self) -> bool:
+        """Returns whether long ticket texts are embedded as pooled overlapping windows."""
+        return self._snapshot.embedding_chunking
+
+    @property
+    def embedding_chunk_size(self) -> int:
+        """Returns the number of model tokens per embedding window (capped at the model's max_seq_length)."""
+        return self._snapshot.embedding_chunk_size
+
+    @property
+    def embedding_chunk_overlap(self) -> int:
+        """Returns the number of tokens shared by consecutive embedding windows."""
+        return self._snapshot.embedding_chunk_overlap
+
+    @property
+    def embedding_max_chunks(self) -> int:
+        """Returns the maximum number of windows embedded per ticket."""
+        return self._snapshot.embedding_max_chunks
+
+    @property
+    def embedding_chunk_pooling(self) -> str:
+        """Returns how window vectors are pooled into one vector ("mean" or "max")."""
+        return self._snapshot.embedding_chunk_pooling
+
+    @property
+    def retrieval_mode(self) -> str:
+        """Returns how similar tickets are retrieved ("dense" or "hybrid" lexical + dense)."""
+        return self._snapshot.retrieval_mode
+
+    @property
+    def retrieval_candidates(self) -> int:
+        """Returns how many candidates each retriever contributes before fusion."""
+        return self._snapshot.retrieval_candidates
+
+    @property
+    def rrf_k(self) -> int:
+        """Returns the rank constant used by reciprocal-rank fusion."""
+        return self._snapshot.rrf_k
+
+    @property
+    def lexical_refresh_interval(self) -> float:
+        """Returns the seconds between checks of Qdrant for tickets missing from this process's BM25 index."""
+        return self._snapshot.lexical_refresh_interval
+
+    @property
+    def prediction_mode(self) -> str:
+        """Returns how labels are predicted ("knn" over similar tickets or a trained "head")."""
+        return self._snapshot.prediction_mode
+
+    @property
+    def tenancy_mode(self) -> str:
+        """Returns how tickets are partitioned per Jira project ("none", "collection" or "payload")."""
+        return self._snapshot.tenancy_mode
+
+    @property
+    def tenant_fallback(self) -> bool:
+        """Returns whether searches fill up with other projects' tickets when a project has too few."""
+        return self._snapshot.tenant_fallback
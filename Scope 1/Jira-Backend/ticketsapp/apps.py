@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class TicketsappConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "ticketsapp"
+
+    def ready(self):
+        from configuration_manager.configuration_manager import ConfigurationManager
+
+        # Pick up config.env edits (or SIGHUP) without restarting the process
+        ConfigurationManager().watch()
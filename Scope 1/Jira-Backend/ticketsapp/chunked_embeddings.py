@@ -0,0 +1,104 @@
+from typing import List
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+
+# Special tokens ([CLS] and [SEP]) the model adds to every window on top of its text tokens
+SPECIAL_TOKENS = 2
+
+
+def window_starts(length: int, window_size: int, overlap: int, max_windows: int) -> List[int]:
+    """
+    Returns the start of every overlapping window over a sequence of length items.
+    If there are more than max_windows windows, evenly spaced ones are kept so the tail is still covered.
+    """
+    stride = max(1, window_size - overlap)
+    starts = list(range(0, length - overlap, stride))
+    if starts[-1] + window_size < length:
+        starts.append(length - window_size)
+
+    if max_windows and len(starts) > max_windows:
+        picks = np.linspace(0, len(starts) - 1, num=max_windows).round().astype(int)
+        starts = [starts[i] for i in picks]
+    return starts
+
+
+def split_into_windows(text: str, window_size: int, overlap: int, max_windows: int, tokenizer=None) -> List[str]:
+    """
+    Splits text into overlapping windows of window_size whitespace words, or of window_size tokens of
+    tokenizer (a fast Hugging Face tokenizer) when given. Token windows are cut from the original text at
+    the tokens' character offsets, so each one encodes back to at most window_size tokens.
+    """
+    if tokenizer is None:
+        words = text.split()
+        if len(words) <= window_size:
+            return [text]
+        starts = window_starts(len(words), window_size, overlap, max_windows)
+        return [" ".join(words[start:start + window_size]) for start in starts]
+
+    spans = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    if len(spans) <= window_size:
+        return [text]
+    starts = window_starts(len(spans), window_size, overlap, max_windows)
+    return [text[spans[start][0]:spans[min(start + window_size, len(spans)) - 1][1]] for start in starts]
+
+
+def pool_vectors(vectors: np.ndarray, offsets: List[int], pooling: str) -> np.ndarray:
+    """
+    Pools consecutive rows of vectors into one row per text.
+    offsets holds the index of the first window of each text.
+    """
+    if pooling == "max":
+        return np.maximum.reduceat(vectors, offsets, axis=0)
+    if pooling == "mean":
+        counts = np.diff(np.append(offsets, len(vectors)))
+        return np.add.reduceat(vectors, offsets, axis=0) / counts[:, None]
+    raise ValueError(f"Unknown pooling mode: {pooling}")
+
+
+class ChunkedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model so long texts are encoded as overlapping windows
+    and pooled into a single vector instead of being truncated.
+
+    With the model's tokenizer, windows are counted in its subword tokens and capped at max_seq_length
+    minus the special tokens, so no window is truncated. Without it they are counted in words, and Arabic
+    or mixed text can still exceed the model's limit (MiniLM keeps 128 tokens, often fewer than 96 words).
+    """
+
+    def __init__(self, base: Embeddings, window_size: int = 96, overlap: int = 24,
+                 max_windows: int = 8, pooling: str = "mean", tokenizer=None, max_seq_length: int = None):
+        if overlap >= window_size:
+            raise ValueError("Chunk overlap must be smaller than the chunk size.")
+        self.base = base
+        self.window_size = window_size
+        self.overlap = overlap
+        self.max_windows = max_windows
+        self.pooling = pooling
+        self.tokenizer = tokenizer
+        self.max_seq_length = max_seq_length
+
+    def window_bounds(self):
+        """Returns (window_size, overlap) after capping the window at the model's sequence length."""
+        window_size = self.window_size
+        if self.tokenizer is not None and self.max_seq_length:
+            window_size = min(window_size, self.max_seq_length - SPECIAL_TOKENS)
+        return window_size, min(self.overlap, window_size - 1)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        window_size, overlap = self.window_bounds()
+        windows = []
+        offsets = []
+        for text in texts:
+            offsets.append(len(windows))
+            windows.extend(split_into_windows(text, window_size, overlap, self.max_windows, self.tokenizer))
+
+        if not windows:
+            return []
+
+        # All windows of all texts go through the model in a single batched pass
+        vectors = np.asarray(self.base.embed_documents(windows), dtype=np.float32)
+        return pool_vectors(vectors, offsets, self.pooling).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
@@ -0,0 +1,129 @@
+import os
+import pickle
+import threading
+import time
+from typing import List, Tuple
+import numpy as np
+
+
+class ClassifierHeadUnavailable(RuntimeError):
+    """No classifier head could be loaded: not trained yet, or its pickle is missing, partial or corrupt."""
+
+
+def _write_pickle(obj, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # Write to a temp file first so a running server never reloads a half-written pickle
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(obj, f)
+    os.replace(temp_path, path)
+
+
+def train_classifier_head(vectors, labels, model_path, label_path, scaler_path, C=1.0, max_iter=1000):
+    """
+    Fits a logistic-regression head on ticket embeddings. model_path gets the whole head (model, label
+    encoder and scaler) in one pickle, replaced atomically, which is what ClassifierHead serves;
+    label_path and scaler_path get the label encoder and scaler on their own.
+    """
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    label_encoder = LabelEncoder()
+    targets = label_encoder.fit_transform(labels)
+    if len(label_encoder.classes_) < 2:
+        raise ValueError("At least two distinct labels are needed to train the classifier head.")
+
+    scaler = StandardScaler()
+    model = LogisticRegression(C=C, max_iter=max_iter)
+    model.fit(scaler.fit_transform(vectors), targets)
+
+    _write_pickle(label_encoder, label_path)
+    _write_pickle(scaler, scaler_path)
+    # Last and in one file, so a server reloading at any moment sees either the old head or the new one
+    _write_pickle({"model": model, "label_encoder": label_encoder, "scaler": scaler}, model_path)
+
+    return model.score(scaler.transform(vectors), targets)
+
+
+class ClassifierHead:
+    """
+    Predicts ticket labels from an embedding with a single matrix multiply.
+    The scaler is folded into the weights on load, and the head is reloaded when model_path changes on disk.
+    If a reload fails, the head keeps serving the last one it loaded.
+    """
+
+    def __init__(self, model_path, label_path, scaler_path, reload_interval=5.0):
+        self.paths = (model_path, label_path, scaler_path)
+        self.reload_interval = reload_interval
+        self._state = None
+        self._mtime = None
+        self._last_check = 0.0
+        self._lock = threading.Lock()
+
+    def set_paths(self, model_path, label_path, scaler_path):
+        """Points the head at new files; they are loaded on the next prediction."""
+        with self._lock:
+            self.paths = (model_path, label_path, scaler_path)
+            self._mtime = None
+            self._last_check = 0.0
+
+    def _load(self, mtime):
+        model_path, label_path, scaler_path = self.paths
+        with open(model_path, "rb") as f:
+            model = pickle.load(f)
+        if isinstance(model, dict):
+            label_encoder, scaler, model = model["label_encoder"], model["scaler"], model["model"]
+        else:
+            # A head trained before the model, label encoder and scaler were bundled
+            with open(label_path, "rb") as f:
+                label_encoder = pickle.load(f)
+            with open(scaler_path, "rb") as f:
+                scaler = pickle.load(f)
+
+        coef = np.asarray(model.coef_, dtype=np.float64)
+        intercept = np.asarray(model.intercept_, dtype=np.float64)
+        if coef.shape[0] == 1:
+            # Binary logistic regression only stores the positive class
+            coef = np.vstack([np.zeros_like(coef), coef])
+            intercept = np.concatenate([[0.0], intercept])
+
+        # (x - mean) / scale @ coef.T + b  ==  x @ (coef / scale).T + (b - coef @ (mean / scale))
+        weights = coef / scaler.scale_
+        bias = intercept - weights @ scaler.mean_
+
+        labels = label_encoder.inverse_transform(np.arange(len(bias)))
+
+        # Swap everything in one assignment so concurrent predictions never mix two versions
+        self._state = (weights.T.astype(np.float32), bias.astype(np.float32), labels)
+        self._mtime = mtime
+        print(f"Loaded classifier head with {len(labels)} labels from {model_path}")
+
+    def maybe_reload(self):
+        """
+        Reloads the head if model_path changed since the last load. While nothing is loaded yet, any error
+        raises ClassifierHeadUnavailable; afterwards errors are reported and the loaded head stays in use.
+        """
+        now = time.monotonic()
+        if self._state is not None and now - self._last_check < self.reload_interval:
+            return
+        with self._lock:
+            self._last_check = now
+            try:
+                mtime = os.stat(self.paths[0]).st_mtime_ns
+                if mtime != self._mtime:
+                    self._load(mtime)
+            except Exception as e:
+                if self._state is None:
+                    raise ClassifierHeadUnavailable(f"Could not load the classifier head from {self.paths[0]}: {e}") from e
+                print(f"Keeping the loaded classifier head, reloading {self.paths[0]} failed: {e}")
+
+    def predict(self, vector, top_k=5) -> List[Tuple[str, float]]:
+        """Returns the top_k (label, probability) pairs for one embedding."""
+        self.maybe_reload()
+        weights, bias, labels = self._state
+        logits = np.asarray(vector, dtype=np.float32) @ weights + bias
+        exp_logits = np.exp(logits - np.max(logits))
+        probabilities = exp_logits / exp_logits.sum()
+        order = np.argsort(probabilities)[::-1][:top_k]
+        return [(str(labels[i]), float(probabilities[i])) for i in order]
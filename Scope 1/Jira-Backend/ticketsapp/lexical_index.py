@@ -0,0 +1,143 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+# Light Arabic normalisation: drop tashkeel (harakat, tanween, shadda, sukun, dagger alef) and tatweel,
+# and fold the alef, yaa and taa marbuta variants, so spelling variants of a word share one term
+ARABIC_FOLDING = str.maketrans(
+    {**{chr(code): None for code in (*range(0x064B, 0x0653), 0x0670, 0x0640)},
+     "\u0623": "\u0627", "\u0625": "\u0627", "\u0622": "\u0627", "\u0671": "\u0627",
+     "\u0649": "\u064A", "\u0629": "\u0647"}
+)
+
+
+def normalize(text: str) -> str:
+    """Lowercases text and applies the Arabic normalisation of ARABIC_FOLDING."""
+    return text.lower().translate(ARABIC_FOLDING)
+
+
+def tokenize(text: str) -> List[str]:
+    """Normalises text and splits it into Unicode word terms (Arabic and English alike)."""
+    return TOKEN_PATTERN.findall(normalize(text))
+
+
+class BM25Index:
+    """
+    In-process BM25 inverted index that is built incrementally as tickets are collected.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._doc_terms: Dict[str, Counter] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        self._metadata: Dict[str, dict] = {}
+        self._total_length = 0
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._doc_terms)
+
+    def add(self, doc_id: str, text: str, metadata: dict = None):
+        """Indexes a document, replacing any previous version with the same id."""
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, freq in terms.items():
+                self._postings[term][doc_id] = freq
+            self._doc_terms[doc_id] = terms
+            self._doc_lengths[doc_id] = sum(terms.values())
+            self._metadata[doc_id] = metadata or {}
+            self._total_length += self._doc_lengths[doc_id]
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._metadata.pop(doc_id, None)
+        self._total_length -= self._doc_lengths.pop(doc_id)
+
+    def metadata(self, doc_id: str) -> dict:
+        return self._metadata.get(doc_id, {})
+
+    def search(self, query: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Returns the top k (doc_id, score) pairs for the query."""
+        query_terms = set(tokenize(query))
+        with self._lock:
+            num_docs = len(self._doc_terms)
+            if not num_docs or not query_terms:
+                return []
+            avg_length = self._total_length / num_docs
+            scores = defaultdict(float)
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (num_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, freq in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """
+    Fuses several ranked lists of ids into one, scoring each id by sum(1 / (k + rank)).
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def iter_payloads(client, collection_name: str, batch_size: int = 256, scroll_filter=None):
+    """Yields (point_id, payload) for every point of a Qdrant collection, optionally filtered."""
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=collection_name,
+            scroll_filter=scroll_filter,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=False,
+        )
+        for point in points:
+            yield point.id, point.payload or {}
+        if offset is None:
+            break
+
+
+def load_lexical_index(client, collection_name: str, index_for, batch_size: int = 256, scroll_filter=None) -> int:
+    """
+    Rebuilds lexical indexes from the payloads already stored in a Qdrant collection and returns the number
+    of points loaded. index_for is either a BM25Index or a callable mapping a ticket's metadata to the index
+    it belongs in.
+    """
+    if isinstance(index_for, BM25Index):
+        index = index_for
+        index_for = lambda metadata: index
+    count = 0
+    for point_id, payload in iter_payloads(client, collection_name, batch_size, scroll_filter):
+        metadata = payload.get("metadata") or {}
+        doc_id = str(metadata.get("ticket_id", point_id))
+        index_for(metadata).add(doc_id, payload.get("page_content", ""), metadata)
+        count += 1
+    print(f"Loaded {count} tickets into the lexical index from '{collection_name}'.")
+    return count
@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ticketsapp.qdrant_utils import tenant_router
+
+
+class Command(BaseCommand):
+    help = "Lists, sizes and drops per-project ticket partitions (TENANCY_MODE must be 'collection' or 'payload')."
+
+    def add_arguments(self, parser):
+        subparsers = parser.add_subparsers(dest="action", required=True)
+        subparsers.add_parser("list", help="List every project with its ticket count.")
+        size_parser = subparsers.add_parser("size", help="Show the ticket count of one project.")
+        size_parser.add_argument("project_key")
+        drop_parser = subparsers.add_parser("drop", help="Delete every ticket of one project.")
+        drop_parser.add_argument("project_key")
+        drop_parser.add_argument("--yes", action="store_true", help="Do not ask for confirmation.")
+
+    def handle(self, *args, **options):
+        if settings.TENANCY_MODE == "none":
+            raise CommandError("Tenancy is disabled; set TENANCY_MODE to 'collection' or 'payload' in config.env.")
+
+        action = options["action"]
+        if action == "list":
+            tenants = tenant_router.list_tenants()
+            if not tenants:
+                self.stdout.write("No tenants found.")
+            for tenant, count in sorted(tenants):
+                self.stdout.write(f"{tenant}\t{count}")
+
+        elif action == "size":
+            self.stdout.write(str(tenant_router.tenant_size(options["project_key"])))
+
+        elif action == "drop":
+            project_key = options["project_key"]
+            if not options["yes"]:
+                answer = input(f"Delete all tickets of project '{project_key}'? [y/N] ")
+                if answer.strip().lower() != "y":
+                    self.stdout.write("Aborted.")
+                    return
+            tenant_router.drop_tenant(project_key)
+            self.stdout.write(self.style.SUCCESS(f"Dropped tenant '{project_key}'."))
@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from qdrant_client import QdrantClient
+from ticketsapp.classifier_head import train_classifier_head
+from ticketsapp.qdrant_utils import embedding_function
+from ticketsapp.ticket_text import ticket_text
+
+
+class Command(BaseCommand):
+    help = "Trains a logistic-regression label head on the tickets stored in Qdrant."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--collection", default=settings.COLLECTION_NAME, help="Qdrant collection to read tickets from.")
+        parser.add_argument("--C", type=float, default=1.0, help="Inverse regularisation strength.")
+        parser.add_argument("--max-iter", type=int, default=1000, help="Maximum solver iterations.")
+        parser.add_argument("--batch-size", type=int, default=512, help="Points fetched from Qdrant and embedded per batch.")
+
+    def handle(self, *args, **options):
+        client = QdrantClient(settings.QDRANT_URL)
+        vectors, labels = [], []
+        offset = None
+        while True:
+            points, offset = client.scroll(
+                collection_name=options["collection"],
+                limit=options["batch_size"],
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            texts = []
+            for point in points:
+                metadata = (point.payload or {}).get("metadata") or {}
+                if metadata.get("label"):
+                    # The stored vectors embed the label too; re-embed what a prediction sees instead
+                    texts.append(ticket_text(metadata, include_label=False))
+                    labels.append(metadata["label"])
+            if texts:
+                vectors.extend(embedding_function.embed_documents(texts))
+            if offset is None:
+                break
+
+        if not vectors:
+            raise CommandError(f"No labelled tickets found in collection '{options['collection']}'.")
+
+        self.stdout.write(f"Training on {len(vectors)} labelled tickets...")
+        try:
+            accuracy = train_classifier_head(
+                vectors, labels,
+                settings.MODEL_PATH, settings.LABEL_PATH, settings.SCALER_PATH,
+                C=options["C"], max_iter=options["max_iter"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Saved classifier head to {settings.MODEL_PATH} (training accuracy: {accuracy:.4f})"
+        ))
@@ -3,6 +3,10 @@ from qdrant_client.http.models import VectorParams
 from langchain.embeddings import SentenceTransformerEmbeddings
 from langchain.vectorstores import Qdrant
 from django.conf import settings
+from configuration_manager.configuration_manager import ConfigurationManager
+from .chunked_embeddings import ChunkedEmbeddings
+from .tenancy import TenantRouter
+from .classifier_head import ClassifierHead
 
 # Connect to Qdrant
 client = QdrantClient(settings.QDRANT_URL)
@@ -35,9 +39,69 @@ ensure_collection_exists(client, COLLECTION_NAME)
 # Load embedding model
 embedding_function = SentenceTransformerEmbeddings(model_name=settings.EMBEDDING_MODEL)
 
+# Optionally embed long tickets as pooled overlapping windows instead of truncating them.
+# Windows are counted in the model's own tokens, so none exceeds its max_seq_length.
+if settings.EMBEDDING_CHUNKING:
+    embedding_function = ChunkedEmbeddings(
+        embedding_function,
+        window_size=settings.EMBEDDING_CHUNK_SIZE,
+        overlap=settings.EMBEDDING_CHUNK_OVERLAP,
+        max_windows=settings.EMBEDDING_MAX_CHUNKS,
+        pooling=settings.EMBEDDING_CHUNK_POOLING,
+        tokenizer=embedding_function.client.tokenizer,
+        max_seq_length=embedding_function.client.max_seq_length,
+    )
+
 # Initialize Qdrant vector store
 vectorstore = Qdrant(
     client=client,
     collection_name=COLLECTION_NAME,
     embeddings=embedding_function
 )
+
+# Routes tickets and searches to per-project partitions (a no-op when TENANCY_MODE is "none")
+tenant_router = TenantRouter(
+    client,
+    COLLECTION_NAME,
+    embedding_function,
+    base_store=vectorstore,
+    mode=settings.TENANCY_MODE,
+    fallback=settings.TENANT_FALLBACK,
+    lexical_refresh_interval=settings.LEXICAL_REFRESH_INTERVAL,
+)
+
+# In-process BM25 indexes (one per tenant) over the same tickets, rebuilt from Qdrant on startup
+if settings.RETRIEVAL_MODE == "hybrid":
+    tenant_router.load_lexical_indexes()
+
+# Trained label head, loaded on first use and reloaded when the pickles change on disk
+classifier_head = ClassifierHead(settings.MODEL_PATH, settings.LABEL_PATH, settings.SCALER_PATH)
+
+
+def on_config_change(old, new):
+    """
+    Re-tunes the loaded resources after a configuration reload without reloading the embedding model.
+    """
+    changed = new.changed_fields(old)
+
+    restart_required = [name for name in changed if name in new.RESTART_REQUIRED]
+    if restart_required:
+        print(f"Configuration change to {', '.join(restart_required)} takes effect after a restart.")
+
+    tenant_router.fallback = new.tenant_fallback
+    tenant_router.lexical_refresh_interval = new.lexical_refresh_interval
+
+    if isinstance(embedding_function, ChunkedEmbeddings):
+        embedding_function.window_size = new.embedding_chunk_size
+        embedding_function.overlap = new.embedding_chunk_overlap
+        embedding_function.max_windows = new.embedding_max_chunks
+        embedding_function.pooling = new.embedding_chunk_pooling
+
+    if new.retrieval_mode == "hybrid" and old.retrieval_mode != "hybrid":
+        tenant_router.load_lexical_indexes()
+
+    if {"model_path", "label_path", "scaler_path"} & set(changed):
+        classifier_head.set_paths(new.model_path, new.label_path, new.scaler_path)
+
+
+ConfigurationManager().subscribe(on_config_change)
@@ -10,6 +10,7 @@ class TicketSerializer(serializers.Serializer):
     reporter = serializers.EmailField()
     label = serializers.CharField(required=False, allow_blank=True)
     created_at = serializers.CharField()
+    project_key = serializers.CharField(required=False, allow_blank=True)
 
 class PredictionSerializer(serializers.Serializer):
     label = serializers.CharField()
@@ -0,0 +1,246 @@
+import re
+import threading
+import time
+from collections import Counter
+from qdrant_client.http.models import (
+    FieldCondition, Filter, FilterSelector, IsEmptyCondition, KeywordIndexParams, MatchValue, PayloadField,
+    VectorParams,
+)
+from langchain.vectorstores import Qdrant
+from .lexical_index import BM25Index, load_lexical_index
+
+TENANT_FIELD = "metadata.project_key"
+
+
+def tenant_slug(project_key: str) -> str:
+    """
+    Normalises a Jira project key into a safe collection-name suffix. Keys are case-insensitive; every
+    character other than a-z and 0-9 (underscore included) becomes "_<hex code point>_", so two different
+    keys never share a suffix ("A-B" -> "a_2d_b", "A_B" -> "a_5f_b").
+    """
+    return re.sub(r"[^a-z0-9]", lambda match: f"_{ord(match.group()):x}_", project_key.strip().lower())
+
+
+class TenantRouter:
+    """
+    Routes tickets and searches to a Jira project's partition.
+
+    Modes:
+        none       - every ticket shares the base collection (previous behaviour).
+        collection - one Qdrant collection per project, named "<base>__<project>".
+        payload    - one shared collection with a tenant-indexed project_key payload filter.
+    Tickets without a project key always live in the base collection.
+    With fallback, a project with too few matches is topped up by one more search of the base collection:
+    every project's tickets in payload mode, the shared tickets without a project in collection mode.
+
+    The BM25 indexes live in this process. Tickets other processes (e.g. other gunicorn workers) store are
+    picked up by refresh_lexical_index, which compares the partition's Qdrant point count with the count
+    the index was built from at most every lexical_refresh_interval seconds and reloads it when they differ.
+    """
+
+    def __init__(self, client, base_collection, embeddings, base_store=None, mode="none", fallback=False, vector_size=384,
+                 lexical_refresh_interval=30.0):
+        if mode not in ("none", "collection", "payload"):
+            raise ValueError(f"Unknown tenancy mode: {mode}")
+        self.client = client
+        self.base_collection = base_collection
+        self.embeddings = embeddings
+        self.mode = mode
+        self.fallback = fallback
+        self.vector_size = vector_size
+        self.lexical_refresh_interval = lexical_refresh_interval
+        self._stores = {base_collection: base_store} if base_store is not None else {}
+        self._lexical_indexes = {}
+        # tenant -> (Qdrant points the lexical index reflects, monotonic time of the last check)
+        self._lexical_synced = {}
+        self._lock = threading.Lock()
+
+        if mode == "payload":
+            # is_tenant lets Qdrant co-locate each project's points so filtered searches only touch that project
+            self.client.create_payload_index(
+                collection_name=base_collection,
+                field_name=TENANT_FIELD,
+                field_schema=KeywordIndexParams(type="keyword", is_tenant=True),
+            )
+
+    def _tenant_key(self, project_key):
+        if self.mode == "none" or not project_key:
+            return None
+        return tenant_slug(project_key)
+
+    def _tenant_filter(self, tenant):
+        return Filter(must=[FieldCondition(key=TENANT_FIELD, match=MatchValue(value=tenant))])
+
+    def collection_for(self, project_key) -> str:
+        tenant = self._tenant_key(project_key)
+        if self.mode == "collection" and tenant:
+            return f"{self.base_collection}__{tenant}"
+        return self.base_collection
+
+    def _store(self, collection_name, create=False):
+        with self._lock:
+            store = self._stores.get(collection_name)
+            if store is not None:
+                return store
+            if not self.client.collection_exists(collection_name):
+                if not create:
+                    return None
+                self.client.create_collection(
+                    collection_name=collection_name,
+                    vectors_config=VectorParams(size=self.vector_size, distance="Cosine"),
+                )
+            store = Qdrant(client=self.client, collection_name=collection_name, embeddings=self.embeddings)
+            self._stores[collection_name] = store
+            return store
+
+    def lexical_index_for(self, project_key) -> BM25Index:
+        tenant = self._tenant_key(project_key)
+        with self._lock:
+            if tenant not in self._lexical_indexes:
+                self._lexical_indexes[tenant] = BM25Index()
+            return self._lexical_indexes[tenant]
+
+    def load_lexical_indexes(self):
+        """Rebuilds every tenant's lexical index from the tickets stored in Qdrant."""
+        counts = Counter()
+
+        def route(metadata):
+            tenant = self._tenant_key(metadata.get("project_key"))
+            counts[tenant] += 1
+            return self.lexical_index_for(tenant)
+
+        for collection_name in [self.base_collection] + [name for name, _ in self._tenant_collections()]:
+            load_lexical_index(self.client, collection_name, route)
+        now = time.monotonic()
+        with self._lock:
+            for tenant in self._lexical_indexes:
+                self._lexical_synced[tenant] = (counts[tenant], now)
+
+    def _lexical_partition(self, tenant):
+        """Returns the (collection, filter) holding exactly the tickets of a tenant's lexical index."""
+        if self.mode == "collection" and tenant:
+            return f"{self.base_collection}__{tenant}", None
+        if self.mode == "payload":
+            if tenant:
+                return self.base_collection, self._tenant_filter(tenant)
+            return self.base_collection, Filter(must=[IsEmptyCondition(is_empty=PayloadField(key=TENANT_FIELD))])
+        return self.base_collection, None
+
+    def refresh_lexical_index(self, project_key):
+        """
+        Reloads the project's lexical index from Qdrant if its partition holds a different number of tickets
+        than the index was built from, i.e. another process stored or deleted tickets since.
+        Costs one count request per lexical_refresh_interval, and a reload of the project's tickets on change.
+        """
+        tenant = self._tenant_key(project_key)
+        now = time.monotonic()
+        with self._lock:
+            synced = self._lexical_synced.get(tenant)
+            if synced and now - synced[1] < self.lexical_refresh_interval:
+                return
+
+        collection_name, partition_filter = self._lexical_partition(tenant)
+        exists = self.client.collection_exists(collection_name)
+        count = self.client.count(collection_name=collection_name, count_filter=partition_filter, exact=True).count if exists else 0
+        with self._lock:
+            synced = self._lexical_synced.get(tenant)
+            if synced and synced[0] == count:
+                self._lexical_synced[tenant] = (count, now)
+                return
+
+        index = BM25Index()
+        loaded = load_lexical_index(self.client, collection_name, index, scroll_filter=partition_filter) if exists else 0
+        with self._lock:
+            self._lexical_indexes[tenant] = index
+            self._lexical_synced[tenant] = (loaded, now)
+
+    def add(self, project_key, doc):
+        """Stores a document in the project's partition."""
+        tenant = self._tenant_key(project_key)
+        if tenant:
+            doc.metadata["project_key"] = tenant
+        self._store(self.collection_for(project_key), create=True).add_documents([doc])
+        with self._lock:
+            # Our own ticket: keep the lexical index's count in step so it does not look stale
+            if tenant in self._lexical_synced:
+                count, checked = self._lexical_synced[tenant]
+                self._lexical_synced[tenant] = (count + 1, checked)
+
+    def search(self, project_key, query, k):
+        """
+        Returns (document, score) pairs from the project's partition.
+        If the project has fewer than k matches and fallback is enabled, the rest come from one search
+        of the base collection (see the class docstring), never from a search per tenant.
+        """
+        embedding = self.embeddings.embed_query(query)
+        tenant = self._tenant_key(project_key)
+
+        if self.mode == "payload" and tenant:
+            store = self._store(self.base_collection)
+            results = store.similarity_search_with_score_by_vector(embedding, k=k, filter=self._tenant_filter(tenant))
+        else:
+            store = self._store(self.collection_for(project_key))
+            results = store.similarity_search_with_score_by_vector(embedding, k=k) if store else []
+
+        if tenant and self.fallback and len(results) < k:
+            seen = {str(doc.metadata.get("ticket_id")) for doc, _ in results}
+            extra = [
+                (doc, score) for doc, score in self._search_base(embedding, k)
+                if str(doc.metadata.get("ticket_id")) not in seen
+            ]
+            results = results + extra[:k - len(results)]
+        return results
+
+    def _search_base(self, embedding, k):
+        """Unfiltered search of the base collection: a single request, whatever the number of tenants."""
+        store = self._store(self.base_collection)
+        return store.similarity_search_with_score_by_vector(embedding, k=k) if store else []
+
+    def _tenant_collections(self):
+        prefix = f"{self.base_collection}__"
+        return [
+            (collection.name, collection.name[len(prefix):])
+            for collection in self.client.get_collections().collections
+            if collection.name.startswith(prefix)
+        ]
+
+    def list_tenants(self):
+        """Returns [(tenant, ticket_count)] for every known project."""
+        if self.mode == "collection":
+            return [(tenant, self.tenant_size(tenant)) for _, tenant in self._tenant_collections()]
+        if self.mode == "payload":
+            response = self.client.facet(collection_name=self.base_collection, key=TENANT_FIELD, limit=10000, exact=True)
+            return [(hit.value, hit.count) for hit in response.hits]
+        return []
+
+    def tenant_size(self, project_key) -> int:
+        tenant = self._tenant_key(project_key)
+        if self.mode == "collection":
+            collection_name = self.collection_for(project_key)
+            if not self.client.collection_exists(collection_name):
+                return 0
+            return self.client.count(collection_name=collection_name, exact=True).count
+        if self.mode == "payload":
+            return self.client.count(
+                collection_name=self.base_collection, count_filter=self._tenant_filter(tenant), exact=True
+            ).count
+        return 0
+
+    def drop_tenant(self, project_key):
+        """Deletes every ticket of a project from Qdrant and the lexical index."""
+        tenant = self._tenant_key(project_key)
+        if not tenant:
+            raise ValueError("A project key is required to drop a tenant.")
+        if self.mode == "collection":
+            collection_name = self.collection_for(project_key)
+            with self._lock:
+                self._stores.pop(collection_name, None)
+            self.client.delete_collection(collection_name)
+        else:
+            self.client.delete(
+                collection_name=self.base_collection,
+                points_selector=FilterSelector(filter=self._tenant_filter(tenant)),
+            )
+        with self._lock:
+            self._lexical_indexes.pop(tenant, None)
+            self._lexical_synced.pop(tenant, None)
@@ -1,8 +1,22 @@
-from django.test import TestCase
+from django.test import TestCase, SimpleTestCase
 from rest_framework.test import APIClient
 from django.conf import settings
 from ticketsapp.models import Ticket
+from ticketsapp.chunked_embeddings import ChunkedEmbeddings, split_into_windows
+from ticketsapp.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+from ticketsapp.classifier_head import ClassifierHead, ClassifierHeadUnavailable, train_classifier_head
+from ticketsapp.ticket_text import ticket_text
+from configuration_manager.config_snapshot import ConfigSnapshot
+from qdrant_client import QdrantClient
+from qdrant_client.http.models import VectorParams
+from langchain.docstore.document import Document
+from langchain.embeddings.base import Embeddings
+from ticketsapp.tenancy import TenantRouter, tenant_slug
+from configuration_manager.configuration_manager import ConfigurationManager
 import os
+import pickle
+import tempfile
+import numpy as np
 import django 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'JiraTicketClassifierApp.settings')
@@ -155,3 +169,274 @@ class PredictTicketLabelAPITest(TestCase):
         self.assertEqual(response.status_code, 405)
         self.assertIn("detail", response.data)
         self.assertEqual(response.data["detail"], "Method \"GET\" not allowed.")
+
+
+
+class ChunkedEmbeddingsTest(SimpleTestCase):
+    class WordCountEmbeddings:
+        def __init__(self):
+            self.calls = []
+
+        def embed_documents(self, texts):
+            self.calls.append(len(texts))
+            return [[float(len(text.split())), 1.0] for text in texts]
+
+    class CharTokenizer:
+        """Every non-space character is a token, like heavily split Arabic subwords."""
+
+        def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False):
+            return {"offset_mapping": [(i, i + 1) for i, char in enumerate(text) if not char.isspace()]}
+
+    def setUp(self):
+        self.long_text = " ".join(f"w{i}" for i in range(500))
+
+    def test_short_text_is_single_window(self):
+        self.assertEqual(split_into_windows("short ticket text", 96, 24, 8), ["short ticket text"])
+
+    def test_windows_overlap_and_cover_tail(self):
+        windows = split_into_windows(self.long_text, 96, 24, 8)
+        self.assertGreater(len(windows), 1)
+        self.assertEqual(windows[0].split()[-24:], windows[1].split()[:24])
+        self.assertEqual(windows[-1].split()[-1], "w499")
+
+    def test_window_cap_keeps_first_and_last(self):
+        windows = split_into_windows(self.long_text, 96, 24, 3)
+        self.assertEqual(len(windows), 3)
+        self.assertEqual(windows[0].split()[0], "w0")
+        self.assertEqual(windows[-1].split()[-1], "w499")
+
+    def test_all_windows_encoded_in_one_batch(self):
+        base = self.WordCountEmbeddings()
+        embeddings = ChunkedEmbeddings(base, window_size=96, overlap=24, max_windows=8, pooling="max")
+        vectors = embeddings.embed_documents(["a short one", self.long_text])
+        self.assertEqual(len(base.calls), 1)
+        self.assertEqual(len(vectors), 2)
+        self.assertEqual(vectors[0], [3.0, 1.0])
+        self.assertEqual(vectors[1], [96.0, 1.0])
+
+    def test_token_windows_fit_the_model(self):
+        tokenizer = self.CharTokenizer()
+        text = " ".join(["مرحبا"] * 60)
+        # 60 words, under a 96-word window, but 300 tokens
+        embeddings = ChunkedEmbeddings(self.WordCountEmbeddings(), window_size=96, overlap=24, max_windows=0,
+                                       tokenizer=tokenizer, max_seq_length=64)
+        self.assertEqual(embeddings.window_bounds(), (62, 24))
+        windows = split_into_windows(text, 62, 24, 0, tokenizer)
+        self.assertGreater(len(windows), 1)
+        for window in windows:
+            self.assertLessEqual(len(tokenizer(window)["offset_mapping"]), 62)
+        self.assertTrue(text.startswith(windows[0]))
+        self.assertTrue(text.endswith(windows[-1]))
+
+
+class LexicalIndexTest(SimpleTestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add("1", "I want a refund for my order", {"label": "Refund request"})
+        self.index.add("2", "Please cancel my subscription", {"label": "Cancellation request"})
+        self.index.add("3", "The app crashes when I log in", {"label": "Technical issue"})
+
+    def test_keyword_ranks_matching_ticket_first(self):
+        results = self.index.search("refund for the order", k=3)
+        self.assertEqual(results[0][0], "1")
+        self.assertEqual(self.index.metadata("1")["label"], "Refund request")
+
+    def test_re_adding_replaces_document(self):
+        self.index.add("1", "Billing address update", {"label": "Billing inquiry"})
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.search("refund", k=3), [])
+
+    def test_arabic_query_finds_arabic_ticket(self):
+        self.index.add("4", "أُرِيدُ إسترداد المبلغ المدفوع للطلبية", {"label": "Refund request"})
+        self.index.add("5", "التطبيق يتوقف عند تسجيل الدخول", {"label": "Technical issue"})
+        self.assertEqual(tokenize("أريد استرداد المبلغ refund"), ["اريد", "استرداد", "المبلغ", "refund"])
+        results = self.index.search("اريد استرداد المبلـــغ للطلبيه", k=3)
+        self.assertEqual(results[0][0], "4")
+
+    def test_reciprocal_rank_fusion_rewards_agreement(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60)
+        self.assertEqual(fused[0][0], "b")
+        self.assertEqual({doc_id for doc_id, _ in fused}, {"a", "b", "c", "d"})
+
+
+class ClassifierHeadTest(SimpleTestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        centers = {"Refund request": 3.0, "Technical issue": -3.0, "Billing inquiry": 0.0}
+        self.labels = [label for label in centers for _ in range(30)]
+        self.vectors = np.stack([rng.normal(centers[label], 0.5, size=8) for label in self.labels])
+        self.tmp = tempfile.TemporaryDirectory()
+        self.paths = [os.path.join(self.tmp.name, name) for name in ("model.pkl", "labels.pkl", "scaler.pkl")]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_head_matches_sklearn_probabilities(self):
+        train_classifier_head(self.vectors, self.labels, *self.paths)
+        head = ClassifierHead(*self.paths)
+        predictions = dict(head.predict(self.vectors[0], top_k=3))
+
+        with open(self.paths[0], "rb") as f:
+            bundle = pickle.load(f)
+        model, label_encoder, scaler = bundle["model"], bundle["label_encoder"], bundle["scaler"]
+        expected = model.predict_proba(scaler.transform(self.vectors[:1]))[0]
+        for label, probability in zip(label_encoder.classes_, expected):
+            self.assertAlmostEqual(predictions[label], probability, places=4)
+        self.assertEqual(max(predictions, key=predictions.get), "Refund request")
+
+    def test_head_reloads_when_files_change(self):
+        train_classifier_head(self.vectors, self.labels, *self.paths)
+        head = ClassifierHead(*self.paths, reload_interval=0)
+        self.assertEqual(len(head.predict(self.vectors[0], top_k=5)), 3)
+
+        binary = [label if label == "Refund request" else "Other" for label in self.labels]
+        train_classifier_head(self.vectors, binary, *self.paths)
+        os.utime(self.paths[0], ns=(0, 1))
+        self.assertEqual({label for label, _ in head.predict(self.vectors[0], top_k=5)}, {"Refund request", "Other"})
+
+    def test_failed_reload_keeps_serving(self):
+        train_classifier_head(self.vectors, self.labels, *self.paths)
+        head = ClassifierHead(*self.paths, reload_interval=0)
+        expected = head.predict(self.vectors[0], top_k=3)
+
+        with open(self.paths[0], "wb") as f:
+            f.write(b"not a pickle")
+        self.assertEqual(head.predict(self.vectors[0], top_k=3), expected)
+        for path in self.paths:
+            os.remove(path)
+        self.assertEqual(head.predict(self.vectors[0], top_k=3), expected)
+
+    def test_training_text_has_no_label(self):
+        ticket = {"ticket_id": 1, "summary": "Refund", "description": "Money back", "priority": "High",
+                  "status": "Open", "reporter": "a@b.c", "label": "Refund request", "created_at": "2025-01-24"}
+        self.assertIn("Label: Refund request", ticket_text(ticket))
+        self.assertNotIn("Refund request", ticket_text(ticket, include_label=False))
+
+    def test_missing_files_raise(self):
+        with self.assertRaises(ClassifierHeadUnavailable) as raised:
+            ClassifierHead(*self.paths).predict(self.vectors[0])
+        self.assertIsInstance(raised.exception.__cause__, FileNotFoundError)
+
+    def test_corrupt_file_raises_unavailable(self):
+        with open(self.paths[0], "wb") as f:
+            f.write(b"\x80\x04partial")
+        with self.assertRaises(ClassifierHeadUnavailable):
+            ClassifierHead(*self.paths).predict(self.vectors[0])
+
+
+class ConfigurationManagerTest(SimpleTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.file_path = os.path.join(self.tmp.name, "config.env")
+        self.write_config('RETRIEVAL_CANDIDATES=10\nEMBEDDING_CHUNKING=True\nEMBEDDING_CHUNK_POOLING="max"\n')
+        self.manager = ConfigurationManager()
+        self.original_path = self.manager.file_path
+        self.original_subscribers = list(self.manager._subscribers)
+        self.manager.file_path = self.file_path
+        self.manager.reload()
+
+    def tearDown(self):
+        self.manager.file_path = self.original_path
+        self.manager._subscribers[:] = self.original_subscribers
+        self.manager.reload()
+        self.tmp.cleanup()
+
+    def write_config(self, content):
+        with open(self.file_path, "w") as f:
+            f.write(content)
+
+    def test_snapshot_is_typed(self):
+        snapshot = ConfigSnapshot.load(self.file_path, self.tmp.name)
+        self.assertEqual(snapshot.retrieval_candidates, 10)
+        self.assertIs(snapshot.embedding_chunking, True)
+        self.assertEqual(snapshot.embedding_chunk_pooling, "max")
+        self.assertEqual(snapshot.model_path, os.path.join(self.tmp.name, "model.pkl"))
+
+    def test_invalid_values_are_rejected(self):
+        self.write_config('RETRIEVAL_MODE="sparse"\n')
+        with self.assertRaises(ValueError):
+            ConfigSnapshot.load(self.file_path, self.tmp.name)
+        self.assertFalse(self.manager.reload())
+        self.assertEqual(self.manager.retrieval_candidates, 10)
+
+    def test_reload_swaps_snapshot_and_notifies(self):
+        changes = []
+        self.manager.subscribe(lambda old, new: changes.append(new.changed_fields(old)))
+        before = self.manager.snapshot
+        self.write_config('RETRIEVAL_CANDIDATES=30\nEMBEDDING_CHUNKING=True\nEMBEDDING_CHUNK_POOLING="max"\n')
+        self.assertTrue(self.manager.reload())
+        self.assertEqual(self.manager.retrieval_candidates, 30)
+        self.assertEqual(before.retrieval_candidates, 10)
+        self.assertEqual(changes, [["retrieval_candidates"]])
+
+
+class TenantRouterTest(SimpleTestCase):
+    class KeywordEmbeddings(Embeddings):
+        words = ["refund", "cancel", "crash", "billing"]
+
+        def embed_documents(self, texts):
+            return [self.embed_query(text) for text in texts]
+
+        def embed_query(self, text):
+            return [float(word in text.lower()) + 0.01 for word in self.words]
+
+    def make_router(self, mode):
+        client = QdrantClient(":memory:")
+        client.create_collection("tickets", vectors_config=VectorParams(size=4, distance="Cosine"))
+        router = TenantRouter(client, "tickets", self.KeywordEmbeddings(), mode=mode, vector_size=4)
+        for ticket_id, project, text, label in [
+            (1, "ALPHA", "refund my order", "Refund request"),
+            (2, "ALPHA", "cancel my plan", "Cancellation request"),
+            (3, "BETA", "refund please", "Refund request"),
+            (4, "BETA", "app crash", "Technical issue"),
+            (5, "BETA", "billing question", "Billing inquiry"),
+        ]:
+            router.add(project, Document(page_content=text, metadata={"ticket_id": ticket_id, "label": label}))
+        return router
+
+    def test_search_stays_within_project(self):
+        for mode in ("collection", "payload"):
+            router = self.make_router(mode)
+            results = router.search("ALPHA", "refund", k=2)
+            self.assertEqual({doc.metadata["ticket_id"] for doc, _ in results}, {1, 2})
+
+    def test_fallback_fills_from_base_collection(self):
+        router = self.make_router("payload")
+        router.fallback = True
+        results = router.search("ALPHA", "refund", k=4)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0][0].metadata["ticket_id"], 1)
+        router.fallback = False
+        self.assertEqual(len(router.search("ALPHA", "refund", k=4)), 2)
+
+        # In collection mode only the shared tickets without a project top up, in one search
+        router = self.make_router("collection")
+        router.add(None, Document(page_content="refund policy", metadata={"ticket_id": 6, "label": "Refund request"}))
+        router.fallback = True
+        self.assertEqual({doc.metadata["ticket_id"] for doc, _ in router.search("ALPHA", "refund", k=4)}, {1, 2, 6})
+
+    def test_tenant_slug_is_injective(self):
+        self.assertEqual(tenant_slug("ALPHA"), "alpha")
+        self.assertEqual(tenant_slug("alpha"), "alpha")
+        self.assertNotEqual(tenant_slug("A-B"), tenant_slug("A_B"))
+        self.assertNotEqual(tenant_slug("A_2d_B"), tenant_slug("A-B"))
+
+    def test_admin_operations(self):
+        router = self.make_router("collection")
+        self.assertEqual(sorted(router.list_tenants()), [("alpha", 2), ("beta", 3)])
+        self.assertEqual(router.tenant_size("BETA"), 3)
+        router.drop_tenant("BETA")
+        self.assertEqual(router.tenant_size("BETA"), 0)
+        self.assertEqual(router.list_tenants(), [("alpha", 2)])
+
+    def test_lexical_index_picks_up_other_workers_tickets(self):
+        for mode in ("none", "collection", "payload"):
+            worker_a = self.make_router(mode)
+            worker_b = TenantRouter(worker_a.client, "tickets", self.KeywordEmbeddings(), mode=mode, vector_size=4,
+                                    lexical_refresh_interval=0)
+            worker_b.load_lexical_indexes()
+            worker_a.add("ALPHA", Document(page_content="refund for a damaged parcel",
+                                           metadata={"ticket_id": 6, "label": "Refund request"}))
+            self.assertEqual(worker_b.lexical_index_for("ALPHA").search("parcel", k=5), [])
+            worker_b.refresh_lexical_index("ALPHA")
+            self.assertEqual([doc_id for doc_id, _ in worker_b.lexical_index_for("ALPHA").search("parcel", k=5)], ["6"])
@@ -0,0 +1,13 @@
+def ticket_text(data, include_label=True) -> str:
+    """
+    Renders a ticket as the text that is embedded and indexed. Predictions embed it without the label,
+    so anything trained on embeddings must use include_label=False too, or it learns from the answer.
+    """
+    text = (
+        f"Ticket ID: {data['ticket_id']}, Summary: {data['summary']}, "
+        f"Description: {data['description']}, Priority: {data['priority']}, "
+        f"Status: {data['status']}, Reporter: {data['reporter']}, "
+    )
+    if include_label:
+        text += f"Label: {data['label']}, "
+    return text + f"Created At: {data['created_at']}"
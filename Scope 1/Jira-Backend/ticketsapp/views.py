@@ -3,8 +3,12 @@ from rest_framework.response import Response
 from rest_framework import status
 from langchain.docstore.document import Document
 import numpy as np
+from configuration_manager.configuration_manager import ConfigurationManager
 from .serializers import TicketSerializer, PredictionSerializer
-from .qdrant_utils import vectorstore
+from .qdrant_utils import tenant_router, classifier_head, embedding_function
+from .classifier_head import ClassifierHeadUnavailable
+from .lexical_index import reciprocal_rank_fusion
+from .ticket_text import ticket_text
 
 # ---------------------------------------------------------------------------
 # COLLECT API - Stores a new ticket into Qdrant
@@ -14,19 +18,20 @@ class CollectTicketView(APIView):
         serializer = TicketSerializer(data=request.data)
         if serializer.is_valid():
             data = serializer.validated_data
-            page_content = (
-                f"Ticket ID: {data['ticket_id']}, Summary: {data['summary']}, "
-                f"Description: {data['description']}, Priority: {data['priority']}, "
-                f"Status: {data['status']}, Reporter: {data['reporter']}, "
-                f"Label: {data['label']}, Created At: {data['created_at']}"
-            )
+            page_content = ticket_text(data)
             metadata = serializer.validated_data
+            project_key = data.get("project_key")
 
             # Create document object
             doc = Document(page_content=page_content, metadata=metadata)
 
-            # Store in Qdrant
-            vectorstore.add_documents([doc])
+            # Store in the project's Qdrant partition
+            tenant_router.add(project_key, doc)
+
+            # Keep the project's lexical index in step with the vector store. Only hybrid retrieval reads it;
+            # switching to hybrid rebuilds the indexes from Qdrant, so dense mode does not grow them.
+            if ConfigurationManager().snapshot.retrieval_mode == "hybrid":
+                tenant_router.lexical_index_for(project_key).add(str(data["ticket_id"]), page_content, metadata)
 
             return Response({"message": "Ticket collected successfully", "ticket_id": data["ticket_id"]}, status=status.HTTP_201_CREATED)
 
@@ -40,16 +45,29 @@ class PredictLabelView(APIView):
     def post(self, request):
         serializer = TicketSerializer(data=request.data)
         if serializer.is_valid():
+            config = ConfigurationManager().snapshot
             data = serializer.validated_data
-            query_text = (
-                f"Ticket ID: {data['ticket_id']}, Summary: {data['summary']}, "
-                f"Description: {data['description']}, Priority: {data['priority']}, "
-                f"Status: {data['status']}, Reporter: {data['reporter']}, "
-                f"Created At: {data['created_at']}"
-            )
-
-            # Search in Qdrant
-            results = vectorstore.similarity_search_with_score(query=query_text, k=5)
+            project_key = data.get("project_key")
+            query_text = ticket_text(data, include_label=False)
+
+            if config.prediction_mode == "head":
+                # Embed and classify directly, skipping the vector search entirely
+                try:
+                    predictions = classifier_head.predict(embedding_function.embed_query(query_text), top_k=5)
+                except ClassifierHeadUnavailable as e:
+                    # Not trained yet, or a missing or corrupt pickle: answer without a head instead of a 500
+                    message = ("Classifier head has not been trained yet." if isinstance(e.__cause__, FileNotFoundError)
+                               else "Classifier head could not be loaded.")
+                    return Response({"error": message}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+                response = [{"label": label, "confidence": confidence} for label, confidence in predictions]
+                return Response(response, status=status.HTTP_200_OK)
+
+            if config.retrieval_mode == "hybrid":
+                response = self.hybrid_search(query_text, project_key, k=5, config=config)
+                return Response(response, status=status.HTTP_200_OK)
+
+            # Search the project's partition in Qdrant
+            results = tenant_router.search(project_key, query_text, k=5)
 
             if not results:
                 return Response([], status=status.HTTP_200_OK)
@@ -73,3 +91,39 @@ class PredictLabelView(APIView):
             return Response(response, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @staticmethod
+    def hybrid_search(query_text, project_key, k, config):
+        """
+        Fuses dense Qdrant candidates with BM25 candidates using reciprocal-rank fusion.
+        """
+        candidates = config.retrieval_candidates
+        # Pick up tickets other server processes collected since this process built its index
+        tenant_router.refresh_lexical_index(project_key)
+        lexical_index = tenant_router.lexical_index_for(project_key)
+        dense_results = tenant_router.search(project_key, query_text, k=candidates)
+        lexical_results = lexical_index.search(query_text, k=candidates)
+
+        metadata_by_id = {}
+        dense_ranking = []
+        for doc, _ in dense_results:
+            doc_id = str(doc.metadata.get("ticket_id"))
+            metadata_by_id[doc_id] = doc.metadata
+            dense_ranking.append(doc_id)
+        lexical_ranking = [doc_id for doc_id, _ in lexical_results]
+
+        fused = reciprocal_rank_fusion([dense_ranking, lexical_ranking], k=config.rrf_k)[:k]
+        if not fused:
+            return []
+
+        # Normalise fused scores into confidences that sum to one
+        scores = np.array([score for _, score in fused])
+        confidence_scores = scores / scores.sum()
+
+        return [
+            {
+                "label": metadata_by_id.get(doc_id, lexical_index.metadata(doc_id)).get("label", "Unknown"),
+                "confidence": float(conf_score),
+            }
+            for (doc_id, _), conf_score in zip(fused, confidence_scores)
+        ]
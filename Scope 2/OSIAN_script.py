@@ -1,15 +1,19 @@
+import io
 import os
-from farasa.segmenter import FarasaSegmenter
 import json
 import csv
-import re
 from itertools import islice
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
 import zipfile
 from io import BytesIO
+from downloader import DownloadItem, DownloadManifest, download_item
+from segmentation_cache import SegmentationCache
+from segmentation_service import SegmentationPool
+from streaming_sources import iter_zip_members
+from text_normalization import clean_sentences
 
-
-farasa_segmenter = FarasaSegmenter(interactive=False)
+SENTENCES_PREFIX = "files/data/sentences"
 
 
 def download_and_extract_txt(country, url, output_dir):
@@ -23,7 +27,7 @@ def download_and_extract_txt(country, url, output_dir):
             txt_files = [
                 file
                 for file in zip_ref.namelist()
-                if file.startswith("files/data/sentences") and file.endswith(".txt")
+                if file.startswith(SENTENCES_PREFIX) and file.endswith(".txt")
             ]
             if not txt_files:
                 print(f"No .txt files found in the ZIP for {country}.")
@@ -42,30 +46,81 @@ def download_and_extract_txt(country, url, output_dir):
         print(f"Invalid ZIP file for {country}: {url}")
 
 
-def preprocess_with_farasa(text):
-    text = text[1]
-    unwanted_chars = r"[()\[\]:«»“”‘’—_,;!?|/\\]"
-    text = re.sub(unwanted_chars, "", text)
-    text = re.sub(r"(\-\-|\[\]|\.\.)", "", text)
-    text = re.sub(r"\s+", " ", text).strip()
-    text = re.sub(r"^\d+\s+", "", text)
-    return farasa_segmenter.segment(text)
+def iter_tsv_batches(file, batch_size=1000):
+    """Yields lists of batch_size rows of a tab-separated text stream, after its header row."""
+    reader = csv.reader(file, delimiter="\t")
+    next(reader, None)  # Skip the header
+    while True:
+        batch = list(islice(reader, batch_size))
+        if not batch:
+            break
+        yield batch
 
 
 def read_csv_in_batches(file_path, batch_size=1000):
     with open(file_path, mode="r", newline="", encoding="utf-8") as file:
-        reader = csv.reader(file, delimiter="\t")
-        headers = next(reader)  # Read the header separately
-        while True:
-            batch = list(islice(reader, batch_size))
-            if not batch:
-                print(batch, "\t", "breaking")
-                break
-            yield batch  # Return the batch as a generator
+        yield from iter_tsv_batches(file, batch_size)
+
+
+def segment_batches_to_file(batches, output_file, pool, mode="a"):
+    """Cleans the sentence column of every batch and writes its segmentation to output_file, one per line."""
+
+    def cleaned_sentences():
+        for batch_number, batch in enumerate(batches, start=1):
+            print(f"Batch {batch_number}: {len(batch)} rows")
+            yield from clean_sentences(row[1] for row in batch)
+
+    # The whole file is streamed through the pool so every Farasa process stays busy
+    with open(output_file, mode, encoding="utf-8", newline="\n") as f:
+        for s in pool.segment_stream(cleaned_sentences()):
+            if s is not None:
+                f.write(f"{s}\n")
+
+
+def stream_country(country, url, output_dir, pool, manifest, keep_archive=False):
+    """
+    Streaming alternative to process_country: the ZIP is spooled to disk by the resumable downloader
+    instead of being held in memory, and each sentences*.txt member is inflated straight into cleaning
+    and segmentation, so nothing is extracted. A member's output "{member}_segmented.txt" is written
+    under a .part name and renamed when complete; finished outputs are skipped on reruns.
+    Once every member is segmented the country is marked extracted in the manifest, so reruns skip it
+    without downloading the archive again; the archive is then deleted unless keep_archive is set.
+    """
+    archive_path = os.path.join(os.path.dirname(manifest.manifest_path), f"{country}.zip")
+    item = DownloadItem(country, url, archive_path)
+    if manifest.is_extracted(country) and manifest.is_complete(item):
+        print(f"{country} already segmented, skipping.")
+        return
+    print(f"Streaming: {country}")
+    download_item(item, manifest)
+
+    members = 0
+    for member_name, member in iter_zip_members(archive_path, prefix=SENTENCES_PREFIX, suffix=".txt"):
+        members += 1
+        output_file = os.path.join(output_dir, country, f"{os.path.splitext(member_name)[0]}_segmented.txt")
+        if os.path.exists(output_file):
+            print(f"{output_file} already segmented, skipping.")
+            continue
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        print(f"processing {country} data: {member_name}")
+        with io.TextIOWrapper(member, encoding="utf-8", newline="") as f_in:
+            segment_batches_to_file(iter_tsv_batches(f_in), f"{output_file}.part", pool, mode="w")
+        os.replace(f"{output_file}.part", output_file)
+    if not members:
+        print(f"No .txt files found in the ZIP for {country}.")
+
+    manifest.mark_extracted(country)
+    if not keep_archive:
+        os.remove(archive_path)
 
 
 # Main script
-def main():
+def main(segmenter_workers=4, sentences_per_call=500, streaming=True, max_countries=2, keep_archives=False):
+    """
+    With streaming=True, up to max_countries countries are downloaded and segmented concurrently through
+    stream_country, all feeding the same segmenter pool; otherwise each country is downloaded, extracted and
+    segmented in turn as before. keep_archives keeps the downloaded ZIPs (in output_dir/downloads).
+    """
     json_file = "OSIAN_Links.json"  # Replace with your JSON file name
     output_dir = "D:\\Work\\ModernBERT\\Data"  # Directory to store extracted files
 
@@ -80,21 +135,41 @@ def main():
         print(f"Error decoding JSON file {json_file}.")
         return
 
-    # Process each country and its dataset link
-    for country, url in country_datasets.items():
-        download_and_extract_txt(country, url, output_dir)
-        print(f"processing {country} data")
-        output_file = os.path.join(
-            output_dir, country, "files/data/sentences_segmented.txt"
-        )
-        txt_file_path = os.path.join(output_dir, country, "files/data/sentences.txt")
-        with open(output_file, "a", encoding="utf-8", newline="\n") as f:
-            for batch_number, batch in enumerate(
-                read_csv_in_batches(txt_file_path, 1000), start=1
-            ):
-                print(f"Batch {batch_number}: {len(batch)} rows")
-                t = list(map(preprocess_with_farasa, batch))
-                f.writelines([f"{s}\n" for s in t])
+    # Process each country and its dataset link; one pool of Farasa processes serves every country.
+    # Segmentations are cached on disk, so sentences repeated across countries or reruns skip Farasa.
+    cache_path = os.path.join(output_dir, "segmentation_cache.sqlite")
+    with SegmentationCache(cache_path, namespace="farasa") as cache, \
+            SegmentationPool(segmenter_workers, sentences_per_call, cache=cache) as pool:
+        if streaming:
+            download_dir = os.path.join(output_dir, "downloads")
+            os.makedirs(download_dir, exist_ok=True)
+            manifest = DownloadManifest(os.path.join(download_dir, "download_manifest.json"))
+            with ThreadPoolExecutor(max_workers=max_countries) as executor:
+                futures = {
+                    executor.submit(stream_country, country, url, output_dir, pool, manifest, keep_archives): country
+                    for country, url in country_datasets.items()
+                }
+                for future in as_completed(futures):
+                    country = futures[future]
+                    try:
+                        future.result()
+                        print(f"Finished {country}")
+                    except (requests.exceptions.RequestException, zipfile.BadZipFile, OSError) as e:
+                        print(f"Failed to process {country}: {e}")
+        else:
+            for country, url in country_datasets.items():
+                process_country(country, url, output_dir, pool)
+        print(f"Segmentation cache: {cache.stats()}")
+
+
+def process_country(country, url, output_dir, pool):
+    download_and_extract_txt(country, url, output_dir)
+    print(f"processing {country} data")
+    output_file = os.path.join(
+        output_dir, country, "files/data/sentences_segmented.txt"
+    )
+    txt_file_path = os.path.join(output_dir, country, "files/data/sentences.txt")
+    segment_batches_to_file(read_csv_in_batches(txt_file_path, 1000), output_file, pool)
 
 
 if __name__ == "__main__":
@@ -11,13 +11,13 @@ from pathlib import Path
 import xml.etree.ElementTree as ET
 import csv
 import json
-from farasa.segmenter import FarasaSegmenter
-from datetime import datetime
-
-def log_event(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open("pipeline.log", "a", encoding="utf-8") as log_file:
-        log_file.write(f"[{timestamp}] {message}\n")
+from collections import deque
+from pipeline_log import log_event
+from resumable_io import FileCheckpoint, iter_lines_with_offsets
+from segmentation_cache import SegmentationCache
+from segmentation_service import SegmentationPool
+from streaming_sources import iter_text_blocks
+from text_normalization import arabic_words, clean_text, contains_english_word
 
 
 ###################################################################################################################################
@@ -286,10 +286,10 @@ def extract_text_blocks(input_directory, output_directory):
     - Once an empty line is found (or we're at the end), we check if the combined chunk has at least 100 words
       or up to 8000 words (the code uses >=100 or <=8000 condition).
     - If valid, write that chunk as one line to the output file.
+    Blocks are streamed with iter_text_blocks, so memory is bounded by the largest block, not the file.
     """
     log_event(f"Starting extract_text_blocks from {input_directory} to {output_directory}")
     os.makedirs(output_directory, exist_ok=True)
-    pattern = re.compile(r"<Text>(.*?)</Text>", flags=re.DOTALL)
 
     for filename in os.listdir(input_directory):
         if filename.lower().endswith(".xml"):
@@ -299,13 +299,9 @@ def extract_text_blocks(input_directory, output_directory):
 
             log_event(f"Processing XML file: {xml_file_path}")
 
-            with open(xml_file_path, 'r', encoding='utf-8') as f_in:
-                content = f_in.read()
-
-            matches = pattern.findall(content)
-
-            with open(output_file_path, 'w', encoding='utf-8') as f_out:
-                for match in matches:
+            with open(xml_file_path, 'r', encoding='utf-8') as f_in, \
+                    open(output_file_path, 'w', encoding='utf-8') as f_out:
+                for match in iter_text_blocks(f_in):
                     cleaned_text = match.strip()
                     lines = cleaned_text.splitlines()
 
@@ -361,7 +357,6 @@ def process_text_files(input_directory, output_directory):
     os.makedirs(output_directory, exist_ok=True)
     
     numeric_prefix_pattern = re.compile(r"^\d+:\d+:")  # Pattern to detect a numeric prefix at the start of the line.
-    english_pattern = re.compile(r"\b[a-zA-Z]+\b")     # Pattern to detect any English words.
     
     for file_name in os.listdir(input_directory):
         if file_name.endswith(".txt"):
@@ -392,7 +387,7 @@ def process_text_files(input_directory, output_directory):
                     else:
                         cleaned_line = original_line
                     # Only skip the line if the cleaned text contains English words.
-                    if english_pattern.search(cleaned_line):
+                    if contains_english_word(cleaned_line):
                         continue
                     sentence = cleaned_line
                 else:
@@ -428,13 +423,6 @@ def process_text_files(input_directory, output_directory):
 ###################################################################################################################################
 
 
-def clean_text(text):
-    """
-    Cleans Arabic text by removing specified punctuation and extra whitespace.
-    """
-    return re.sub(r'\s+', ' ', re.sub(r'[.,;،؛]', '', text)).strip()
-
-
 def process_xml_file(input_file_path, output_file_path):
     """
     Parses an XML file, extracts Arabic words from each text element,
@@ -452,8 +440,7 @@ def process_xml_file(input_file_path, output_file_path):
                 for line in text_content.splitlines():
                     line = line.strip()
                     # Extract Arabic words from the line
-                    arabic_words = re.findall(r'[ء-ي]+', line)
-                    arabic_line = " ".join(arabic_words)
+                    arabic_line = " ".join(arabic_words(line))
                     
                     if arabic_line:
                         sentence_buffer.append(arabic_line)
@@ -499,98 +486,122 @@ def process_xml(input_directory, output_directory):
 ###################################################################################################################################
 ###################################################################################################################################
 
-def safe_segment(segmenter, text):
+def apply_segmentation_to_file(input_file, output_base, pool, batch_size=100000, max_chunks=1000000):
     """
-    Attempts to segment text using Farasa.
-    """
-    try:
-        return segmenter.segment(text)
-    except UnicodeDecodeError as e:
-        error_message = f"UnicodeDecodeError while segmenting text: {text[:30]}... Error: {e}"
-        print(error_message)
-        log_event(error_message)
-        return None
-
-
-def apply_segmentation_to_file(input_file, output_base, segmenter, batch_size=100000, max_chunks=1000000):
-    """
-    Reads a text file line-by-line, applies Farasa segmentation to each line,
-    and writes segmented lines in batches to new text files.
+    Streams a text file line-by-line through Farasa segmentation (via the SegmentationPool, many lines per call,
+    in order) and writes segmented lines incrementally into batch_size-line text files.
+    After each completed batch file the byte offset of its last line is checkpointed in
+    "{output_base}.checkpoint.json", so a killed job resumes there and only rewrites the unfinished batch.
     """
     log_event(f"Starting apply_segmentation_to_file: {input_file} -> {output_base}")
-    with open(input_file, "r", encoding="utf-8") as infile:
-        lines = [line.strip() for line in infile if line.strip()]
+    checkpoint = FileCheckpoint(f"{output_base}.checkpoint.json", input_file)
+    state = checkpoint.load(chunk_number=1)
+    if state["done"]:
+        done_msg = f"Segmentation of {input_file} already completed, skipping."
+        print(done_msg)
+        log_event(done_msg)
+        return
 
-    if not lines:
+    if os.path.getsize(input_file) == 0:
         no_data_msg = f"No data found in {input_file}."
         print(no_data_msg)
         log_event(no_data_msg)
         return
 
-    batch = []
-    chunk_number = 1
-
+    chunk_number = state["chunk_number"]
     print(f"Starting segmentation for file: {input_file}")
-    log_event(f"Segmentation started for file: {input_file}")
-
-    for line in lines:
-        segmented_line = safe_segment(segmenter, line)
-        if segmented_line is None:
-            continue
-        batch.append(segmented_line)
-        if len(batch) >= batch_size:
-            output_file = f"{output_base}_batch_{chunk_number}.txt"
-            with open(output_file, "w", encoding="utf-8") as outfile:
-                outfile.write("\n".join(batch))
-
-            chunk_msg = (f"\nDEBUG: --- Chunk {chunk_number} ---\n"
-                         f"DEBUG: Processing {len(batch)} lines\n"
-                         f"Segmented batch {chunk_number} with {len(batch)} lines to {output_file}\n")
-            print(chunk_msg)
-            log_event(chunk_msg)
-            batch = []
-            chunk_number += 1
-            if chunk_number > max_chunks:
-                max_chunk_msg = f"Reached maximum chunk limit ({max_chunks}). Stopping further processing."
-                print(max_chunk_msg)
-                log_event(max_chunk_msg)
-                break
-
-    if batch and chunk_number <= max_chunks:
-        output_file = f"{output_base}_batch_{chunk_number}.txt"
-        with open(output_file, "w", encoding="utf-8") as outfile:
-            outfile.write("\n".join(batch))
-
+    log_event(f"Segmentation started for file: {input_file} at byte {state['offset']}")
+
+    with open(input_file, "rb") as infile:
+        infile.seek(state["offset"])
+        # End offsets of the lines in flight in the pool, in input order
+        pending = deque()
+
+        def lines():
+            for line, end_offset in iter_lines_with_offsets(infile):
+                line = line.strip()
+                if line:
+                    pending.append(end_offset)
+                    yield line
+
+        segmented = pool.segment_stream(lines())
+        outfile = None
+        lines_in_chunk = 0
+        stopped = False
+        for segmented_line in segmented:
+            end_offset = pending.popleft()
+            if segmented_line is None:
+                continue
+            if outfile is None:
+                output_file = f"{output_base}_batch_{chunk_number}.txt"
+                outfile = open(output_file, "w", encoding="utf-8")
+            outfile.write(f"\n{segmented_line}" if lines_in_chunk else segmented_line)
+            lines_in_chunk += 1
+            if lines_in_chunk >= batch_size:
+                outfile.close()
+                outfile = None
+                chunk_msg = (f"\nDEBUG: --- Chunk {chunk_number} ---\n"
+                             f"DEBUG: Processing {lines_in_chunk} lines\n"
+                             f"Segmented batch {chunk_number} with {lines_in_chunk} lines to {output_file}\n")
+                print(chunk_msg)
+                log_event(chunk_msg)
+                lines_in_chunk = 0
+                chunk_number += 1
+                checkpoint.save(offset=end_offset, chunk_number=chunk_number, done=False)
+                if chunk_number > max_chunks:
+                    max_chunk_msg = f"Reached maximum chunk limit ({max_chunks}). Stopping further processing."
+                    print(max_chunk_msg)
+                    log_event(max_chunk_msg)
+                    stopped = True
+                    break
+        segmented.close()
+
+    if outfile is not None and not stopped:
+        outfile.close()
         final_chunk_msg = (f"\nDEBUG: --- Final Chunk {chunk_number} ---\n"
-                           f"DEBUG: Processing {len(batch)} lines\n"
-                           f"Segmented final chunk {chunk_number} with {len(batch)} lines to {output_file}\n")
+                           f"DEBUG: Processing {lines_in_chunk} lines\n"
+                           f"Segmented final chunk {chunk_number} with {lines_in_chunk} lines to {output_file}\n")
         print(final_chunk_msg)
         log_event(final_chunk_msg)
+    checkpoint.save(offset=os.path.getsize(input_file), chunk_number=chunk_number, done=True)
 
     log_event(f"Completed segmentation for file: {input_file}")
 
 
-def Segmenting_data(output_directory):
+def Segmenting_data(output_directory, segmenter_workers=4, sentences_per_call=500, segmenter="farasa", cache_path=None):
     """
     Processes all text files in the output_directory whose names match specific patterns.
     For each file, segmentation is applied, and segmented output is written in batches.
+    segmenter_workers Farasa processes segment sentences_per_call lines per call; segmenter="stub" needs no JVM.
+    With cache_path, segmentations persist in a SegmentationCache so repeated lines and reruns skip Farasa.
     """
     log_event(f"Starting Segmenting_data in directory: {output_directory}")
-    farasa_segmenter = FarasaSegmenter(interactive=False)
     file_number = 1
-    for file_name in os.listdir(output_directory):
-        if (file_name.startswith("processed_")
-            and file_name.endswith(".txt")):
-            input_file_path = os.path.join(output_directory, file_name)
-            output_base = os.path.join(output_directory, f"segmented_{file_number}")
-            file_number += 1
-            debug_msg = f"\nDEBUG: Processing segmentation for file: {file_name}"
-            print(debug_msg)
-            log_event(debug_msg)
-            apply_segmentation_to_file(input_file_path, output_base, farasa_segmenter, batch_size=5, max_chunks=2)
-            completion_msg = f"DEBUG: Completed segmentation for file: {file_name}"
-            print(completion_msg)
-            log_event(completion_msg)
+    cache = SegmentationCache(cache_path, namespace=segmenter) if cache_path else None
+    try:
+        with SegmentationPool(segmenter_workers, sentences_per_call, kind=segmenter, cache=cache) as pool:
+            # Sorted, so every file keeps its segmented_N name (and checkpoint) across resumed runs
+            for file_name in sorted(os.listdir(output_directory)):
+                if (file_name.startswith("processed_")
+                    and file_name.endswith(".txt")):
+                    input_file_path = os.path.join(output_directory, file_name)
+                    output_base = os.path.join(output_directory, f"segmented_{file_number}")
+                    file_number += 1
+                    debug_msg = f"\nDEBUG: Processing segmentation for file: {file_name}"
+                    print(debug_msg)
+                    log_event(debug_msg)
+                    apply_segmentation_to_file(input_file_path, output_base, pool, batch_size=5, max_chunks=2)
+                    completion_msg = f"DEBUG: Completed segmentation for file: {file_name}"
+                    print(completion_msg)
+                    log_event(completion_msg)
+    finally:
+        if cache:
+            stats = cache.stats()
+            cache_msg = (f"Segmentation cache: {stats['lookups']} lookups, {stats['memory_hits']} memory hits, "
+                         f"{stats['disk_hits']} disk hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)")
+            print(cache_msg)
+            log_event(cache_msg)
+            cache.close()
     log_event(f"Completed Segmenting_data in directory: {output_directory}")
 
 
@@ -659,7 +670,7 @@ def main():
     print("XML files are processed.\n")
     log_event("Processed XML files and generated label processed outputs")
 
-    Segmenting_data(output_directory)
+    Segmenting_data(output_directory, cache_path=os.path.join(output_directory, "segmentation_cache.sqlite"))
     print("All files are segmented.\n")
     log_event("Segmented data files")
 
@@ -1,23 +1,28 @@
+import io
 import os
-import gdown
-import requests
 import bz2
 import rarfile
-import shutil
-from tqdm import tqdm
 import re
-import random
 from pathlib import Path
-import xml.etree.ElementTree as ET
 import csv
 import json
-from farasa.segmenter import FarasaSegmenter
-from datetime import datetime
-
-def log_event(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    with open("pipeline.log", "a", encoding="utf-8") as log_file:
-        log_file.write(f"[{timestamp}] {message}\n")
+from contextlib import contextmanager
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from corpus_pipeline import paragraphs, run_stages
+from dedup import Deduplicator, content_hash
+from downloader import DownloadItem, DownloadManifest, download_all, download_item
+from negative_sampling import balance_csv_file, balance_pairs, derive_seed, iter_balanced_rows
+from parquet_io import DEFAULT_ROW_GROUP_SIZE, ParquetPairWriter, iter_parquet_pairs, pairs_path
+from pipeline_dag import PipelineRunner
+from pipeline_log import log_event
+from resumable_io import FileCheckpoint, iter_csv_records_with_offsets
+from segmentation_cache import SegmentationCache
+from segmentation_service import SegmentationPool
+from sharded_executor import iter_shard_lines, plan_shards, run_sharded, shard_part_path
+from stage_metrics import MetricsRecorder, add_dropped, add_rows, counted_rows
+from streaming_sources import decompressed, iter_lines, iter_rar_members, iter_text_blocks, iter_xml_texts, open_url_stream
+from text_normalization import clean_text, contains_english_word, extract_arabic_sentences
 
 ###################################################################################################################################
 ###################################################################################################################################
@@ -33,52 +38,6 @@ def create_directory(directory_path):
     os.makedirs(directory_path, exist_ok=True)
     log_event(f"Created directory: {directory_path}")
 
-def download_from_drive(drive_link, output_path):
-    """
-    Download a file from Google Drive using its shareable link.
-    """
-    try:
-        if '/d/' in drive_link:
-            file_id = drive_link.split('/d/')[1].split('/view')[0]
-            gdown.download(f"https://drive.google.com/uc?id={file_id}",
-                           output_path,
-                           quiet=False)
-            message = f"Downloaded (Drive): {output_path}"
-            print(message)
-            log_event(message)
-        else:
-            raise ValueError("Invalid Google Drive link.")
-    except IndexError:
-        error_message = f"Error: Could not process link - {drive_link}"
-        print(error_message)
-        log_event(error_message)
-
-def download_direct_link_binary(link, output_path):
-    """
-    Download a file in binary mode (useful for compressed files).
-    """
-    response = requests.get(link, stream=True)
-    with open(output_path, "wb") as file:
-        for chunk in tqdm(response.iter_content(chunk_size=1024)):
-            if chunk:
-                file.write(chunk)
-    message = f"Downloaded (binary): {output_path}"
-    print(message)
-    log_event(message)
-
-def download_direct_link_text(link, output_path):
-    """
-    Download a file in text mode, decoding each chunk to UTF-8.
-    """
-    response = requests.get(link, stream=True)
-    with open(output_path, "w", encoding="utf-8") as file:
-        for chunk in tqdm(response.iter_content(chunk_size=1024)):
-            if chunk:
-                file.write(chunk.decode("utf-8", errors="replace"))
-    message = f"Downloaded (as text): {output_path}"
-    print(message)
-    log_event(message)
-
 def extract_rar(rar_path, extract_to):
     """
     Extract a .rar archive into the specified folder.
@@ -100,134 +59,174 @@ def extract_bz2(bz2_path, output_path):
     print(message)
     log_event(message)
 
-def process_text_links(links, output_folder):
+def named_links(links, prefix):
     """
-    Downloads links intended to be .txt files.
-    Logs the dataset name (key in the JSON) along with the process.
+    Returns links as a {dataset_name: link} dict, naming list entries "{prefix}_{i}".
     """
-    create_directory(output_folder)
-
     if isinstance(links, dict):
-        for key, link in links.items():
-            log_event(f"Starting text download for dataset: {key}")
-            text_filename = f"{key}.txt"
-            output_path = os.path.join(output_folder, text_filename)
-
-            if "drive.google.com" in link:
-                download_from_drive(link, output_path)
-                log_event(f"Processed text download (Drive) for dataset: {key}")
-                continue
+        return links
+    return {f"{prefix}_{i}": link for i, link in enumerate(links, start=1)}
 
-            if link.endswith(".bz2"):
-                temp_bz2_path = os.path.join(output_folder, f"{key}.bz2")
-                download_direct_link_binary(link, temp_bz2_path)
-                extract_bz2(temp_bz2_path, output_path)
-                if os.path.exists(temp_bz2_path):
-                    os.remove(temp_bz2_path)
-                    message = f"Removed temporary file: {temp_bz2_path}"
-                    print(message)
-                    log_event(message)
-                log_event(f"Processed text download and extraction for dataset: {key}")
-            else:
-                download_direct_link_text(link, output_path)
-                log_event(f"Processed text download for dataset: {key}")
-    else:
-        for i, link in enumerate(links, start=1):
-            dataset_name = f"text_file_{i}"
-            log_event(f"Starting text download for dataset: {dataset_name}")
-            text_filename = f"{dataset_name}.txt"
-            output_path = os.path.join(output_folder, text_filename)
-
-            if "drive.google.com" in link:
-                download_from_drive(link, output_path)
-                log_event(f"Processed text download (Drive) for dataset: {dataset_name}")
-                continue
-
-            if link.endswith(".bz2"):
-                temp_bz2_path = os.path.join(output_folder, f"{dataset_name}.bz2")
-                download_direct_link_binary(link, temp_bz2_path)
-                extract_bz2(temp_bz2_path, output_path)
-                if os.path.exists(temp_bz2_path):
-                    os.remove(temp_bz2_path)
-                    message = f"Removed temporary file: {temp_bz2_path}"
-                    print(message)
-                    log_event(message)
-                log_event(f"Processed text download and extraction for dataset: {dataset_name}")
-            else:
-                download_direct_link_text(link, output_path)
-                log_event(f"Processed text download for dataset: {dataset_name}")
-
-def process_compressed_xml_links(links, output_folder):
+def download_and_extract_links(links, download_folder, extract_folder, xml_folder, text_folder, max_workers=4):
     """
-    Downloads compressed .rar/.bz2 files, then extracts them into XML.
-    Logs the dataset name (key in the JSON) along with the process.
+    Downloads every entry of links.json on a bounded worker pool, then extracts the archives.
+        - links_one_billion: .rar -> extract_folder
+        - xml_links: .rar/.bz2 -> xml_folder
+        - text_links: .bz2 -> text_folder, Drive/plain text straight into text_folder
+    A manifest in download_folder records finished downloads and extractions, so a re-run skips them
+    and an interrupted download resumes where it stopped.
     """
-    create_directory(output_folder)
-    temp_folder = os.path.join(output_folder, "temp")
-    create_directory(temp_folder)
-
-    if isinstance(links, dict):
-        for key, link in links.items():
-            log_event(f"Starting compressed XML download for dataset: {key}")
-            if link.lower().endswith(".rar"):
-                compressed_path = os.path.join(temp_folder, f"{key}.rar")
-            else:
-                compressed_path = os.path.join(temp_folder, f"{key}.bz2")
-
-            if "drive.google.com" in link:
-                download_from_drive(link, compressed_path)
-                log_event(f"Downloaded compressed XML (Drive) for dataset: {key}")
-            else:
-                download_direct_link_binary(link, compressed_path)
-                log_event(f"Downloaded compressed XML for dataset: {key}")
-
-            if compressed_path.endswith(".rar"):
-                extract_rar(compressed_path, output_folder)
-            else:
-                extracted_file_path = os.path.join(output_folder, f"{key}.xml")
-                extract_bz2(compressed_path, extracted_file_path)
-
-            if os.path.exists(compressed_path):
-                os.remove(compressed_path)
-                message = f"Removed temporary compressed file: {compressed_path}"
-                print(message)
-                log_event(message)
-            log_event(f"Processed compressed XML dataset: {key}")
-    else:
-        for i, link in enumerate(links, start=1):
-            dataset_name = f"compressed_{i}"
-            log_event(f"Starting compressed XML download for dataset: {dataset_name}")
-            if link.lower().endswith(".rar"):
-                compressed_path = os.path.join(temp_folder, f"{dataset_name}.rar")
-            else:
-                compressed_path = os.path.join(temp_folder, f"{dataset_name}.bz2")
+    for folder in (download_folder, extract_folder, xml_folder, text_folder):
+        create_directory(folder)
+
+    items = {}
+    for key, link in named_links(links["links_one_billion"], "one_billion").items():
+        items[key] = ("one_billion", DownloadItem(key, link, os.path.join(download_folder, f"{key}.rar")))
+    for key, link in named_links(links["xml_links"], "compressed").items():
+        extension = ".rar" if link.lower().endswith(".rar") else ".bz2"
+        items[key] = ("xml", DownloadItem(key, link, os.path.join(download_folder, f"{key}{extension}")))
+    for key, link in named_links(links["text_links"], "text_file").items():
+        if link.endswith(".bz2"):
+            items[key] = ("text", DownloadItem(key, link, os.path.join(download_folder, f"{key}.bz2")))
+        else:
+            items[key] = ("text", DownloadItem(key, link, os.path.join(text_folder, f"{key}.txt")))
 
-            if "drive.google.com" in link:
-                download_from_drive(link, compressed_path)
-                log_event(f"Downloaded compressed XML (Drive) for dataset: {dataset_name}")
-            else:
-                download_direct_link_binary(link, compressed_path)
-                log_event(f"Downloaded compressed XML for dataset: {dataset_name}")
+    manifest_path = os.path.join(download_folder, "download_manifest.json")
+    log_event(f"Starting download of {len(items)} datasets with {max_workers} workers")
+    results, manifest = download_all([item for _, item in items.values()], manifest_path, max_workers=max_workers)
 
-            if compressed_path.endswith(".rar"):
-                extract_rar(compressed_path, output_folder)
-            else:
-                extracted_file_path = os.path.join(output_folder, f"xml_file_{i}.xml")
-                extract_bz2(compressed_path, extracted_file_path)
+    for key, (group, item) in items.items():
+        status = results[key]
+        log_event(f"Download {status} for dataset: {key}")
+        if status == "failed":
+            print(f"❌ Failed to download dataset: {key}")
+            continue
+        if manifest.is_extracted(key) or not item.output_path.startswith(download_folder):
+            continue
 
-            if os.path.exists(compressed_path):
-                os.remove(compressed_path)
-                message = f"Removed temporary compressed file: {compressed_path}"
-                print(message)
-                log_event(message)
-            log_event(f"Processed compressed XML dataset: {dataset_name}")
+        if item.output_path.endswith(".rar"):
+            extract_rar(item.output_path, extract_folder if group == "one_billion" else xml_folder)
+        elif group == "xml":
+            extract_bz2(item.output_path, os.path.join(xml_folder, f"{key}.xml"))
+        else:
+            extract_bz2(item.output_path, os.path.join(text_folder, f"{key}.txt"))
 
-    if os.path.exists(temp_folder):
-        shutil.rmtree(temp_folder, ignore_errors=True)
-        message = f"Removed temp folder: {temp_folder}"
+        manifest.mark_extracted(key)
+        os.remove(item.output_path)
+        message = f"Removed compressed file: {item.output_path}"
         print(message)
         log_event(message)
 
+    return results
+
+def stream_and_process_links(links, download_folder, output_directory, text_folder, cache_folder=None, max_workers=4, seed=None,
+                             memory_mb=256, deduplicator=None, output_format="csv"):
+    """
+    Streaming alternative to download_and_extract_links followed by the per-directory processors.
+    Nothing is decompressed to disk:
+        - xml_links (.bz2): HTTP -> bz2 -> XML parser -> "extracted_{key}.txt" in output_directory
+        - text_links (.bz2/plain): HTTP -> bz2 -> line processor -> "balanced_processed_{key}.txt"
+        - text_links on Google Drive are plain text and are downloaded into text_folder as before
+        - links_one_billion (.rar): RAR needs random access, so the archive is downloaded once and its
+          XML members are read as streams straight into the <Text> extractor
+    With cache_folder, the compressed bytes are kept there and re-used by later runs instead of the network;
+    without it, nothing but the RAR archives touches the disk and those are removed once streamed.
+    The manifest records the extracted_ files of every XML and One Billion dataset, and later calls skip a
+    dataset while all of them exist. The balanced text outputs are made again on every call (from the cache,
+    if any), since they depend on the balancing parameters and on the hashes already in the deduplicator.
+    Text lines are deduplicated across all datasets by deduplicator (default: exact hashes in memory).
+    output_format ("csv" or "parquet") selects the format of the balanced text outputs.
+    """
+    for folder in (download_folder, output_directory, text_folder):
+        create_directory(folder)
+    deduplicator = deduplicator or Deduplicator()
+    if cache_folder:
+        create_directory(cache_folder)
+    archive_folder = cache_folder or download_folder
+    manifest = DownloadManifest(os.path.join(archive_folder, "download_manifest.json"))
+
+    def cache_path(key, link):
+        if not cache_folder:
+            return None
+        return os.path.join(cache_folder, f"{key}.bz2" if link.endswith(".bz2") else f"{key}.txt")
+
+    def finished(key, link):
+        # Extracted text depends only on the archive, so it is kept for as long as its files exist
+        outputs = manifest.finished_outputs(key, link)
+        if outputs is not None:
+            message = f"Skipping {key}: already extracted to {len(outputs)} files"
+            print(message)
+            log_event(message, stage="acquire", key=key)
+        return outputs is not None
+
+    def stream_xml(key, link):
+        output_file_path = os.path.join(output_directory, f"extracted_{key}.txt")
+        if finished(key, link):
+            return output_file_path
+        with open_url_stream(link, cache_path(key, link)) as raw:
+            write_xml_sentences(decompressed(raw, link), f"{output_file_path}.part")
+        os.replace(f"{output_file_path}.part", output_file_path)
+        manifest.record_outputs(key, link, [output_file_path])
+        return output_file_path
+
+    def stream_text(key, link):
+        if "drive.google.com" in link:
+            item = DownloadItem(key, link, os.path.join(text_folder, f"{key}.txt"))
+            download_item(item, manifest)
+            return item.output_path
+        output_file_path = pairs_path(os.path.join(output_directory, f"balanced_processed_{key}.txt"), output_format)
+        with open_url_stream(link, cache_path(key, link)) as raw:
+            process_and_balance_lines(iter_lines(decompressed(raw, link)), output_file_path,
+                                      seed=derive_seed(seed, key), memory_mb=memory_mb,
+                                      deduplicator=deduplicator, source=key, output_format=output_format)
+        return output_file_path
+
+    def stream_one_billion(key, link):
+        if finished(key, link):
+            return output_directory
+        item = DownloadItem(key, link, os.path.join(archive_folder, f"{key}.rar"))
+        if manifest.is_extracted(key) and not os.path.exists(item.output_path):
+            # Extracted by an earlier run whose files are gone since: the deleted archive is needed again
+            manifest.forget(key)
+        download_item(item, manifest)
+        outputs = []
+        for member_name, member in iter_rar_members(item.output_path, suffix=".xml"):
+            base_name = os.path.splitext(os.path.basename(member_name))[0]
+            output_file_path = os.path.join(output_directory, f"extracted_{base_name}.txt")
+            with io.TextIOWrapper(member, encoding="utf-8") as f_in:
+                write_text_blocks(f_in, f"{output_file_path}.part")
+            os.replace(f"{output_file_path}.part", output_file_path)
+            outputs.append(output_file_path)
+        manifest.record_outputs(key, link, outputs)
+        if not cache_folder:
+            manifest.mark_extracted(key)
+            os.remove(item.output_path)
+        return output_directory
+
+    tasks = []
+    for key, link in named_links(links["links_one_billion"], "one_billion").items():
+        tasks.append((stream_one_billion, key, link))
+    for key, link in named_links(links["xml_links"], "compressed").items():
+        tasks.append((stream_xml, key, link))
+    for key, link in named_links(links["text_links"], "text_file").items():
+        tasks.append((stream_text, key, link))
+
+    log_event(f"Starting streaming of {len(tasks)} datasets with {max_workers} workers")
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(task, key, link): key for task, key, link in tasks}
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                message = f"Streamed dataset: {key} -> {future.result()}"
+                results[key] = "processed"
+            except Exception as e:
+                message = f"❌ Failed to stream dataset {key}: {e}"
+                results[key] = "failed"
+            print(message)
+            log_event(message)
+    return results
+
 ###################################################################################################################################
 ###################################################################################################################################
 ###################################################################################################################################
@@ -238,44 +237,52 @@ def process_compressed_xml_links(links, output_folder):
 ###################################################################################################################################
 ###################################################################################################################################
 
-def remove_files(directory, file_extension):
+def remove_files(directory, file_extension, keep=()):
     """
-    Removes all files with the given extension in the specified directory.
+    Removes all files with the given extension in the specified directory, except the paths in keep.
     """
     for file in os.listdir(directory):
         file_path = os.path.join(directory, file)
-        if file.endswith(file_extension) and os.path.isfile(file_path):
+        if file.endswith(file_extension) and os.path.isfile(file_path) and file_path not in keep:
             os.remove(file_path)
             message = f"Removed {file_path}"
             print(message)
             log_event(message)
 
-def extract_text_blocks_from_directory(input_directory, output_directory):
+def write_text_blocks(f_in, output_file_path):
+    """
+    Writes every <Text> block of an open XML text stream to output_file_path.
+    Blocks are scanned incrementally, so memory is bounded by the largest block rather than the file size.
+    """
+    with open(output_file_path, 'w', encoding='utf-8') as f_out:
+        for match in iter_text_blocks(f_in):
+            cleaned_text = match.strip()
+            f_out.write(f"\n{cleaned_text}\n\n")
+
+def extract_text_blocks_from_file(xml_file_path, output_file_path):
+    with open(xml_file_path, 'r', encoding='utf-8') as f_in:
+        write_text_blocks(f_in, output_file_path)
+
+    message = f"Extracted text written to: {output_file_path}"
+    print(message)
+    log_event(f"Extracted text from {xml_file_path} to {output_file_path}")
+
+def extract_text_blocks_from_directory(input_directory, output_directory, workers=None):
     """
     Extracts <Text> blocks from XML files in input_directory and writes them as .txt files in output_directory.
+    Files are independent and are processed in parallel on `workers` processes (default: all cores).
     """
     os.makedirs(output_directory, exist_ok=True)
-    pattern = re.compile(r"<Text>(.*?)</Text>", flags=re.DOTALL)
 
-    for filename in os.listdir(input_directory):
+    tasks = []
+    for filename in sorted(os.listdir(input_directory)):
         if filename.lower().endswith(".xml"):
             xml_file_path = os.path.join(input_directory, filename)
             base_name, _ = os.path.splitext(filename)
             output_file_path = os.path.join(output_directory, f"extracted_{base_name}.txt")
+            tasks.append((xml_file_path, output_file_path))
 
-            with open(xml_file_path, 'r', encoding='utf-8') as f_in:
-                content = f_in.read()
-
-            matches = pattern.findall(content)
-
-            with open(output_file_path, 'w', encoding='utf-8') as f_out:
-                for idx, match in enumerate(matches, start=1):
-                    cleaned_text = match.strip()
-                    f_out.write(f"\n{cleaned_text}\n\n")
-
-            message = f"Extracted text written to: {output_file_path}"
-            print(message)
-            log_event(f"Extracted text from {xml_file_path} to {output_file_path}")
+    run_sharded(extract_text_blocks_from_file, tasks, workers)
 
 ###################################################################################################################################
 ###################################################################################################################################
@@ -287,83 +294,146 @@ def extract_text_blocks_from_directory(input_directory, output_directory):
 ###################################################################################################################################
 ###################################################################################################################################
 
-def contains_english_word(line):
-    """Checks if a line contains any English words."""
-    return bool(re.search(r"\b[a-zA-Z]+\b", line))
+def split_text_line(original_line, pattern, dropped=None):
+    """
+    Strips an "N:N:" prefix, drops lines with English words or fewer than 10 words,
+    and splits the rest 70/30 into (sentence_a, sentence_b). Returns None for dropped lines,
+    counting the filter that dropped them in the dropped Counter if one is given.
+    """
+    modified_line = original_line
+    if pattern.match(original_line):
+        first_colon = original_line.find(":")
+        second_colon = original_line.find(":", first_colon + 1)
+        if second_colon != -1:
+            modified_line = original_line[second_colon + 1:].strip()
+    if contains_english_word(modified_line):
+        if dropped is not None:
+            dropped["english_word"] += 1
+        return None
+    words = modified_line.split()
+    word_count = len(words)
+    if word_count < 10:
+        if dropped is not None:
+            dropped["too_short"] += 1
+        return None
+    split_point = int(word_count * 0.7)
+    sentence_a = " ".join(words[:split_point])
+    sentence_b = " ".join(words[split_point:])
+    return sentence_a, sentence_b
 
-def process_and_balance_text_files(input_directory, output_directory):
+def process_and_balance_lines(lines, output_file_path, seed=None, memory_mb=256, deduplicator=None, source="default",
+                              output_format="csv"):
     """
-    Processes text files: extracts, filters, splits, balances and shuffles data.
+    Filters, splits, dedups, balances and shuffles an iterable of text lines into output_file_path.
+    Pass a shared Deduplicator to drop lines already seen in other files or datasets.
     """
-    os.makedirs(output_directory, exist_ok=True)
     pattern = re.compile(r"^\d+:\d+:.+")
-
-    for file_name in os.listdir(input_directory):
-        if file_name.endswith(".txt"):
-            input_file_path = os.path.join(input_directory, file_name)
-            output_file_path = os.path.join(output_directory, f"balanced_processed_{file_name}")
-
-            with open(input_file_path, "r", encoding="utf-8") as infile:
-                lines = infile.readlines()
-
-            processed_lines = []
-            seen_lines = set()
-            processed_lines.append(["sentence_a", "sentence_b", "Label"])
-
-            for line in lines:
-                original_line = line.strip()
-                if original_line in seen_lines:
-                    continue
-                seen_lines.add(original_line)
-                modified_line = original_line
-                if pattern.match(original_line):
-                    first_colon = original_line.find(":")
-                    second_colon = original_line.find(":", first_colon + 1)
-                    if second_colon != -1:
-                        modified_line = original_line[second_colon + 1:].strip()
-                if contains_english_word(modified_line):
-                    continue
-                words = modified_line.split()
-                word_count = len(words)
-                if word_count < 10:
-                    continue
-                split_point = int(word_count * 0.7)
-                sentence_a = " ".join(words[:split_point])
-                sentence_b = " ".join(words[split_point:])
-                processed_lines.append([sentence_a, sentence_b, "1"])
-
-            processed_lines = balance_and_shuffle_labels_text(processed_lines)
-
-            with open(output_file_path, "w", encoding="utf-8") as outfile:
-                for row in processed_lines:
-                    outfile.write(",".join(row) + "\n")
-            message = f"Processed and balanced text file: {file_name} -> {output_file_path}"
-            print(message)
-            log_event(message)
-
-def balance_and_shuffle_labels_text(data):
+    deduplicator = deduplicator or Deduplicator()
+
+    def pairs():
+        lines_read = 0
+        dropped = Counter()
+        for line in lines:
+            lines_read += 1
+            row = split_text_line(line.strip(), pattern, dropped)
+            if row:
+                if deduplicator.check(f"{row[0]} {row[1]}", source):
+                    yield row
+                else:
+                    dropped["duplicate"] += 1
+        add_rows(rows_in=lines_read)
+        add_dropped(dropped)
+
+    balance_and_shuffle_labels_text(pairs(), output_file_path, seed=seed, memory_mb=memory_mb,
+                                    output_format=output_format, source=source)
+
+def filter_text_shard(shard, part_path, min_hasher=None):
     """
-    Balances and shuffles data by modifying half of the rows to have unrelated sentence_b with label 0.
+    Process-pool worker: filters and splits the lines of one byte-range shard into part_path as
+    "content_hash<TAB>band_keys<TAB>sentence_a<TAB>sentence_b" rows. Both sentences are space-joined words,
+    so they never contain tabs. Hashing (and MinHash-LSH band keys when min_hasher is given) happens here,
+    in parallel, so the merge only has to look the keys up.
     """
-    header = data[0]
-    data = data[1:]
-    random.shuffle(data)
-    total_lines = len(data)
-    num_lines_label_0 = total_lines // 2
-
-    for idx in range(num_lines_label_0):
-        sentence_a, sentence_b, label = data[idx]
-        random_idx = random.choice([i for i in range(len(data)) if i != idx])
-        data[idx][1] = data[random_idx][1]
-        data[idx][2] = "0"
-
-    for idx in range(num_lines_label_0, total_lines):
-        data[idx][2] = "1"
+    pattern = re.compile(r"^\d+:\d+:.+")
+    lines_read = 0
+    dropped = Counter()
+    with open(part_path, "w", encoding="utf-8") as part_file:
+        for line in iter_shard_lines(shard):
+            lines_read += 1
+            row = split_text_line(line.strip(), pattern, dropped)
+            if row:
+                content = f"{row[0]} {row[1]}"
+                band_keys = ",".join(f"{key:x}" for key in min_hasher.band_keys(content)) if min_hasher else ""
+                part_file.write(f"{content_hash(content):x}\t{band_keys}\t{row[0]}\t{row[1]}\n")
+    add_rows(rows_in=lines_read)
+    add_dropped(dropped)
+    return part_path
+
+def merged_shard_pairs(part_paths, deduplicator, source):
+    """
+    Yields the (sentence_a, sentence_b) rows of a file's shard parts in order, dropping duplicates,
+    and deletes each part once read.
+    """
+    duplicates = 0
+    for part_path in part_paths:
+        with open(part_path, "r", encoding="utf-8") as part_file:
+            for row in part_file:
+                line_hash, band_keys, sentence_a, sentence_b = row.rstrip("\n").split("\t")
+                band_keys = [int(key, 16) for key in band_keys.split(",")] if band_keys else None
+                if deduplicator.check_hashes(int(line_hash, 16), band_keys, source):
+                    yield sentence_a, sentence_b
+                else:
+                    duplicates += 1
+        os.remove(part_path)
+    add_dropped({"duplicate": duplicates})
+
+def process_and_balance_text_files(input_directory, output_directory, workers=None, shard_bytes=64 * 1024 * 1024,
+                                   seed=None, memory_mb=256, deduplicator=None, output_format="csv"):
+    """
+    Processes text files: extracts, filters, splits, dedups, balances and shuffles data.
+    Files are cut into shard_bytes line-aligned shards that are filtered on `workers` processes
+    (default: all cores); the shards of each file are then merged in file order.
+    Duplicates are dropped across all files by deduplicator (default: exact 64-bit hashes in memory);
+    share one Deduplicator between stages to dedup across datasets too.
+    With seed, every file is balanced with its own seed derived from it, so reruns are reproducible.
+    The shuffle runs out of core within about memory_mb, so files of any size can be balanced.
+    output_format ("csv" or "parquet") selects the format of the balanced outputs.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    deduplicator = deduplicator or Deduplicator()
+
+    file_names = [file_name for file_name in sorted(os.listdir(input_directory)) if file_name.endswith(".txt")]
+    input_paths = {os.path.join(input_directory, file_name): file_name for file_name in file_names}
+    parts_by_file = {file_name: [] for file_name in file_names}
+    tasks = []
+    for shard in plan_shards(input_paths, shard_bytes):
+        file_name = input_paths[shard.path]
+        part_path = shard_part_path(os.path.join(output_directory, f"balanced_processed_{file_name}"), shard)
+        parts_by_file[file_name].append(part_path)
+        tasks.append((shard, part_path, deduplicator.min_hasher))
+
+    run_sharded(filter_text_shard, tasks, workers)
+
+    for file_name in file_names:
+        output_file_path = pairs_path(os.path.join(output_directory, f"balanced_processed_{file_name}"), output_format)
+        pairs = merged_shard_pairs(parts_by_file[file_name], deduplicator, file_name)
+        balance_and_shuffle_labels_text(pairs, output_file_path, seed=derive_seed(seed, file_name),
+                                        memory_mb=memory_mb, output_format=output_format, source=file_name)
+        message = f"Processed and balanced text file: {file_name} -> {output_file_path}"
+        print(message)
+        log_event(message)
 
-    random.shuffle(data)
-    data.insert(0, header)
-    log_event(f"Balanced and shuffled dataset with {total_lines} records")
-    return data
+def balance_and_shuffle_labels_text(pairs, output_file_path, seed=None, memory_mb=256, output_format="csv", source=""):
+    """
+    Balances and shuffles (sentence_a, sentence_b) pairs into a CSV or Parquet file by giving half of the rows
+    an unrelated sentence_b with label 0. Streams through an external shuffle bounded by memory_mb;
+    pass seed for a reproducible result.
+    """
+    total_lines = balance_pairs(pairs, output_file_path, "sentence_a,sentence_b,Label", seed=seed,
+                                memory_bytes=memory_mb * 1024 * 1024, output_format=output_format, source=source)
+    add_rows(rows_out=total_lines)
+    log_event(f"Balanced and shuffled dataset with {total_lines} records", stage="balance", rows=total_lines,
+              source=source)
 
 ###################################################################################################################################
 ###################################################################################################################################
@@ -375,41 +445,39 @@ def balance_and_shuffle_labels_text(data):
 ###################################################################################################################################
 ###################################################################################################################################
 
-def extract_arabic_sentences(text):
+def iter_xml_sentences(xml_source):
     """
-    Extracts meaningful Arabic sentences from text.
+    Streaming stage: yields the Arabic sentences of every <text> element of an XML path or binary stream.
     """
-    arabic_sentence_pattern = r'[ء-ي\s،.؛]+'
-    sentences = re.findall(arabic_sentence_pattern, text)
-    meaningful_sentences = [sentence.strip() for sentence in sentences if len(sentence.strip().split()) >= 10]
-    return meaningful_sentences
+    for text in iter_xml_texts(xml_source):
+        if text.strip():
+            yield from extract_arabic_sentences(text)
+
+def write_xml_sentences(xml_source, output_file_path):
+    """
+    Writes the Arabic sentences of every <text> element of an XML path or binary stream to output_file_path.
+    """
+    with open(output_file_path, "w", encoding="utf-8") as output_file:
+        for sentence in iter_xml_sentences(xml_source):
+            output_file.write(sentence + "\n")
+
+def sentence_lines(sentences):
+    """
+    Streaming stage: yields the lines an "extracted_" file of these sentences would be read back as
+    (sentences may span several lines; blank lines inside them separate paragraphs).
+    """
+    for sentence in sentences:
+        yield from sentence.replace("\r\n", "\n").replace("\r", "\n").split("\n")
 
 def process_xml_file(input_file_path, output_file_path):
     """
     Parses an XML file, extracts Arabic sentences, and saves them in a .txt file.
     """
-    with open(output_file_path, "w", encoding="utf-8") as output_file:
-        context = ET.iterparse(input_file_path, events=("start", "end"))
-        for event, elem in context:
-            if event == "end" and elem.tag.endswith("text"):
-                text = elem.text if elem.text else ""
-                if text.strip():
-                    sentences = extract_arabic_sentences(text)
-                    for sentence in sentences:
-                        output_file.write(sentence + "\n")
-                elem.clear()
+    write_xml_sentences(input_file_path, output_file_path)
     message = f"Processed XML file: {input_file_path} -> {output_file_path}"
     print(message)
     log_event(message)
 
-def clean_text(text):
-    """
-    Cleans Arabic text.
-    """
-    text = re.sub(r'[.,;،؛]', '', text)
-    text = re.sub(r'\s+', ' ', text).strip()
-    return text
-
 def split_sentence(sentence):
     """
     Splits a sentence into two parts: 70% and 30%.
@@ -419,71 +487,49 @@ def split_sentence(sentence):
     sentence_b = sentence[split_index:].strip()
     return sentence_a, sentence_b
 
+def structured_pairs(lines):
+    """
+    Streaming stage: joins blank-line-separated paragraphs of lines, cleans them and yields the
+    (sentence_a, sentence_b) 70/30 split of every paragraph of at least 10 words.
+    """
+    paragraphs_read = short = 0
+    for paragraph in paragraphs(lines):
+        paragraphs_read += 1
+        cleaned_sentence = clean_text(paragraph)
+        if len(cleaned_sentence.split()) >= 10:
+            yield split_sentence(cleaned_sentence)
+        else:
+            short += 1
+    add_rows(rows_in=paragraphs_read)
+    add_dropped({"short_paragraph": short})
+
 def process_text_file(input_file_path, output_file_path):
     """
     Reads a text file (from process_xml_file), processes Arabic sentences, and saves CSV-style output.
     """
-    sentences = []
-    with open(input_file_path, "r", encoding="utf-8") as file:
-        buffer = []
-        for line in file:
-            line = line.strip()
-            if line:
-                buffer.append(line)
-            else:
-                if buffer:
-                    full_sentence = " ".join(buffer)
-                    cleaned_sentence = clean_text(full_sentence)
-                    if len(cleaned_sentence.split()) >= 10:
-                        sentence_a, sentence_b = split_sentence(cleaned_sentence)
-                        sentences.append((sentence_a, sentence_b, "1"))
-                    buffer = []
-        if buffer:
-            full_sentence = " ".join(buffer)
-            cleaned_sentence = clean_text(full_sentence)
-            if len(cleaned_sentence.split()) >= 10:
-                sentence_a, sentence_b = split_sentence(cleaned_sentence)
-                sentences.append((sentence_a, sentence_b, "1"))
-
-    with open(output_file_path, "w", encoding="utf-8") as output_file:
-        for sentence_a, sentence_b, label in sentences:
-            output_file.write(f"{sentence_a},{sentence_b},{label}\n")
+    with open(input_file_path, "r", encoding="utf-8") as file, \
+            open(output_file_path, "w", encoding="utf-8", newline="") as output_file:
+        writer = csv.writer(output_file, lineterminator="\n")
+        for sentence_a, sentence_b in structured_pairs(file):
+            writer.writerow((sentence_a, sentence_b, "1"))
     message = f"Processed text file: {input_file_path} -> {output_file_path}"
     print(message)
     log_event(message)
 
-def balance_and_shuffle_labels(input_file_path, output_file_path):
+def balance_and_shuffle_labels(input_file_path, output_file_path, seed=None, memory_mb=256, output_format="csv"):
     """
-    Balances and shuffles CSV-formatted data.
+    Balances and shuffles CSV-formatted data out of core within about memory_mb (see negative_sampling.balance_csv_file),
+    writing it as CSV or Parquet according to output_format.
     """
-    with open(input_file_path, mode="r", encoding="utf-8") as file:
-        lines = file.readlines()
-
-    data = [line.strip().split(",") for line in lines if len(line.strip().split(",")) == 3]
-    random.shuffle(data)
-    total_lines = len(data)
-    num_lines_label_0 = total_lines // 2
-
-    for idx in range(num_lines_label_0):
-        sentence_a, old_b, old_label = data[idx]
-        random_idx = random.choice([i for i in range(len(data)) if i != idx])
-        data[idx][1] = data[random_idx][1]
-        data[idx][2] = "0"
-
-    for idx in range(num_lines_label_0, total_lines):
-        data[idx][2] = "1"
-
-    random.shuffle(data)
-
-    with open(output_file_path, mode="w", encoding="utf-8") as file:
-        file.write("sentence_a,sentence_b,label\n")
-        for row in data:
-            file.write(",".join(row) + "\n")
+    total_lines = balance_csv_file(input_file_path, output_file_path, "sentence_a,sentence_b,label", seed=seed,
+                                   memory_bytes=memory_mb * 1024 * 1024, output_format=output_format,
+                                   source=os.path.basename(input_file_path))
+    add_rows(rows_out=total_lines)
     message = f"Balanced and shuffled labels for file: {input_file_path} -> {output_file_path}"
     print(message)
     log_event(message)
 
-def process_directory(input_directory, output_directory):
+def process_directory(input_directory, output_directory, workers=None, seed=None, memory_mb=256, output_format="csv"):
     """
     Full XML pipeline:
         1) Extract text from each .xml into an "extracted_" file.
@@ -491,21 +537,25 @@ def process_directory(input_directory, output_directory):
         3) Delete the intermediate extracted files.
         4) Balance and shuffle each structured file into a "label_processed_" file.
         5) Delete the structured files.
+    Within each step the files are independent and run in parallel on `workers` processes (default: all cores).
+    With seed, step 4 balances every file with its own seed derived from it, so reruns are reproducible;
+    its shuffle runs out of core within about memory_mb per worker.
+    output_format ("csv" or "parquet") selects the format of the "label_processed_" files.
     """
     os.makedirs(output_directory, exist_ok=True)
 
-    extracted_files = []
-    for file_name in os.listdir(input_directory):
+    tasks = []
+    for file_name in sorted(os.listdir(input_directory)):
         if file_name.endswith(".xml"):
             xml_path = os.path.join(input_directory, file_name)
             base_name = os.path.splitext(file_name)[0]
             extracted_name = f"extracted_{base_name}.txt"
             extracted_path = os.path.join(output_directory, extracted_name)
+            tasks.append((xml_path, extracted_path))
+    run_sharded(process_xml_file, tasks, workers)
+    extracted_files = [extracted_path for _, extracted_path in tasks]
 
-            process_xml_file(xml_path, extracted_path)
-            extracted_files.append(extracted_path)
-
-    structured_files = []
+    tasks = []
     for file_name in os.listdir(output_directory):
         if file_name.startswith("extracted_") and file_name.endswith(".txt"):
             base_name = file_name.replace("extracted_", "")
@@ -513,9 +563,9 @@ def process_directory(input_directory, output_directory):
             extracted_path = os.path.join(output_directory, file_name)
             structured_name = f"structured_{base_name}.txt"
             structured_path = os.path.join(output_directory, structured_name)
-
-            process_text_file(extracted_path, structured_path)
-            structured_files.append(structured_path)
+            tasks.append((extracted_path, structured_path))
+    run_sharded(process_text_file, tasks, workers)
+    structured_files = [structured_path for _, structured_path in tasks]
 
     for extracted_path in extracted_files:
         try:
@@ -526,17 +576,16 @@ def process_directory(input_directory, output_directory):
             print(f"❌ {error_message}")
             log_event(error_message)
 
-    label_processed_files = []
+    tasks = []
     for file_name in os.listdir(output_directory):
         if file_name.startswith("structured_") and file_name.endswith(".txt"):
             base_name = file_name.replace("structured_", "")
             base_name = os.path.splitext(base_name)[0]
             structured_path = os.path.join(output_directory, file_name)
             label_processed_name = f"label_processed_{base_name}.txt"
-            label_processed_path = os.path.join(output_directory, label_processed_name)
-
-            balance_and_shuffle_labels(structured_path, label_processed_path)
-            label_processed_files.append(label_processed_path)
+            label_processed_path = pairs_path(os.path.join(output_directory, label_processed_name), output_format)
+            tasks.append((structured_path, label_processed_path, derive_seed(seed, file_name), memory_mb, output_format))
+    run_sharded(balance_and_shuffle_labels, tasks, workers)
 
     for structured_path in structured_files:
         try:
@@ -547,6 +596,62 @@ def process_directory(input_directory, output_directory):
             print(f"❌ {error_message}")
             log_event(error_message)
 
+def process_directory_fused(input_directory, output_directory, pool, seed=None, memory_mb=256, batch_size=5,
+                            max_chunks=2, debug_dir=None, materialize=(), output_format="csv"):
+    """
+    Single-pass version of process_directory followed by segmentation. For every .xml file, extraction, cleaning,
+    splitting, balancing and segmentation run as fused streaming stages:
+        XML -> "extracted" lines -> "structured" pairs -> "label_processed" rows -> segmented CSV chunks
+    so no extracted_, structured_ or label_processed_ file is written; the only disk traffic besides the
+    XML and the final "segmented_xml_{name}_batch_{n}.csv" chunks is the balancing shuffle's temp buckets.
+    "extracted_" files already in output_directory (streamed XML datasets, One Billion text blocks) enter the
+    same stages at "structured" and are deleted afterwards, as process_directory does.
+    batch_size and max_chunks are the chunk limits Segmenting_data uses. Name stages in materialize
+    (or pass True) to also write their output to debug_dir as "{name}_{stage}.txt" for inspection.
+    output_format ("csv" or "parquet") selects the format of the segmented chunks.
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    debug_dir = debug_dir or output_directory
+
+    def run_fused(source, base_name, from_xml):
+        balance_seed = derive_seed(seed, f"structured_{base_name}.txt")
+        stages = [
+            ("structured", structured_pairs),
+            ("label_processed", lambda pairs: iter_balanced_rows(
+                pairs, seed=balance_seed, memory_bytes=memory_mb * 1024 * 1024, work_dir=output_directory)),
+            ("segmented", lambda rows: segment_rows(((a, b, label, None) for a, b, label in rows), pool)),
+        ]
+        if from_xml:
+            stages.insert(0, ("extracted", sentence_lines))
+        rows = run_stages(source, stages, debug_dir, materialize, prefix=f"{base_name}_")
+        output_base = os.path.join(output_directory, f"segmented_xml_{base_name}")
+        write_segmented_chunks(rows, output_base, ["sentence_a", "sentence_b", "label"], batch_size, max_chunks,
+                               output_format=output_format, source=base_name)
+        rows.close()
+        return output_base
+
+    extracted_files = [file_name for file_name in sorted(os.listdir(output_directory))
+                       if file_name.startswith("extracted_") and file_name.endswith(".txt")]
+
+    for file_name in sorted(os.listdir(input_directory)):
+        if not file_name.endswith(".xml"):
+            continue
+        xml_path = os.path.join(input_directory, file_name)
+        output_base = run_fused(iter_xml_sentences(xml_path), os.path.splitext(file_name)[0], from_xml=True)
+        message = f"Processed and segmented XML file in one pass: {xml_path} -> {output_base}_batch_*"
+        print(message)
+        log_event(message)
+
+    for file_name in extracted_files:
+        extracted_path = os.path.join(output_directory, file_name)
+        base_name = os.path.splitext(file_name.replace("extracted_", ""))[0]
+        with open(extracted_path, "r", encoding="utf-8") as extracted_file:
+            output_base = run_fused(extracted_file, base_name, from_xml=False)
+        os.remove(extracted_path)
+        message = f"Processed and segmented extracted file in one pass: {extracted_path} -> {output_base}_batch_*"
+        print(message)
+        log_event(message)
+
 ###################################################################################################################################
 ###################################################################################################################################
 ###################################################################################################################################
@@ -557,94 +662,184 @@ def process_directory(input_directory, output_directory):
 ###################################################################################################################################
 ###################################################################################################################################
 
-def safe_segment(segmenter, text):
+def write_segmented_chunk_end(outfile, output_file, chunk_number, rows_in_chunk, final=False):
+    outfile.close()
+    label = "Final Chunk" if final else "Chunk"
+    message = f"Segmented {'final chunk' if final else 'batch'} {chunk_number} with {rows_in_chunk} rows to {output_file}"
+    print(f"\nDEBUG: --- {label} {chunk_number} ---")
+    print(f"DEBUG: Processing {rows_in_chunk} rows")
+    print(f"DEBUG: {message}\n")
+    add_rows(rows_out=rows_in_chunk)
+    log_event(message, stage="segment", rows=rows_in_chunk, chunk=chunk_number, output=output_file)
+
+def segment_rows(rows, pool):
     """
-    Attempts to segment text using Farasa.
+    Streaming stage: segments both sentences of (sentence_a, sentence_b, label, *extra) rows through the
+    SegmentationPool and yields (segmented_a, segmented_b, label, *extra), dropping rows Farasa fails on.
     """
+    # Rows whose sentences are in flight in the pool, in input order
+    pending = deque()
+
+    def sentences():
+        for row in rows:
+            pending.append(row)
+            yield row[0]
+            yield row[1]
+
+    segmented = pool.segment_stream(sentences())
+    failed = 0
     try:
-        return segmenter.segment(text)
-    except UnicodeDecodeError as e:
-        error_message = f"UnicodeDecodeError while segmenting text: {text[:30]}... Error: {e}"
-        print(error_message)
-        log_event(error_message)
-        return None
+        for segmented_a in segmented:
+            segmented_b = next(segmented)
+            row = pending.popleft()
+            if segmented_a is None or segmented_b is None:
+                failed += 1
+                continue
+            yield (segmented_a, segmented_b, *row[2:])
+    finally:
+        segmented.close()
+        add_dropped({"segmentation_failed": failed})
 
-def apply_segmentation_to_file(input_file, output_base, segmenter, batch_size=100000, max_chunks=1000000):
+def write_segmented_chunks(rows, output_base, header, batch_size=100000, max_chunks=1000000, chunk_number=1,
+                           checkpoint=None, output_format="csv", source=""):
     """
-    Reads a CSV-formatted text file and processes rows in batches, applying Farasa segmentation.
+    Sink: writes (segmented_a, segmented_b, label, end_offset) rows into "{output_base}_batch_{n}.csv" files
+    (or ".parquet" files tagged with source) of batch_size rows each, starting at chunk_number.
+    With a FileCheckpoint, the end_offset of each completed chunk's last row is saved so the input can be
+    resumed after it. Returns the last chunk number.
     """
-    with open(input_file, "r", encoding="utf-8") as infile:
-        lines = [line.strip() for line in infile if line.strip()]
-
-    if not lines:
-        message = f"No data found in {input_file}."
-        print(message)
-        log_event(message)
-        return
-
-    header = lines[0].split(',')
-    data_lines = lines[1:]
-    batch = []
-    chunk_number = 1
-
-    log_event(f"Starting segmentation for file: {input_file}")
-    for line in data_lines:
-        row = line.split(',')
-        if len(row) < 3:
-            continue
-        sentence_a, sentence_b, label = row[0], row[1], row[2]
-        segmented_a = safe_segment(segmenter, sentence_a)
-        segmented_b = safe_segment(segmenter, sentence_b)
-        if segmented_a is None or segmented_b is None:
-            continue
-        batch.append([segmented_a, segmented_b, label])
-        if len(batch) >= batch_size:
-            output_file = f"{output_base}_batch_{chunk_number}.csv"
-            with open(output_file, "w", encoding="utf-8", newline='') as outfile:
+    outfile = writer = None
+    rows_in_chunk = 0
+    for segmented_a, segmented_b, label, end_offset in rows:
+        if outfile is None:
+            output_file = pairs_path(f"{output_base}_batch_{chunk_number}.csv", output_format)
+            if output_format == "parquet":
+                outfile = writer = ParquetPairWriter(output_file, source=source,
+                                                     row_group_size=min(batch_size, DEFAULT_ROW_GROUP_SIZE))
+            else:
+                outfile = open(output_file, "w", encoding="utf-8", newline='')
                 writer = csv.writer(outfile)
                 writer.writerow(header)
-                writer.writerows(batch)
-            message = f"Segmented batch {chunk_number} with {len(batch)} rows to {output_file}"
-            print(f"\nDEBUG: --- Chunk {chunk_number} ---")
-            print(f"DEBUG: Processing {len(batch)} rows")
-            print(f"DEBUG: {message}\n")
-            log_event(message)
-            batch = []
+        writer.writerow([segmented_a, segmented_b, label])
+        rows_in_chunk += 1
+        if rows_in_chunk >= batch_size:
+            write_segmented_chunk_end(outfile, output_file, chunk_number, rows_in_chunk)
+            outfile = None
+            rows_in_chunk = 0
             chunk_number += 1
+            if checkpoint:
+                checkpoint.save(offset=end_offset, chunk_number=chunk_number, done=False)
             if chunk_number > max_chunks:
                 message = f"Reached maximum chunk limit ({max_chunks}). Stopping further processing."
                 print(message)
                 log_event(message)
-                break
-
-    if batch and chunk_number <= max_chunks:
-        output_file = f"{output_base}_batch_{chunk_number}.csv"
-        with open(output_file, "w", encoding="utf-8", newline='') as outfile:
-            writer = csv.writer(outfile)
-            writer.writerow(header)
-            writer.writerows(batch)
-        message = f"Segmented final chunk {chunk_number} with {len(batch)} rows to {output_file}"
-        print(f"\nDEBUG: --- Final Chunk {chunk_number} ---")
-        print(f"DEBUG: Processing {len(batch)} rows")
-        print(f"DEBUG: {message}\n")
+                return chunk_number
+
+    if outfile is not None:
+        write_segmented_chunk_end(outfile, output_file, chunk_number, rows_in_chunk, final=True)
+    return chunk_number
+
+def apply_segmentation_to_file(input_file, output_base, pool, batch_size=100000, max_chunks=1000000,
+                               output_format="csv"):
+    """
+    Streams a CSV-formatted text file (or a ".parquet" pair file) through Farasa segmentation into
+    batch_size-row chunks in output_format. CSV records are parsed by one csv.reader over the file, so quoted
+    sentences may contain commas and line breaks. Rows are read, segmented (through the SegmentationPool) and
+    written incrementally, so memory does not grow with the file.
+    After each completed chunk the position of its last row (byte offset after the record for CSV, row number
+    for Parquet) is checkpointed in "{output_base}.checkpoint.json"; a killed job resumes from there, rewriting only the
+    unfinished chunk.
+    """
+    checkpoint = FileCheckpoint(f"{output_base}.checkpoint.json", input_file)
+    state = checkpoint.load(chunk_number=1)
+    if state["done"]:
+        message = f"Segmentation of {input_file} already completed, skipping."
+        print(message)
         log_event(message)
+        return
+    source = os.path.basename(input_file)
+
+    if input_file.endswith(".parquet"):
+        if state["offset"]:
+            log_event(f"Resuming segmentation of {input_file} at row {state['offset']}, chunk {state['chunk_number']}")
+        log_event(f"Starting segmentation for file: {input_file}")
+        segmented = segment_rows(counted_rows(iter_parquet_pairs(input_file, start_row=state["offset"])), pool)
+        chunk_number = write_segmented_chunks(segmented, output_base, ["sentence_a", "sentence_b", "label"],
+                                              batch_size, max_chunks, state["chunk_number"], checkpoint,
+                                              output_format, source)
+        segmented.close()
+        checkpoint.save(offset=state["offset"], chunk_number=chunk_number, done=True)
+        return
 
-def Segmenting_data(output_directory):
-    farasa_segmenter = FarasaSegmenter(interactive=False)
-    file_number = 0
-    for file_name in os.listdir(output_directory):
-        if ((file_name.startswith("balanced_processed_") or file_name.startswith("label_processed_"))
-            and file_name.endswith(".txt")):
-            input_file_path = os.path.join(output_directory, file_name)
-            output_base = os.path.join(output_directory, f"segmented_{file_number}")
-            file_number += 1
-            message = f"Processing segmentation for file: {file_name}"
-            print(f"\nDEBUG: {message}")
-            log_event(message)
-            apply_segmentation_to_file(input_file_path, output_base, farasa_segmenter, batch_size=5, max_chunks=2)
-            message = f"Completed segmentation for file: {file_name}"
-            print(f"DEBUG: {message}")
+    with open(input_file, "rb") as infile:
+        records = iter_csv_records_with_offsets(infile)
+        header, header_end = next(records, ([], 0))
+        if not any(field.strip() for field in header):
+            message = f"No data found in {input_file}."
+            print(message)
             log_event(message)
+            return
+        if state["offset"] > header_end:
+            infile.seek(state["offset"])
+            records = iter_csv_records_with_offsets(infile)
+            log_event(f"Resuming segmentation of {input_file} at byte {state['offset']}, chunk {state['chunk_number']}")
+
+        def rows():
+            for row, end_offset in records:
+                if len(row) >= 3:
+                    yield row[0], row[1], row[2], end_offset
+
+        log_event(f"Starting segmentation for file: {input_file}")
+        segmented = segment_rows(counted_rows(rows()), pool)
+        chunk_number = write_segmented_chunks(segmented, output_base, header, batch_size, max_chunks,
+                                              state["chunk_number"], checkpoint, output_format, source)
+        segmented.close()
+
+    checkpoint.save(offset=os.path.getsize(input_file), chunk_number=chunk_number, done=True)
+
+@contextmanager
+def segmentation_pool(segmenter_workers=4, sentences_per_call=500, segmenter="farasa", cache_path=None):
+    """
+    Opens a SegmentationPool of segmenter_workers Farasa processes, sentences_per_call sentences per Farasa call.
+    segmenter="stub" runs the pipeline without the JVM. With cache_path, segmentations are kept in a persistent
+    SegmentationCache so repeated sentences and reruns skip Farasa; its hit rate is logged on exit.
+    """
+    cache = SegmentationCache(cache_path, namespace=segmenter) if cache_path else None
+    try:
+        with SegmentationPool(segmenter_workers, sentences_per_call, kind=segmenter, cache=cache) as pool:
+            yield pool
+    finally:
+        if cache:
+            stats = cache.stats()
+            message = (f"Segmentation cache: {stats['lookups']} lookups, {stats['memory_hits']} memory hits, "
+                       f"{stats['disk_hits']} disk hits, {stats['misses']} misses ({stats['hit_rate']:.1%} hit rate)")
+            print(message)
+            log_event(message, stage="segment", **stats)
+            cache.close()
+
+def Segmenting_data(output_directory, segmenter_workers=4, sentences_per_call=500, segmenter="farasa", cache_path=None,
+                    output_format="csv"):
+    """
+    Segments every balanced/label processed file (CSV ".txt" or ".parquet") through a segmentation_pool
+    (see its parameters) into chunks in output_format.
+    """
+    file_number = 0
+    with segmentation_pool(segmenter_workers, sentences_per_call, segmenter, cache_path) as pool:
+        # Sorted, so every file keeps its segmented_N name (and checkpoint) across resumed runs
+        for file_name in sorted(os.listdir(output_directory)):
+            if ((file_name.startswith("balanced_processed_") or file_name.startswith("label_processed_"))
+                and file_name.endswith((".txt", ".parquet"))):
+                input_file_path = os.path.join(output_directory, file_name)
+                output_base = os.path.join(output_directory, f"segmented_{file_number}")
+                file_number += 1
+                message = f"Processing segmentation for file: {file_name}"
+                print(f"\nDEBUG: {message}")
+                log_event(message)
+                apply_segmentation_to_file(input_file_path, output_base, pool, batch_size=5, max_chunks=2,
+                                           output_format=output_format)
+                message = f"Completed segmentation for file: {file_name}"
+                print(f"DEBUG: {message}")
+                log_event(message)
 
 ###################################################################################################################################
 ###################################################################################################################################
@@ -656,7 +851,40 @@ def Segmenting_data(output_directory):
 ###################################################################################################################################
 ###################################################################################################################################
 
-def main():
+def main(streaming=True, cache_folder=None, workers=None, seed=None, memory_mb=256, dedup_mode="exact",
+         dedup_backend="memory", segmenter_workers=4, sentences_per_call=500, fused=True, debug_dir=None,
+         materialize=(), cleanup=True, force=(), force_all=False, dry_run=False, output_format="csv",
+         metrics_dir="metrics"):
+    """
+    Runs the full pipeline. With streaming=True, compressed datasets are decompressed and parsed on the fly
+    instead of being written to disk and extracted first. The compressed downloads are kept in cache_folder
+    (default: output/downloads when streaming), so a stage that re-runs "acquire" re-reads them instead of
+    downloading every dataset again.
+    workers sets the process count of the preprocessing stages (default: all cores);
+    seed makes the negative sampling of the balancing stages reproducible, and memory_mb bounds
+    the memory of their out-of-core shuffles.
+    dedup_mode ("exact", "near" or "both") and dedup_backend ("memory", "bloom" or "disk") configure the global
+    dedup of the text datasets; the dedup ratio of every source is logged at the end.
+    segmenter_workers Farasa processes segment the outputs, sentences_per_call sentences per Farasa call;
+    segmentations are cached in output/segmentation_cache.sqlite, which is kept so reruns skip Farasa.
+    With fused=True the XML datasets go through process_directory_fused (extraction to segmentation in one
+    streaming pass, no intermediate files); materialize names stages whose output is also written to debug_dir.
+
+    The steps are stages of a PipelineRunner (state in pipeline_state.json): a stage is skipped when its
+    inputs, parameters and code are unchanged since its last run and its outputs still exist. force lists
+    stages to re-run together with their downstream stages ("acquire", "extract_one_billion", "balance_text",
+    "xml", "segment"); force_all re-runs everything and dry_run only prints what would run.
+    A stage also re-runs its producer when it cannot run alone: "xml" deletes the extracted_ files it consumes,
+    so it re-runs "acquire" (streaming) or "extract_one_billion"; with streaming, "balance_text" re-runs
+    "acquire", since both dedup against one store that only lives for a run.
+    cleanup=True removes the leftover .txt files of the output directory at the end (extracted_ files of the
+    non-fused XML stage, debug materializations); the declared outputs of every stage are kept, so reruns
+    still skip the stages that made them.
+    output_format="csv" keeps the CSV outputs the training notebook reads; "parquet" writes the balanced,
+    label processed and segmented pairs as zstd-compressed Parquet instead (see parquet_io).
+    Every stage that runs is measured (wall/CPU time, peak RSS, bytes and rows in/out, rows dropped per filter);
+    the summary is printed at the end and saved as metrics_dir/run_{timestamp}.json for comparing runs.
+    """
     text_dir = "txt_files"
     xml_dir = "xml_files"
 
@@ -668,54 +896,140 @@ def main():
     xml_input_directory = base_directory / "xml_files"
     output_directory = base_directory / "output"
     extract_directory = base_directory / "extracted"
-
-    # Process One Billion datasets (RAR files)
-    for key, link in links["links_one_billion"].items():
-        log_event(f"Starting processing for One Billion dataset: {key}")
-        rar_filename = f"{key}.rar"
-        message = f"Downloading {link} as {rar_filename} for dataset: {key}"
+    create_directory(output_directory)
+    if streaming and cache_folder is None:
+        # acquire re-runs with balance_text and xml (rerun_with), which must not mean re-downloading everything
+        cache_folder = os.path.join(output_directory, "downloads")
+    dedup_path = os.path.join(output_directory, "dedup_hashes.sqlite")
+    segmentation_cache_path = os.path.join(output_directory, "segmentation_cache.sqlite")
+    deduplicator = None
+
+    def get_deduplicator():
+        # Created on first use, so a fully cached run does not touch the dedup store. It starts empty: every stage
+        # that dedups against it (acquire when streaming, balance_text) runs again whenever one of them does
+        nonlocal deduplicator
+        if deduplicator is None:
+            if os.path.exists(dedup_path):
+                os.remove(dedup_path)
+            deduplicator = Deduplicator(dedup_mode, dedup_backend, path=dedup_path)
+        return deduplicator
+
+    def acquire():
+        if streaming:
+            # Stream One Billion (RAR members), XML (bz2) and text datasets straight into their parsers
+            print("Streaming datasets...")
+            log_event("Starting streaming of all datasets")
+            stream_and_process_links(links, "downloads", output_directory, text_dir, cache_folder=cache_folder,
+                                     max_workers=4, seed=seed, memory_mb=memory_mb, deduplicator=get_deduplicator(),
+                                     output_format=output_format)
+            create_directory(xml_dir)
+            print("All files Streamed!\n")
+            log_event("Completed streaming all datasets")
+        else:
+            # Download One Billion (RAR), XML (compressed) and text datasets in parallel, then extract them
+            print("Downloading datasets...")
+            log_event("Starting download of all datasets")
+            download_and_extract_links(links, "downloads", "extracted", xml_dir, text_dir, max_workers=4)
+            print("All files Downloaded!\n")
+            log_event("Completed downloading all datasets")
+
+    def extract_one_billion():
+        extract_text_blocks_from_directory(extract_directory, output_directory, workers=workers)
+        print("One Billion XML files are extracted.\n")
+        log_event("Extracted text blocks from XML files")
+
+    def balance_text():
+        process_and_balance_text_files(txt_input_directory, output_directory, workers=workers, seed=seed,
+                                       memory_mb=memory_mb, deduplicator=get_deduplicator(),
+                                       output_format=output_format)
+        print("Text files are processed.\n")
+        log_event("Processed and balanced text files")
+
+    def xml():
+        if fused:
+            with segmentation_pool(segmenter_workers, sentences_per_call, cache_path=segmentation_cache_path) as pool:
+                process_directory_fused(xml_input_directory, output_directory, pool, seed=seed, memory_mb=memory_mb,
+                                        debug_dir=debug_dir, materialize=materialize, output_format=output_format)
+            print("XML files are processed and segmented.\n")
+            log_event("Processed and segmented XML files in one pass")
+        else:
+            process_directory(xml_input_directory, output_directory, workers=workers, seed=seed, memory_mb=memory_mb,
+                              output_format=output_format)
+            print("XML files are processed.\n")
+            log_event("Processed XML files and generated label processed outputs")
+
+    def segment():
+        Segmenting_data(output_directory, segmenter_workers=segmenter_workers, sentences_per_call=sentences_per_call,
+                        cache_path=segmentation_cache_path, output_format=output_format)
+        print("All files are segmented.\n")
+        log_event("Segmented data files")
+
+    def clean_up():
+        # Stage outputs stay: removing them would make the runner re-run their stages (and re-download) next time
+        remove_files(output_directory, ".txt", keep=runner.output_paths())
+        log_event("Cleaned up leftover .txt files in output directory")
+
+    balanced_outputs = os.path.join(output_directory, "balanced_processed_*")
+    label_outputs = os.path.join(output_directory, "label_processed_*")
+    streamed_text_outputs = [pairs_path(os.path.join(output_directory, f"balanced_processed_{key}.txt"), output_format)
+                             for key, link in named_links(links["text_links"], "text_file").items()
+                             if streaming and "drive.google.com" not in link]
+    balancing = {"seed": seed, "memory_mb": memory_mb, "dedup_mode": dedup_mode, "dedup_backend": dedup_backend,
+                 "output_format": output_format}
+
+    runner = PipelineRunner(os.path.join(base_directory, "pipeline_state.json"))
+    runner.add("acquire", acquire, inputs=["links.json"],
+               outputs=[text_dir, *streamed_text_outputs] + ([] if streaming else [xml_dir, extract_directory]),
+               params=dict(balancing, streaming=streaming),
+               code=[stream_and_process_links, download_and_extract_links, process_and_balance_lines])
+    xml_deps = ["acquire"]
+    # The stage whose extracted_ files the xml stage consumes (and deletes)
+    extracted_producer = "acquire" if streaming else "extract_one_billion"
+    if not streaming:
+        runner.add("extract_one_billion", extract_one_billion, inputs=[extract_directory], deps=["acquire"],
+                   code=[extract_text_blocks_from_directory])
+        xml_deps.append("extract_one_billion")
+    runner.add("balance_text", balance_text, inputs=[txt_input_directory], outputs=[balanced_outputs],
+               params=balancing, deps=["acquire"], rerun_with=["acquire"] if streaming else [],
+               code=[process_and_balance_text_files, filter_text_shard])
+    runner.add("xml", xml, inputs=[xml_input_directory],
+               outputs=[os.path.join(output_directory, "segmented_xml_*_batch_*") if fused else label_outputs],
+               params={"fused": fused, "seed": seed, "memory_mb": memory_mb, "output_format": output_format},
+               deps=xml_deps, rerun_with=[extracted_producer],
+               code=[process_directory_fused, process_directory, structured_pairs, iter_xml_sentences])
+    runner.add("segment", segment, inputs=[balanced_outputs, label_outputs],
+               outputs=[os.path.join(output_directory, "segmented_[0-9]*_batch_*")],
+               params={"output_format": output_format}, deps=["balance_text", "xml"], code=[Segmenting_data, apply_segmentation_to_file])
+    if cleanup:
+        runner.add("cleanup", clean_up, always=True)
+
+    metrics = MetricsRecorder()
+    results = runner.run(force=force, force_all=force_all, dry_run=dry_run, metrics=metrics)
+    for name, result in results.items():
+        message = f"Stage {name}: {result}"
         print(message)
-        log_event(message)
-        download_from_drive(link, rar_filename)
-        log_event(f"Downloaded dataset: {key} from {link}")
-        extract_folder = "extracted"
-        extract_rar(rar_filename, extract_folder)
-        log_event(f"Extracted dataset: {key} to folder: {extract_folder}")
-        print("Extraction complete!")
-        remove_files(base_directory, ".rar")
-        print("Removed .rar files\n")
-        log_event(f"Removed .rar files from {base_directory}")
-
-    # Process XML compressed files
-    print("Downloading XML compressed files...")
-    log_event("Starting download of XML compressed files")
-    process_compressed_xml_links(links["xml_links"], xml_dir)
-
-    # Process text links
-    print("Downloading text files into text directory...")
-    log_event("Starting download of text files")
-    process_text_links(links["text_links"], text_dir)
-    print("All files Downloaded!\n")
-    log_event("Completed downloading all text files")
-
-    extract_text_blocks_from_directory(extract_directory, output_directory)
-    print("One Billion XML files are extracted.\n")
-    log_event("Extracted text blocks from XML files")
-
-    process_and_balance_text_files(txt_input_directory, output_directory)
-    print("Text files are processed.\n")
-    log_event("Processed and balanced text files")
-
-    process_directory(xml_input_directory, output_directory)
-    print("XML files are processed.\n")
-    log_event("Processed XML files and generated label processed outputs")
-
-    Segmenting_data(output_directory)
-    print("All files are segmented.\n")
-    log_event("Segmented data files")
-
-    remove_files(output_directory, ".txt")
-    log_event("Cleaned up .txt files in output directory")
+        duration = runner.state.get(name, {}).get("seconds") if result == "ran" else None
+        log_event(message, stage=name, duration=duration, result=result)
+
+    if deduplicator is not None:
+        for source, stats in deduplicator.report().items():
+            message = (f"Dedup {source}: {stats['seen']} lines, {stats['exact_duplicates']} exact and "
+                       f"{stats['near_duplicates']} near duplicates removed ({stats['dedup_ratio']:.1%})")
+            print(message)
+            log_event(message)
+        deduplicator.close()
+
+    if metrics.stages:
+        print(metrics.report())
+        metrics_path = os.path.join(base_directory, metrics_dir,
+                                    f"run_{metrics.started.strftime('%Y%m%d_%H%M%S')}.json")
+        metrics.save(metrics_path)
+        for stage in metrics.stages:
+            log_event(f"Stage {stage.name} metrics", stage=stage.name, duration=stage.wall_seconds,
+                      rows=stage.rows_out, cpu_seconds=stage.cpu_seconds, peak_rss_bytes=stage.peak_rss_bytes,
+                      rows_in=stage.rows_in, bytes_in=stage.bytes_in, bytes_out=stage.bytes_out,
+                      dropped=stage.dropped)
+        print(f"Stage metrics saved to {metrics_path}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,57 @@
+import os
+import csv
+from pipeline_log import log_event
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                         FUSED GENERATOR PIPELINE (STREAMING STAGES)                                       ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+
+def tee_to_file(items, path):
+    """
+    Yields items unchanged while writing each one to path: strings as lines, tuples and lists as CSV rows.
+    Used to materialize a stage's output for debugging without breaking the stream.
+    """
+    with open(path, "w", encoding="utf-8", newline="") as f_out:
+        writer = csv.writer(f_out, lineterminator="\n")
+        for item in items:
+            if isinstance(item, str):
+                f_out.write(item + "\n")
+            else:
+                writer.writerow(item)
+            yield item
+    message = f"Materialized stage output to {path}"
+    print(message)
+    log_event(message)
+
+
+def run_stages(source, stages, debug_dir=None, materialize=(), prefix=""):
+    """
+    Chains streaming stages over source and returns the resulting iterator; nothing runs until it is consumed.
+    Each stage is a (name, fn) pair where fn takes an iterable and returns an iterable, so items flow through
+    all stages one at a time in memory. Stages named in materialize (or every stage if materialize is True)
+    also write their output to "{debug_dir}/{prefix}{name}.txt" as it streams past.
+    """
+    items = source
+    for name, fn in stages:
+        items = fn(items)
+        if materialize is True or name in materialize:
+            os.makedirs(debug_dir, exist_ok=True)
+            items = tee_to_file(items, os.path.join(debug_dir, f"{prefix}{name}.txt"))
+    return items
+
+
+def paragraphs(lines):
+    """Joins stripped, non-blank lines into one string per blank-line-separated paragraph."""
+    buffer = []
+    for line in lines:
+        line = line.strip()
+        if line:
+            buffer.append(line)
+        elif buffer:
+            yield " ".join(buffer)
+            buffer = []
+    if buffer:
+        yield " ".join(buffer)
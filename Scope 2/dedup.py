@@ -0,0 +1,227 @@
+import math
+import sqlite3
+import hashlib
+import threading
+from collections import defaultdict
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                       EXACT (64-BIT HASH) AND NEAR (MINHASH-LSH) DEDUP                                    ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+
+def content_hash(text):
+    """Returns a 64-bit content hash of a text as an unsigned int."""
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+class MemoryHashSet:
+    """Exact set of 64-bit hashes in memory (about 70 bytes per entry instead of the full string)."""
+
+    def __init__(self):
+        self._hashes = set()
+
+    def add(self, value):
+        """Adds a hash; returns True if it was not present yet."""
+        if value in self._hashes:
+            return False
+        self._hashes.add(value)
+        return True
+
+    def close(self):
+        self._hashes.clear()
+
+
+class BloomFilter:
+    """
+    Fixed-size probabilistic set of 64-bit hashes: capacity * 1.44 * log2(1 / error_rate) bits, whatever the corpus size.
+    A false positive (probability error_rate at full capacity) drops a unique line; nothing is ever kept twice.
+    """
+
+    def __init__(self, capacity=100_000_000, error_rate=1e-3):
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+
+    def add(self, value):
+        # Double hashing: derive the k bit positions from the two 32-bit halves of the content hash
+        h1, h2 = value & 0xFFFFFFFF, (value >> 32) | 1
+        new = False
+        for i in range(self.num_hashes):
+            bit = (h1 + i * h2) % self.num_bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self._bits[byte] & mask:
+                self._bits[byte] |= mask
+                new = True
+        return new
+
+    def close(self):
+        self._bits = bytearray()
+
+
+def _signed(value):
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class DiskHashSet:
+    """
+    Exact set of 64-bit hashes in an SQLite file, for global dedup over corpora whose hashes do not fit in RAM.
+    The same file holds the LSH band keys of near-dup detection (add_band_keys). An empty path opens a private
+    temporary database that SQLite deletes on close.
+    """
+
+    def __init__(self, path, commit_every=100_000):
+        self.path = path
+        self.commit_every = commit_every
+        self._pending = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=OFF")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS hashes (hash INTEGER PRIMARY KEY) WITHOUT ROWID")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS band_keys (key INTEGER PRIMARY KEY) WITHOUT ROWID")
+
+    def _written(self):
+        self._pending += 1
+        if self._pending >= self.commit_every:
+            self._connection.commit()
+            self._pending = 0
+
+    def add(self, value):
+        cursor = self._connection.execute("INSERT OR IGNORE INTO hashes (hash) VALUES (?)", (_signed(value),))
+        self._written()
+        return cursor.rowcount == 1
+
+    def add_band_keys(self, band_keys):
+        """
+        Records the band keys of a text unless one of them is already present; returns True if they were added.
+        Each key hashes its band index too, so the keys of every band share one table.
+        """
+        keys = [_signed(key) for key in band_keys]
+        placeholders = ",".join("?" * len(keys))
+        if self._connection.execute(f"SELECT 1 FROM band_keys WHERE key IN ({placeholders}) LIMIT 1", keys).fetchone():
+            return False
+        self._connection.executemany("INSERT OR IGNORE INTO band_keys (key) VALUES (?)", [(key,) for key in keys])
+        self._written()
+        return True
+
+    def close(self):
+        self._connection.commit()
+        self._connection.close()
+
+
+class MinHasher:
+    """
+    MinHash signatures over word shingles, split into LSH bands. Two texts share at least one band key with
+    probability 1 - (1 - s ** rows) ** bands for Jaccard similarity s; the defaults (16 bands x 8 rows)
+    put the threshold near s = 0.7, which catches boilerplate with small edits.
+    """
+
+    _PRIME = 4294967311  # smallest prime above 2**32, so a * x + b never overflows uint64
+
+    def __init__(self, bands=16, rows=8, shingle_size=5, seed=1):
+        import numpy as np
+
+        self.bands = bands
+        self.rows = rows
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        num_perm = bands * rows
+        self._a = rng.integers(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+
+    def shingles(self, text):
+        words = text.split()
+        if len(words) <= self.shingle_size:
+            return {" ".join(words)}
+        return {" ".join(words[i:i + self.shingle_size]) for i in range(len(words) - self.shingle_size + 1)}
+
+    def signature(self, text):
+        import numpy as np
+
+        hashes = np.fromiter(
+            (content_hash(shingle) & 0xFFFFFFFF for shingle in self.shingles(text)), dtype=np.uint64
+        )
+        permuted = (np.outer(hashes, self._a) + self._b) % np.uint64(self._PRIME)
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, text):
+        """Returns one 64-bit key per band; texts sharing any key are near-duplicate candidates."""
+        signature = self.signature(text).reshape(self.bands, self.rows)
+        return [content_hash(f"{band}:{row.tobytes().hex()}") for band, row in enumerate(signature)]
+
+
+class Deduplicator:
+    """
+    Global, thread-safe dedup stage shared by every file and dataset of a run.
+
+    mode:    "exact" (64-bit content hashes), "near" (MinHash-LSH) or "both".
+    backend: where exact hashes live: "memory", "bloom" (fixed size, approximate) or "disk" (SQLite at path).
+    The LSH band keys of "near" and "both" (16 per kept line) are always kept in SQLite, so their memory stays
+    bounded: in the file at path with the disk backend, in a temporary file deleted on close otherwise.
+    Counts are kept per source so report() can give the dedup ratio of each file or dataset.
+    Hashes and band keys can be computed elsewhere (e.g. in shard workers) and passed to check_hashes.
+    """
+
+    def __init__(self, mode="exact", backend="memory", path=None, bloom_capacity=100_000_000,
+                 bloom_error_rate=1e-3, bands=16, rows=8, shingle_size=5):
+        if mode not in ("exact", "near", "both"):
+            raise ValueError(f"Unknown dedup mode: {mode}")
+        self.mode = mode
+        if backend == "memory":
+            self._exact = MemoryHashSet()
+        elif backend == "bloom":
+            self._exact = BloomFilter(bloom_capacity, bloom_error_rate)
+        elif backend == "disk":
+            if not path:
+                raise ValueError("The disk dedup backend needs a path")
+            self._exact = DiskHashSet(path)
+        else:
+            raise ValueError(f"Unknown dedup backend: {backend}")
+        self.min_hasher = MinHasher(bands, rows, shingle_size) if mode in ("near", "both") else None
+        self._bands = None
+        if self.min_hasher:
+            self._bands = self._exact if backend == "disk" else DiskHashSet("")
+        self._stats = defaultdict(lambda: {"seen": 0, "exact_duplicates": 0, "near_duplicates": 0})
+        self._lock = threading.Lock()
+
+    @property
+    def near(self):
+        return self.min_hasher is not None
+
+    def keys(self, text):
+        """Returns (content_hash, band_keys) for a text; band_keys is None unless near-dup detection is on."""
+        return content_hash(text), self.min_hasher.band_keys(text) if self.min_hasher else None
+
+    def check(self, text, source="default"):
+        """Returns True if the text should be kept, recording it as seen."""
+        line_hash, band_keys = self.keys(text)
+        return self.check_hashes(line_hash, band_keys, source)
+
+    def check_hashes(self, line_hash, band_keys=None, source="default"):
+        with self._lock:
+            stats = self._stats[source]
+            stats["seen"] += 1
+            if self.mode != "near" and not self._exact.add(line_hash):
+                stats["exact_duplicates"] += 1
+                return False
+            if band_keys is not None:
+                if not self._bands.add_band_keys(band_keys):
+                    stats["near_duplicates"] += 1
+                    return False
+            return True
+
+    def report(self):
+        """Returns {source: counts} with the fraction of lines removed as "dedup_ratio"."""
+        with self._lock:
+            report = {}
+            for source, stats in sorted(self._stats.items()):
+                removed = stats["exact_duplicates"] + stats["near_duplicates"]
+                report[source] = dict(stats, dedup_ratio=removed / stats["seen"] if stats["seen"] else 0.0)
+            return report
+
+    def close(self):
+        self._exact.close()
+        if self._bands is not None and self._bands is not self._exact:
+            self._bands.close()
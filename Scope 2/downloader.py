@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import random
+import hashlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from pipeline_log import log_event
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                        PARALLEL, RESUMABLE DOWNLOAD STAGE                                                 ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+@dataclass
+class DownloadItem:
+    key: str
+    url: str
+    output_path: str
+
+
+class DownloadManifest:
+    """
+    Persistent JSON record of completed downloads (path, size, sha256), shared by the worker threads.
+    """
+
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def _save(self):
+        temp_path = f"{self.manifest_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+
+    def is_complete(self, item):
+        """True if the item was downloaded from the same URL and its file is still intact (or already extracted)."""
+        entry = self.entries.get(item.key)
+        if not entry or entry.get("url") != item.url:
+            return False
+        if entry.get("extracted"):
+            return True
+        return os.path.exists(item.output_path) and os.path.getsize(item.output_path) == entry.get("size")
+
+    def record(self, item, size, sha256):
+        with self._lock:
+            self.entries[item.key] = {
+                "url": item.url,
+                "path": item.output_path,
+                "size": size,
+                "sha256": sha256,
+                "completed_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+            self._save()
+
+    def mark_extracted(self, key):
+        """Marks an item as extracted so its compressed file may be deleted without forcing a re-download."""
+        with self._lock:
+            if key in self.entries:
+                self.entries[key]["extracted"] = True
+                self._save()
+
+    def is_extracted(self, key):
+        return bool(self.entries.get(key, {}).get("extracted"))
+
+    def record_outputs(self, key, url, outputs):
+        """
+        Records the files produced from key's url (downloaded or streamed), so later runs can skip it
+        while they all exist (see finished_outputs). An entry for a different url is replaced.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None or entry.get("url") != url:
+                entry = self.entries[key] = {"url": url}
+            entry["outputs"] = [os.fspath(path) for path in outputs]
+            entry["outputs_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._save()
+
+    def finished_outputs(self, key, url):
+        """Returns the outputs recorded for key if they came from url and all still exist, else None."""
+        entry = self.entries.get(key)
+        if not entry or entry.get("url") != url or "outputs" not in entry:
+            return None
+        return entry["outputs"] if all(os.path.exists(path) for path in entry["outputs"]) else None
+
+    def forget(self, key):
+        """Drops key's entry, so its file is downloaded (and extracted) again."""
+        with self._lock:
+            if self.entries.pop(key, None) is not None:
+                self._save()
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _download_http(item, session, chunk_size, timeout):
+    """
+    Streams a URL into <output_path>.part, resuming with an HTTP Range request if a partial file exists.
+    Returns the sha256 of the finished file, hashed while it is written.
+    """
+    part_path = f"{item.output_path}.part"
+    resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    headers = {"Range": f"bytes={resume_from}-"} if resume_from else {}
+
+    digest = hashlib.sha256()
+    with session.get(item.url, stream=True, headers=headers, timeout=timeout) as response:
+        if response.status_code == 416:
+            # The partial file already holds the whole resource
+            return _finish_partial(part_path, item.output_path)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+        response.raise_for_status()
+        if resume_from and response.status_code != 206:
+            # Server ignored the Range header, start over
+            resume_from = 0
+        if resume_from:
+            log_event(f"Resuming {item.key} from byte {resume_from}", stage="download", key=item.key)
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(chunk_size), b""):
+                    digest.update(chunk)
+        with open(part_path, "ab" if resume_from else "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                if chunk:
+                    f.write(chunk)
+                    digest.update(chunk)
+
+    os.replace(part_path, item.output_path)
+    return digest.hexdigest()
+
+
+def _finish_partial(part_path, output_path):
+    os.replace(part_path, output_path)
+    return file_sha256(output_path)
+
+
+def _download_drive(item):
+    import gdown
+
+    if '/d/' not in item.url:
+        raise ValueError(f"Invalid Google Drive link: {item.url}")
+    file_id = item.url.split('/d/')[1].split('/view')[0]
+    result = gdown.download(f"https://drive.google.com/uc?id={file_id}", item.output_path, quiet=True, resume=True)
+    if result is None:
+        raise IOError(f"gdown could not download {item.url}")
+    return file_sha256(item.output_path)
+
+
+def download_item(item, manifest, session=None, retries=5, backoff=2.0, chunk_size=1024 * 1024, timeout=60):
+    """
+    Downloads one item with retry and exponential backoff, then records its size and checksum.
+    Returns "skipped" or "downloaded"; raises the last error once all retries are exhausted.
+    """
+    if manifest.is_complete(item):
+        log_event(f"Skipping {item.key}: already downloaded", stage="download", key=item.key)
+        return "skipped"
+
+    os.makedirs(os.path.dirname(item.output_path) or ".", exist_ok=True)
+    session = session or requests.Session()
+
+    for attempt in range(1, retries + 1):
+        try:
+            if "drive.google.com" in item.url:
+                sha256 = _download_drive(item)
+            else:
+                sha256 = _download_http(item, session, chunk_size, timeout)
+            break
+        except (requests.RequestException, IOError) as e:
+            response = getattr(e, "response", None)
+            not_retryable = response is not None and response.status_code not in RETRYABLE_STATUS_CODES
+            if attempt == retries or not_retryable:
+                raise
+            delay = backoff ** attempt + random.uniform(0, 1)
+            log_event(f"Download of {item.key} failed (attempt {attempt}/{retries}): {e}. Retrying in {delay:.1f}s",
+                      stage="download", key=item.key, level="warning")
+            time.sleep(delay)
+
+    size = os.path.getsize(item.output_path)
+    manifest.record(item, size, sha256)
+    log_event(f"Downloaded {item.key} -> {item.output_path}", stage="download", key=item.key, bytes=size)
+    return "downloaded"
+
+
+def download_all(items, manifest_path, max_workers=4, **kwargs):
+    """
+    Downloads items on a bounded thread pool. Finished items recorded in the manifest are skipped.
+    Returns ({key: "downloaded" | "skipped" | "failed"}, manifest); a failed item does not stop the others.
+    """
+    manifest = DownloadManifest(manifest_path)
+    results = {}
+    local = threading.local()
+
+    def run(item):
+        # requests.Session is not thread-safe, so each worker keeps its own
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return download_item(item, manifest, session=local.session, **kwargs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(run, item): item for item in items}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                results[item.key] = future.result()
+            except Exception as e:
+                log_event(f"Giving up on {item.key} ({item.url}): {e}", stage="download", key=item.key, level="error")
+                results[item.key] = "failed"
+
+    return results, manifest
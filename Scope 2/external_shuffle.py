@@ -0,0 +1,144 @@
+import os
+import random
+import shutil
+import tempfile
+from array import array
+from pipeline_log import log_event
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                           EXTERNAL-MEMORY (TWO-PASS) SHUFFLE                                              ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+DEFAULT_MEMORY_BYTES = 256 * 1024 * 1024
+DEFAULT_BUCKETS = 64
+# Memory per line of a bucket in pass 2 on top of its bytes: its start offset and its slot in the permutation
+LINE_INDEX_BYTES = 16
+
+
+class ExternalShuffle:
+    """
+    Uniformly shuffles more text lines than fit in memory, in two streaming passes:
+        1) scatter() appends every line to one of N temp bucket files chosen at random.
+        2) Iterating reads the buckets back one at a time, shuffles each in memory and yields its lines.
+    A bucket is held as one bytes object plus LINE_INDEX_BYTES of offsets per line, and its line offsets are
+    shuffled instead of a list of str (about 80 bytes of overhead per line, several times the size of short
+    Arabic lines), so pass 2 stays within memory_bytes. A bucket that would still exceed it (unknown input
+    size or bad luck) is shuffled the same way recursively.
+    Lines must not contain newlines. Use as a context manager so the temp buckets are always removed.
+    """
+
+    def __init__(self, memory_bytes=DEFAULT_MEMORY_BYTES, seed=None, work_dir=None, num_buckets=None, _depth=0):
+        self.memory_bytes = memory_bytes
+        self._depth = _depth
+        self.seed = seed
+        self.work_dir = work_dir
+        self.num_buckets = num_buckets
+        self.count = 0
+        self.total_bytes = 0
+        self._rng = random.Random(seed)
+        self._tmp = None
+        self._buckets = []
+        self._bucket_lines = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._tmp and os.path.isdir(self._tmp):
+            shutil.rmtree(self._tmp, ignore_errors=True)
+        self._tmp = None
+
+    def scatter(self, lines, expected_bytes=None):
+        """
+        Pass 1: distributes the lines over the buckets. With expected_bytes (the input's size, or better its
+        pass 2 memory), enough buckets are used for each to fit in memory_bytes (with 25% headroom);
+        otherwise num_buckets or DEFAULT_BUCKETS.
+        """
+        if self.num_buckets is None:
+            if expected_bytes:
+                self.num_buckets = max(1, -(-expected_bytes * 5 // 4 // self.memory_bytes))
+            else:
+                self.num_buckets = DEFAULT_BUCKETS
+
+        if self.work_dir:
+            os.makedirs(self.work_dir, exist_ok=True)
+        self._tmp = tempfile.mkdtemp(prefix="shuffle_", dir=self.work_dir)
+        self._buckets = [os.path.join(self._tmp, f"bucket_{i:05d}.txt") for i in range(self.num_buckets)]
+        self._bucket_lines = [0] * self.num_buckets
+        # Each open file keeps a write buffer, so cap it to keep pass 1 within memory_bytes
+        buffer_size = max(8192, min(1024 * 1024, self.memory_bytes // (2 * self.num_buckets)))
+        files = [open(path, "w", encoding="utf-8", newline="", buffering=buffer_size) for path in self._buckets]
+        try:
+            pick = self._rng.randrange
+            for line in lines:
+                if not line.endswith("\n"):
+                    line += "\n"
+                bucket = pick(self.num_buckets)
+                files[bucket].write(line)
+                self._bucket_lines[bucket] += 1
+                self.count += 1
+                self.total_bytes += len(line)
+        finally:
+            for f in files:
+                f.close()
+        message = f"Scattered {self.count} lines into {self.num_buckets} buckets"
+        print(message)
+        log_event(message)
+        return self
+
+    def _bucket_memory(self, index):
+        """Pass 2 memory of a bucket: its bytes plus the offsets of its lines."""
+        return os.path.getsize(self._buckets[index]) + LINE_INDEX_BYTES * self._bucket_lines[index]
+
+    def _shuffled_lines(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        # Every scattered line ends with a newline, so starts also holds the end of the last line
+        starts = array("q", [0])
+        position = data.find(b"\n") + 1
+        while position:
+            starts.append(position)
+            position = data.find(b"\n", position) + 1
+        order = array("q", range(len(starts) - 1))
+        self._rng.shuffle(order)
+        for i in order:
+            yield data[starts[i]:starts[i + 1]].decode("utf-8")
+
+    def __iter__(self):
+        """Pass 2: yields every scattered line once, in uniformly random order, bucket by bucket."""
+        for index, path in enumerate(self._buckets):
+            # The depth cap stops the recursion on buckets that cannot be split, e.g. a single huge line
+            bucket_memory = self._bucket_memory(index)
+            if bucket_memory > self.memory_bytes and self._depth < 4:
+                with open(path, "r", encoding="utf-8", newline="\n") as f, ExternalShuffle(
+                    self.memory_bytes, self._rng.getrandbits(64), self._tmp, _depth=self._depth + 1
+                ) as inner:
+                    inner.scatter(f, expected_bytes=bucket_memory)
+                    yield from inner
+            else:
+                yield from self._shuffled_lines(path)
+            os.remove(path)
+
+
+def shuffle_file(input_file_path, output_file_path, memory_bytes=DEFAULT_MEMORY_BYTES, seed=None, work_dir=None,
+                 skip_header=False):
+    """
+    Shuffles the lines of a file of any size into output_file_path, keeping the header line first if skip_header.
+    Returns the number of shuffled lines.
+    """
+    work_dir = work_dir or os.path.dirname(os.path.abspath(output_file_path))
+    with open(input_file_path, "r", encoding="utf-8") as f_in, \
+            ExternalShuffle(memory_bytes, seed, work_dir) as shuffler:
+        header = f_in.readline() if skip_header else None
+        shuffler.scatter(f_in, expected_bytes=os.path.getsize(input_file_path))
+        with open(output_file_path, "w", encoding="utf-8") as f_out:
+            if header:
+                f_out.write(header)
+            for line in shuffler:
+                f_out.write(line)
+        return shuffler.count
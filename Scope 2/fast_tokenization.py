@@ -0,0 +1,88 @@
+import json
+import time
+from pipeline_log import log_event
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                  BATCHED FAST-TOKENIZER ENCODING WITH DYNAMIC PADDING                                     ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+DEFAULT_MAX_LENGTH = 8192
+
+
+def encode_batch(tokenizer, texts, max_length=DEFAULT_MAX_LENGTH):
+    """
+    Encodes a whole batch with one call into the fast (Rust) tokenizer, which splits the work across its
+    own threads, and returns one unpadded list of token ids per text, truncated to max_length.
+    No attention mask is kept: it is all ones up to the sequence length, so pad_collate rebuilds it.
+    If the batch call fails, the texts are encoded one by one and the ones that still fail are skipped,
+    as the per-sentence loop did.
+    """
+    kwargs = dict(truncation=True, max_length=max_length, padding=False, return_attention_mask=False,
+                  return_token_type_ids=False)
+    try:
+        return tokenizer(list(texts), **kwargs)["input_ids"]
+    except Exception as e:
+        message = f"Batch encoding failed ({e}), encoding {len(texts)} texts one by one"
+        print(message)
+        log_event(message, level="warning")
+    ids = []
+    for text in texts:
+        try:
+            ids.append(tokenizer(text, **kwargs)["input_ids"])
+        except Exception as e:
+            message = f"Error processing sentence: {e}"
+            print(message)
+            log_event(message, level="error")
+    return ids
+
+
+def pad_collate(examples, pad_token_id, pad_to_multiple_of=8, return_tensors="pt"):
+    """
+    Collate function for variable-length examples (id sequences, or dicts with "input_ids"): pads the batch
+    to its longest sequence, rounded up to pad_to_multiple_of, and returns input_ids and attention_mask
+    as torch tensors ("pt") or numpy arrays ("np").
+        DataLoader(dataset, batch_size=16, collate_fn=partial(pad_collate, pad_token_id=tokenizer.pad_token_id))
+    """
+    import numpy as np
+
+    sequences = [example["input_ids"] if isinstance(example, dict) else example for example in examples]
+    length = max((len(sequence) for sequence in sequences), default=0)
+    if pad_to_multiple_of:
+        length = -(-length // pad_to_multiple_of) * pad_to_multiple_of
+    input_ids = np.full((len(sequences), length), pad_token_id, dtype=np.int64)
+    attention_mask = np.zeros((len(sequences), length), dtype=np.int64)
+    for row, sequence in enumerate(sequences):
+        input_ids[row, :len(sequence)] = sequence
+        attention_mask[row, :len(sequence)] = 1
+    if return_tensors == "pt":
+        import torch
+
+        return {"input_ids": torch.from_numpy(input_ids), "attention_mask": torch.from_numpy(attention_mask)}
+    return {"input_ids": input_ids, "attention_mask": attention_mask}
+
+
+def benchmark_tokenization(tokenizer, texts, max_length=DEFAULT_MAX_LENGTH, batch_size=1000):
+    """
+    Compares the per-sentence max_length-padded JSON records (the previous process_batch) with batched,
+    unpadded encoding, in seconds and in bytes of JSON-lines output, on the same texts.
+    """
+    started = time.perf_counter()
+    padded_bytes = 0
+    for text in texts:
+        encodings = tokenizer(text, max_length=max_length, padding="max_length", truncation=True)
+        record = {"input_ids": encodings["input_ids"], "attention_mask": encodings["attention_mask"]}
+        padded_bytes += len(json.dumps(record)) + 1
+    padded_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    dynamic_bytes = 0
+    for start in range(0, len(texts), batch_size):
+        for ids in encode_batch(tokenizer, texts[start:start + batch_size], max_length):
+            dynamic_bytes += len(json.dumps({"input_ids": ids})) + 1
+    dynamic_seconds = time.perf_counter() - started
+
+    print(f"per-sentence, padded to {max_length}: {padded_seconds:.2f} s, {padded_bytes / 2**20:.1f} MB")
+    print(f"batched, unpadded:              {dynamic_seconds:.2f} s, {dynamic_bytes / 2**20:.1f} MB "
+          f"({padded_seconds / dynamic_seconds:.0f}x faster, {padded_bytes / dynamic_bytes:.0f}x smaller)")
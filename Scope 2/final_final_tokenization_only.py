@@ -11,6 +11,9 @@ import pandas as pd
 from collections import Counter
 from transformers import AutoTokenizer, AutoModelForMaskedLM
 from tokenizers.pre_tokenizers import Whitespace
+from fast_tokenization import encode_batch
+from token_store import TokenStoreWriter
+from parallel_tokenization import DEFAULT_MEMORY_BUDGET, ChunkBudget, iter_chunks, tokenize_split_parallel
 
 LOG_DIR = "/content/log"
 os.makedirs(LOG_DIR, exist_ok=True)
@@ -35,6 +38,13 @@ SPLITS = {
     "test": "/content/test"
 }
 OUTPUT_ROOT = "/content/tokenized"
+# "memmap" writes each split as a sharded token store ({split}.manifest.json, {split}.shard*), which the training
+# notebook reads through token_store.TokenStoreDataset; "jsonl" as {split}.txt
+TOKENIZED_FORMAT = "memmap"
+# memmap splits are tokenized by TOKENIZE_WORKERS processes (None: every core) into a sharded token store;
+# TOKENIZE_MEMORY_BUDGET bounds the memory of the chunks being encoded, across all workers
+TOKENIZE_WORKERS = None
+TOKENIZE_MEMORY_BUDGET = DEFAULT_MEMORY_BUDGET
 
 os.makedirs(OUTPUT_ROOT, exist_ok=True)
 
@@ -71,39 +81,48 @@ def process_batch(batch_texts, tokenizer):
     return output_records
 
 
-def tokenize_large_txt(input_dir, output_txt, tokenizer):
+def process_batch_dynamic(batch_texts, tokenizer):
+    # Unpadded ids from one batched call; padding and attention masks are left to fast_tokenization.pad_collate
+    return [{"input_ids": ids} for ids in encode_batch(tokenizer, batch_texts, max_length=8192)]
+
+
+def read_txt_lines(input_dir):
+    for file in os.listdir(input_dir):
+        if file.endswith(".txt"):
+            with open(os.path.join(input_dir, file), "r", encoding="utf-8") as fin:
+                yield from fin
+
+
+def tokenize_large_txt(input_dir, output_txt, tokenizer, dynamic_padding=True, output_format="jsonl",
+                       memory_budget=DEFAULT_MEMORY_BUDGET):
+    """
+    Single-process tokenization. output_format="jsonl" writes one JSON record per line to output_txt; "memmap"
+    writes the input_ids to a token store with output_txt as its prefix (see token_store.TokenStore for
+    reading it back). Lines are encoded in chunks sized to fit memory_budget.
+    """
     row_count = 0
-    CHUNK_SIZE = max(100, min(1000, 32 * 1024 * 1024 // psutil.Process().memory_info().rss))
+    encode = process_batch_dynamic if dynamic_padding else process_batch
+    budget = ChunkBudget(memory_budget)
 
-    with open(output_txt, "w", encoding="utf-8") as fout:
-        batch_lines = []
+    if output_format == "memmap":
+        output = TokenStoreWriter(output_txt, vocab_size=len(tokenizer))
+    else:
+        output = open(output_txt, "w", encoding="utf-8")
 
-        for file in os.listdir(input_dir):
-            file_path = os.path.join(input_dir, file)
-            if not file.endswith(".txt"):
-                continue
-
-            with open(file_path, "r", encoding="utf-8") as fin:
-                for line in fin:
-                    batch_lines.append(line.strip())
-
-                    if len(batch_lines) >= CHUNK_SIZE:
-                        logging.info(f"Processing batch of {len(batch_lines)} lines... (Memory: {memory_usage()})")
-                        batch_results = process_batch(batch_lines, tokenizer)
-
-                        for record in batch_results:
-                            fout.write(f"{json.dumps(record)}\n")
-
-                        row_count += len(batch_lines)
-                        batch_lines.clear()
-                        del batch_results
-                        gc.collect()
-
-        if batch_lines:
-            logging.info(f"Processing final batch of {len(batch_lines)} lines... (Memory: {memory_usage()})")
-            batch_results = process_batch(batch_lines, tokenizer)
-            for record in batch_results:
-                fout.write(f"{json.dumps(record)}\n")
+    def write_records(records):
+        if output_format == "memmap":
+            output.extend(record["input_ids"] for record in records)
+        else:
+            for record in records:
+                output.write(f"{json.dumps(record)}\n")
+
+    with output:
+        for batch_lines, chars in iter_chunks(read_txt_lines(input_dir), budget):
+            logging.info(f"Processing batch of {len(batch_lines)} lines... (Memory: {memory_usage()})")
+            batch_results = encode(batch_lines, tokenizer)
+            write_records(batch_results)
+            # Padded records hold attention masks too: count every id held per character
+            budget.observe(chars, sum(len(values) for record in batch_results for values in record.values()))
             row_count += len(batch_lines)
             del batch_results
             gc.collect()
@@ -135,18 +154,24 @@ def update_tokenizer_and_tokenize_txt():
     model = AutoModelForMaskedLM.from_pretrained(MODEL_NAME)
     model.resize_token_embeddings(len(tokenizer))
     model.save_pretrained(MODEL_PATH)
+    # Not needed for tokenizing; freed so the tokenization workers do not start from its footprint
+    del model
+    gc.collect()
 
     tokenizer = AutoTokenizer.from_pretrained(TOKENIZER_PATH, local_files_only=True)
 
     if hasattr(tokenizer, "backend_tokenizer") and hasattr(tokenizer.backend_tokenizer, "pre_tokenizer"):
         tokenizer.backend_tokenizer.pre_tokenizer = Whitespace()
 
-    logging.info("Tokenizing each TXT file in the input directories and saving as TXT files...")
+    logging.info(f"Tokenizing each TXT file in the input directories and saving as {TOKENIZED_FORMAT}...")
     for split, input_dir in SPLITS.items():
         if os.path.exists(input_dir) and os.listdir(input_dir):
-            output_txt_path = os.path.join(OUTPUT_ROOT, f"{split}.txt")
             logging.info(f"Tokenizing all files in {split} directory: {input_dir}")
-            tokenize_large_txt(input_dir, output_txt_path, tokenizer)
+            if TOKENIZED_FORMAT == "memmap":
+                tokenize_split_parallel(input_dir, os.path.join(OUTPUT_ROOT, split), TOKENIZER_PATH,
+                                        workers=TOKENIZE_WORKERS, memory_budget=TOKENIZE_MEMORY_BUDGET)
+            else:
+                tokenize_large_txt(input_dir, os.path.join(OUTPUT_ROOT, f"{split}.txt"), tokenizer)
         else:
             logging.warning(f"{input_dir} not found or empty, skipping.")
 
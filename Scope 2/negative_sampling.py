@@ -0,0 +1,198 @@
+import os
+import re
+import csv
+import random
+import hashlib
+from external_shuffle import DEFAULT_MEMORY_BYTES, ExternalShuffle
+from parquet_io import ParquetPairWriter
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                         O(n) NEGATIVE-PAIR SAMPLING / BALANCING                                           ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+_FIELD_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_FIELD_UNESCAPES = {"\\": "\\", "t": "\t", "n": "\n", "r": "\r"}
+_ESCAPED_CHAR = re.compile(r"\\([\\tnr])")
+
+
+def derive_seed(seed, key):
+    """
+    Derives a stable per-file seed from a run seed, so parallel workers stay reproducible
+    whatever order they run in. Returns None (unseeded) when seed is None.
+    """
+    if seed is None:
+        return None
+    digest = hashlib.blake2b(f"{seed}:{key}".encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def escape_field(text):
+    """
+    Escapes backslashes, tabs and line breaks, so a sentence fits in one field of a tab-separated line.
+    Checked first because almost no sentence needs it.
+    """
+    if "\\" in text or "\t" in text or "\n" in text or "\r" in text:
+        return text.translate(_FIELD_ESCAPES)
+    return text
+
+
+def unescape_field(text):
+    """Inverse of escape_field."""
+    if "\\" in text:
+        return _ESCAPED_CHAR.sub(lambda match: _FIELD_UNESCAPES[match.group(1)], text)
+    return text
+
+
+def sample_partner(rng, idx, n):
+    """
+    Draws a row index uniformly from range(n) excluding idx in O(1):
+    draw from n - 1 slots and shift the ones at or after idx up by one.
+    """
+    partner = rng.randrange(n - 1)
+    return partner + 1 if partner >= idx else partner
+
+
+def balance_rows(rows, seed=None):
+    """
+    Shuffles [sentence_a, sentence_b, label] rows in place and turns half of them into negatives
+    (label "0") whose sentence_b is taken from another random row; the rest get label "1".
+    Partners are drawn from the original sentence_b values in O(1) each, so the whole pass is O(n).
+    """
+    rng = random.Random(seed)
+    rng.shuffle(rows)
+    total_lines = len(rows)
+    num_lines_label_0 = total_lines // 2
+    original_b = [row[1] for row in rows]
+
+    if total_lines > 1:
+        for idx in range(num_lines_label_0):
+            rows[idx][1] = original_b[sample_partner(rng, idx, total_lines)]
+            rows[idx][2] = "0"
+    for idx in range(num_lines_label_0, total_lines):
+        rows[idx][2] = "1"
+
+    rng.shuffle(rows)
+    return rows
+
+
+def iter_balanced_rows(pairs, seed=None, memory_bytes=DEFAULT_MEMORY_BYTES, work_dir=None, expected_bytes=None):
+    """
+    Streaming, out-of-core version of balance_rows for datasets larger than memory, yielding
+    (sentence_a, sentence_b, label) rows. pairs is an iterable of (sentence_a, sentence_b); the sentences are
+    escaped (escape_field) on their way through the tab-separated shuffle lines, so they may hold tabs or newlines.
+
+    1) The pairs are shuffled with a two-pass ExternalShuffle bounded by memory_bytes.
+    2) Exactly half of the shuffled rows become negatives, chosen by selection sampling (O(1) memory).
+       A negative takes sentence_b of the next row in shuffled order (the last row wraps to the first).
+       In a uniformly random order that neighbour is a uniformly random other row, so no lookup is needed.
+    The shuffle's temp buckets live in work_dir (default: the system temp dir) until the generator is exhausted or closed.
+    """
+    rng = random.Random(derive_seed(seed, "labels"))
+
+    with ExternalShuffle(memory_bytes, seed, work_dir) as shuffler:
+        shuffler.scatter((f"{escape_field(a)}\t{escape_field(b)}" for a, b in pairs), expected_bytes=expected_bytes)
+        total_lines = shuffler.count
+
+        negatives_left = total_lines // 2
+        rows = ([unescape_field(field) for field in line.rstrip("\n").split("\t")] for line in shuffler)
+        current = next(rows, None)
+        first_b = current[1] if current else None
+        position = 0
+        while current is not None:
+            following = next(rows, None)
+            sentence_a, sentence_b = current
+            # Selection sampling: exactly total_lines // 2 negatives, uniformly spread over the output
+            if total_lines > 1 and rng.random() * (total_lines - position) < negatives_left:
+                negatives_left -= 1
+                sentence_b = following[1] if following is not None else first_b
+                label = "0"
+            else:
+                label = "1"
+            yield sentence_a, sentence_b, label
+            current = following
+            position += 1
+
+
+def balance_pairs(pairs, output_file_path, header, seed=None, memory_bytes=DEFAULT_MEMORY_BYTES, work_dir=None,
+                  expected_bytes=None, output_format="csv", source=""):
+    """
+    Writes iter_balanced_rows(pairs) to output_file_path, shuffling in the output's directory.
+    With output_format="csv", rows go under header through the csv module, so sentences containing commas are quoted;
+    with "parquet", they go to a zstd Parquet file (see parquet_io.ParquetPairWriter) tagged with source.
+    Returns the number of rows written.
+    """
+    work_dir = work_dir or os.path.dirname(os.path.abspath(output_file_path))
+    total_lines = 0
+    rows = iter_balanced_rows(pairs, seed, memory_bytes, work_dir, expected_bytes)
+    if output_format == "parquet":
+        with ParquetPairWriter(output_file_path, source=source) as writer:
+            for row in rows:
+                writer.write(*row)
+                total_lines += 1
+        return total_lines
+
+    with open(output_file_path, "w", encoding="utf-8") as f_out:
+        f_out.write(header + "\n")
+        writer = csv.writer(f_out, lineterminator="\n")
+        for row in rows:
+            writer.writerow(row)
+            total_lines += 1
+    return total_lines
+
+
+def balance_csv_file(input_file_path, output_file_path, header, seed=None, memory_bytes=DEFAULT_MEMORY_BYTES,
+                     work_dir=None, output_format="csv", source=""):
+    """
+    Balances a "sentence_a,sentence_b,label" CSV file of any size with balance_pairs, skipping rows without exactly 3 fields.
+    """
+    def pairs():
+        with open(input_file_path, "r", encoding="utf-8", newline="") as f_in:
+            for row in csv.reader(f_in):
+                if len(row) == 3:
+                    yield row[0].strip(), row[1].strip()
+
+    return balance_pairs(pairs(), output_file_path, header, seed, memory_bytes, work_dir,
+                         expected_bytes=os.path.getsize(input_file_path), output_format=output_format, source=source)
+
+
+def benchmark_negative_sampling(sizes=(10 ** 6, 10 ** 7), in_memory_limit=10 ** 6, quadratic_size=10 ** 4, seed=13):
+    """
+    Times balance_rows (sizes up to in_memory_limit) and balance_csv_file on synthetic rows,
+    plus the old list-comprehension sampler on quadratic_size rows for reference.
+    """
+    import time
+
+    def synthetic_rows(n):
+        return [[f"جملة {i} الأولى", f"جملة {i} الثانية", "1"] for i in range(n)]
+
+    data = synthetic_rows(quadratic_size)
+    started = time.perf_counter()
+    for idx in range(len(data) // 2):
+        random_idx = random.choice([i for i in range(len(data)) if i != idx])
+        data[idx][1] = data[random_idx][1]
+    print(f"old O(n^2) sampler, {quadratic_size:,} rows: {time.perf_counter() - started:.1f}s")
+
+    for n in sizes:
+        if n <= in_memory_limit:
+            rows = synthetic_rows(n)
+            started = time.perf_counter()
+            balance_rows(rows, seed=seed)
+            print(f"balance_rows, {n:,} rows: {time.perf_counter() - started:.1f}s")
+            del rows
+
+        input_path = f"negative_sampling_benchmark_{n}.csv"
+        output_path = f"negative_sampling_benchmark_{n}.out.csv"
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i in range(n):
+                f.write(f"جملة {i} الأولى,جملة {i} الثانية,1\n")
+        started = time.perf_counter()
+        balance_csv_file(input_path, output_path, "sentence_a,sentence_b,label", seed=seed)
+        print(f"balance_csv_file, {n:,} rows: {time.perf_counter() - started:.1f}s")
+        os.remove(input_path)
+        os.remove(output_path)
+
+
+if __name__ == "__main__":
+    benchmark_negative_sampling()
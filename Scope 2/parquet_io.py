@@ -0,0 +1,134 @@
+import os
+from dedup import content_hash
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                        COLUMNAR (PARQUET) SENTENCE-PAIR STORAGE                                           ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+OUTPUT_FORMATS = ("csv", "parquet")
+DEFAULT_ROW_GROUP_SIZE = 100_000
+
+
+def pairs_path(path, output_format):
+    """Returns path with the extension of output_format: unchanged for "csv", ".parquet" otherwise."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format: {output_format}")
+    if output_format == "csv":
+        return path
+    return f"{os.path.splitext(path)[0]}.parquet"
+
+
+def pair_schema():
+    import pyarrow as pa
+
+    return pa.schema([
+        ("sentence_a", pa.string()),
+        ("sentence_b", pa.string()),
+        ("label", pa.int8()),
+        ("source", pa.dictionary(pa.int32(), pa.string())),
+        ("hash", pa.uint64()),
+    ])
+
+
+class ParquetPairWriter:
+    """
+    Writes (sentence_a, sentence_b, label) rows to a zstd-compressed Parquet file with the columns
+    sentence_a, sentence_b, label (int8), source (dictionary-encoded) and hash (64-bit content hash of the pair).
+    Rows are buffered column-wise and flushed as one row group every row_group_size rows, so memory stays
+    bounded and readers can stream the file group by group. Use as a context manager.
+    """
+
+    def __init__(self, path, source="", row_group_size=DEFAULT_ROW_GROUP_SIZE, compression="zstd"):
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self.source = source
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._schema = pair_schema()
+        self._writer = pq.ParquetWriter(path, self._schema, compression=compression)
+        self._columns = ([], [], [], [])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, sentence_a, sentence_b, label):
+        sentences_a, sentences_b, labels, hashes = self._columns
+        sentences_a.append(sentence_a)
+        sentences_b.append(sentence_b)
+        labels.append(int(label))
+        hashes.append(content_hash(f"{sentence_a}\t{sentence_b}"))
+        self.rows += 1
+        if len(labels) >= self.row_group_size:
+            self.flush()
+
+    def writerow(self, row):
+        """csv.writer-compatible alias, so balancing and segmentation can write either format."""
+        self.write(*row[:3])
+
+    def flush(self):
+        import pyarrow as pa
+
+        sentences_a, sentences_b, labels, hashes = self._columns
+        if not labels:
+            return
+        source = pa.DictionaryArray.from_arrays(pa.array([0] * len(labels), pa.int32()), pa.array([self.source]))
+        table = pa.Table.from_arrays(
+            [pa.array(sentences_a, pa.string()), pa.array(sentences_b, pa.string()), pa.array(labels, pa.int8()),
+             source, pa.array(hashes, pa.uint64())],
+            schema=self._schema,
+        )
+        self._writer.write_table(table, row_group_size=len(labels))
+        self._columns = ([], [], [], [])
+
+    def close(self):
+        if self._writer is not None:
+            self.flush()
+            self._writer.close()
+            self._writer = None
+
+
+def iter_record_batches(paths, columns=None, batch_size=65_536):
+    """
+    Streams pyarrow RecordBatches from Parquet files (or every .parquet file of a directory) through
+    memory-mapped reads, so loading never copies a whole file into memory.
+    """
+    import pyarrow.parquet as pq
+
+    if isinstance(paths, (str, os.PathLike)):
+        if os.path.isdir(paths):
+            paths = sorted(os.path.join(paths, name) for name in os.listdir(paths) if name.endswith(".parquet"))
+        else:
+            paths = [paths]
+    for path in paths:
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+
+def iter_parquet_pairs(path, start_row=0):
+    """
+    Yields (sentence_a, sentence_b, label, rows_read) for the rows of a pair file from start_row on,
+    where rows_read is the row's 1-based position, usable as a resume offset. Labels come back as strings,
+    like rows read from CSV.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path, memory_map=True)
+    position = 0
+    for group in range(parquet_file.num_row_groups):
+        group_rows = parquet_file.metadata.row_group(group).num_rows
+        if position + group_rows <= start_row:
+            # Whole row groups before the resume point are skipped without being read
+            position += group_rows
+            continue
+        table = parquet_file.read_row_group(group, columns=["sentence_a", "sentence_b", "label"])
+        columns = [table.column(name).to_pylist() for name in ("sentence_a", "sentence_b", "label")]
+        for sentence_a, sentence_b, label in zip(*columns):
+            position += 1
+            if position > start_row:
+                yield sentence_a, sentence_b, str(label), position
@@ -0,0 +1,239 @@
+import os
+import glob
+import json
+import time
+import hashlib
+import inspect
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from pipeline_log import log_event
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                    DECLARATIVE STAGE RUNNER WITH INCREMENTAL REBUILDS                                     ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+
+def path_fingerprint(pattern):
+    """
+    Returns [(path, size, mtime_ns), ...] for a file, every file under a directory, or every match of a glob,
+    so any added, removed or modified input changes the fingerprint without reading file contents.
+    """
+    pattern = os.fspath(pattern)
+    if os.path.isdir(pattern):
+        paths = [os.path.join(root, name) for root, _, names in os.walk(pattern) for name in names]
+    elif os.path.isfile(pattern):
+        paths = [pattern]
+    else:
+        paths = glob.glob(pattern)
+    fingerprint = []
+    for path in sorted(paths):
+        stat = os.stat(path)
+        fingerprint.append((os.path.relpath(path), stat.st_size, stat.st_mtime_ns))
+    return fingerprint
+
+
+def outputs_exist(pattern):
+    pattern = os.fspath(pattern)
+    if os.path.isdir(pattern):
+        return any(names for _, _, names in os.walk(pattern))
+    return os.path.exists(pattern) or bool(glob.glob(pattern))
+
+
+def code_fingerprint(fn):
+    """Hashes a stage function's source, so editing the stage's code invalidates its cached result."""
+    try:
+        source = inspect.getsource(fn)
+    except (OSError, TypeError):
+        # No source file (e.g. defined interactively): fall back to the bytecode, never to a repr with an address
+        code = getattr(fn, "__code__", None)
+        if code:
+            source = code.co_code.hex() + " ".join(code.co_names)
+        else:
+            source = getattr(fn, "__qualname__", type(fn).__name__)
+    return hashlib.blake2b(source.encode("utf-8"), digest_size=8).hexdigest()
+
+
+@dataclass
+class Stage:
+    """
+    One pipeline step. fn() is called without arguments (bind its arguments with a lambda).
+    inputs and outputs are file paths, directories or glob patterns; params are the values that change
+    fn's result (seeds, sizes, modes) and must be JSON-serializable. deps names the stages whose results
+    this one consumes, in memory or on disk. code lists the functions fn calls whose source should also
+    invalidate the stage when edited. always=True stages (e.g. cleanup) run on every invocation.
+    rerun_with names upstream stages that must run again whenever this one runs: stages whose outputs
+    this one deletes once consumed, or that share state with it that only lives for one run.
+    """
+    name: str
+    fn: object
+    inputs: tuple = ()
+    outputs: tuple = ()
+    params: dict = field(default_factory=dict)
+    deps: tuple = ()
+    code: tuple = ()
+    always: bool = False
+    rerun_with: tuple = ()
+
+
+class PipelineRunner:
+    """
+    Runs registered stages in dependency order, skipping every stage that is up to date:
+    same input fingerprints, params and code as its last successful run, all outputs present,
+    and no upstream stage re-run since. The state of each completed stage is saved to state_path
+    right away, so an interrupted run resumes after its last completed stage.
+
+        runner = PipelineRunner("pipeline_state.json")
+        runner.add("balance", lambda: balance(...), inputs=["txt_files"], outputs=["output/balanced_*.txt"],
+                   params={"seed": seed})
+        runner.add("segment", lambda: segment(...), inputs=["output/balanced_*.txt"], deps=["balance"])
+        runner.run(force=["segment"])   # re-runs "segment" and whatever depends on it, nothing upstream
+    """
+
+    def __init__(self, state_path="pipeline_state.json"):
+        self.state_path = state_path
+        self.stages = {}
+        self.state = {}
+        if os.path.exists(state_path):
+            try:
+                with open(state_path, "r", encoding="utf-8") as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                message = f"Ignoring unreadable pipeline state {state_path}: {e}"
+                print(message)
+                log_event(message, level="warning")
+
+    def add(self, name, fn, inputs=(), outputs=(), params=None, deps=(), code=(), always=False, rerun_with=()):
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already registered")
+        for dep in (*deps, *rerun_with):
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep}")
+        self.stages[name] = Stage(name, fn, tuple(inputs), tuple(outputs), dict(params or {}), tuple(deps),
+                                  tuple(code), always, tuple(rerun_with))
+        return self.stages[name]
+
+    def output_paths(self):
+        """Returns the existing paths that match the outputs of any stage, e.g. for a cleanup stage to keep."""
+        paths = set()
+        for stage in self.stages.values():
+            for pattern in stage.outputs:
+                pattern = os.fspath(pattern)
+                paths.update([pattern] if os.path.exists(pattern) else glob.glob(pattern))
+        return paths
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def fingerprint(self, stage):
+        """Digest of everything a stage's result depends on; computed just before the stage would run."""
+        payload = {
+            "inputs": {str(pattern): path_fingerprint(pattern) for pattern in stage.inputs},
+            "params": stage.params,
+            "code": [code_fingerprint(fn) for fn in (stage.fn, *stage.code)],
+            "upstream": {dep: self.state.get(dep, {}).get("run_id") for dep in stage.deps},
+        }
+        encoded = json.dumps(payload, sort_keys=True, default=repr).encode("utf-8")
+        return hashlib.blake2b(encoded, digest_size=16).hexdigest()
+
+    def stale_reason(self, stage, fingerprint, force):
+        """Returns why a stage must run, or None if it is up to date."""
+        if stage.always:
+            return "always runs"
+        if stage.name in force:
+            return "forced"
+        recorded = self.state.get(stage.name)
+        if recorded is None:
+            return "never ran"
+        if recorded.get("fingerprint") != fingerprint:
+            recorded_upstream = recorded.get("upstream", {})
+            upstream = [dep for dep in stage.deps
+                        if self.state.get(dep, {}).get("run_id") != recorded_upstream.get(dep)]
+            return f"upstream re-ran: {', '.join(upstream)}" if upstream else "inputs, params or code changed"
+        missing = [pattern for pattern in stage.outputs if not outputs_exist(pattern)]
+        if missing:
+            return f"missing outputs: {', '.join(missing)}"
+        return None
+
+    def stale_stages(self, force=()):
+        """Returns {stage name: reason} for every stage a run with force would execute, without running any."""
+        saved_state = self.state
+        stale = {}
+        try:
+            for stage in self.stages.values():
+                reason = self.stale_reason(stage, self.fingerprint(stage), force)
+                if reason is not None:
+                    stale[stage.name] = reason
+                    self.state = dict(self.state, **{stage.name: {"run_id": f"dry-run-{stage.name}"}})
+        finally:
+            self.state = saved_state
+        return stale
+
+    def expand_force(self, force):
+        """Adds to force the rerun_with stages of every stage that would run, until none is missing."""
+        force = set(force)
+        while True:
+            missing = {(name, dep) for name in self.stale_stages(force)
+                       for dep in self.stages[name].rerun_with if dep not in force}
+            if not missing:
+                return force
+            for name, dep in sorted(missing):
+                message = f"Stage {dep}: forced, since {name} runs and must run with it"
+                print(message)
+                log_event(message, stage=dep)
+                force.add(dep)
+
+    def run(self, force=(), force_all=False, dry_run=False, metrics=None):
+        """
+        Runs the stale stages in registration order (which must list dependencies first) and returns
+        {stage name: "ran", "skipped" or the reason it would run (dry_run)}.
+        force lists stages to re-run even if up to date; their downstream stages follow automatically,
+        while unrelated and upstream stages stay cached, except the rerun_with stages of any stage that runs.
+        force_all re-runs everything.
+        Pass a stage_metrics.MetricsRecorder as metrics to measure every stage that runs.
+        """
+        force = set(self.stages) if force_all else set(force)
+        unknown = force - set(self.stages)
+        if unknown:
+            raise ValueError(f"Unknown stages: {', '.join(sorted(unknown))}")
+        force = self.expand_force(force)
+
+        saved_state = self.state
+        results = {}
+        for stage in self.stages.values():
+            fingerprint = self.fingerprint(stage)
+            reason = self.stale_reason(stage, fingerprint, force)
+            if reason is None:
+                results[stage.name] = "skipped"
+                message = f"Stage {stage.name}: up to date, skipped"
+                print(message)
+                log_event(message, stage=stage.name)
+                continue
+            if dry_run:
+                results[stage.name] = reason
+                # Assume it ran, so its dependents show up as stale too
+                self.state = dict(self.state, **{stage.name: {"run_id": f"dry-run-{stage.name}"}})
+                continue
+
+            message = f"Stage {stage.name}: running ({reason})"
+            print(message)
+            log_event(message, stage=stage.name)
+            started = time.time()
+            with metrics.stage(stage.name, stage.inputs, stage.outputs) if metrics else nullcontext():
+                stage.fn()
+            self.state[stage.name] = {
+                "fingerprint": fingerprint,
+                "upstream": {dep: self.state.get(dep, {}).get("run_id") for dep in stage.deps},
+                "params": stage.params,
+                "run_id": f"{started:.6f}",
+                "seconds": round(time.time() - started, 3),
+            }
+            self._save_state()
+            results[stage.name] = "ran"
+        if dry_run:
+            self.state = saved_state
+        return results
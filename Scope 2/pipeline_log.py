@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
+import multiprocessing
+from datetime import datetime
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                       QUEUE-BACKED STRUCTURED (JSON) EVENT LOG                                            ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+DEFAULT_LOG_PATH = "pipeline.log"
+
+_STOP = "__stop__"
+_queue = None
+_writer = None
+
+
+class EventLogWriter:
+    """
+    The single writer of the event log: a thread that appends every event to path as one JSON line.
+    The file stays open and is flushed every flush_every events or flush_interval seconds, whichever comes
+    first, instead of being opened and closed per line.
+    Events of this process go through an in-process queue; pool workers put theirs on a multiprocessing queue
+    (worker_queue) that a second thread forwards to the writer. Only the process that created the writer closes it.
+    """
+
+    def __init__(self, path=DEFAULT_LOG_PATH, flush_every=256, flush_interval=1.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.owner_pid = os.getpid()
+        self.events = queue.SimpleQueue()
+        self.worker_queue = multiprocessing.Queue()
+        self._file = open(path, "a", encoding="utf-8", buffering=64 * 1024)
+        self._forwarder = threading.Thread(target=self._forward_loop, name="event-log-forwarder", daemon=True)
+        self._thread = threading.Thread(target=self._write_loop, name="event-log-writer", daemon=True)
+        self._forwarder.start()
+        self._thread.start()
+
+    def _forward_loop(self):
+        while True:
+            event = self.worker_queue.get()
+            self.events.put(event)
+            if event == _STOP:
+                break
+
+    def _write_loop(self):
+        pending = 0
+        last_flush = time.monotonic()
+        while True:
+            try:
+                event = self.events.get(timeout=self.flush_interval)
+            except queue.Empty:
+                event = None
+            if event == _STOP:
+                break
+            if event is not None:
+                self._file.write(json.dumps(event, ensure_ascii=False, default=str) + "\n")
+                pending += 1
+            if pending and (pending >= self.flush_every or time.monotonic() - last_flush >= self.flush_interval):
+                self._file.flush()
+                pending = 0
+                last_flush = time.monotonic()
+        self._file.flush()
+        self._file.close()
+
+    def close(self):
+        if os.getpid() != self.owner_pid:
+            return
+        # Sent through the worker queue, so the writer stops only after every worker event was forwarded
+        self.worker_queue.put(_STOP)
+        self._forwarder.join()
+        self._thread.join()
+
+
+def _use_worker_queue():
+    # In a forked child the in-process queue has no reader: send events to the parent's writer instead
+    global _queue
+    if _writer is not None:
+        _queue = _writer.worker_queue
+
+
+os.register_at_fork(after_in_child=_use_worker_queue)
+
+
+def start_logging(path=DEFAULT_LOG_PATH, flush_every=256, flush_interval=1.0):
+    """
+    Starts the event log writer of this process, unless events already have somewhere to go
+    (a running writer, or the parent's queue in a pool worker). log_event() calls this itself on first use,
+    so scripts only need it to change the defaults.
+    """
+    global _queue, _writer
+    if _queue is None:
+        _writer = EventLogWriter(path, flush_every, flush_interval)
+        _queue = _writer.events
+        atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Writes out every queued event and closes the log. Registered with atexit by start_logging."""
+    global _queue, _writer
+    if _writer is not None and _writer.owner_pid == os.getpid():
+        _writer.close()
+        _writer = None
+        _queue = None
+
+
+def log_queue():
+    """Returns the multiprocessing queue of the writer (starting it if needed), to hand to attach_worker."""
+    start_logging()
+    return _writer.worker_queue if _writer is not None else _queue
+
+
+def attach_worker(event_queue):
+    """
+    Pool initializer that routes a worker's events to the parent's writer:
+        ProcessPoolExecutor(initializer=attach_worker, initargs=(log_queue(),))
+    Needed for spawned workers; forked workers already inherit the queue.
+    """
+    global _queue
+    _queue = event_queue
+
+
+def log_event(message, stage=None, duration=None, rows=None, **fields):
+    """
+    Queues one event for the log and returns immediately; the writer thread does the file I/O.
+    Events are JSON objects with time, pid and message, plus stage, duration (seconds) and rows when given
+    and any extra keyword fields.
+    """
+    event = {"time": datetime.now().isoformat(timespec="milliseconds"), "pid": os.getpid(), "message": str(message)}
+    for key, value in (("stage", stage), ("duration", duration), ("rows", rows)):
+        if value is not None:
+            event[key] = value
+    event.update(fields)
+    if _queue is None:
+        start_logging()
+    _queue.put(event)
+
+
+def benchmark_logging(num_events=100_000, path="benchmark_pipeline.log"):
+    """
+    Compares the time per log_event call of the previous open/append/close logger with the queued writer,
+    and the time until the queued events are all on disk.
+    """
+    def log_event_per_line(message):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(path, "a", encoding="utf-8") as log_file:
+            log_file.write(f"[{timestamp}] {message}\n")
+
+    started = time.perf_counter()
+    for i in range(num_events):
+        log_event_per_line(f"Processed batch {i}")
+    per_line = (time.perf_counter() - started) / num_events
+    os.remove(path)
+
+    start_logging(path)
+    started = time.perf_counter()
+    for i in range(num_events):
+        log_event(f"Processed batch {i}", stage="benchmark", rows=i)
+    queued = (time.perf_counter() - started) / num_events
+    stop_logging()
+    drained = time.perf_counter() - started
+    os.remove(path)
+
+    print(f"open/append/close: {per_line * 1e6:.1f} us/event")
+    print(f"queued writer:     {queued * 1e6:.1f} us/event in the caller, {drained:.2f} s until all "
+          f"{num_events} events were written")
+
+
+if __name__ == "__main__":
+    benchmark_logging()
@@ -0,0 +1,88 @@
+import os
+import csv
+import json
+from pipeline_log import log_event
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                          BYTE-OFFSET CHECKPOINTS FOR RESUMABLE JOBS                                       ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+
+def iter_lines_with_offsets(f_in):
+    """
+    Yields (line, end_offset) for the lines of a binary file from its current position, where end_offset is
+    the byte offset just after the line, so seeking there resumes with the next line.
+    """
+    offset = f_in.tell()
+    for raw_line in iter(f_in.readline, b""):
+        offset += len(raw_line)
+        yield raw_line.decode("utf-8").rstrip("\r\n"), offset
+
+
+def iter_csv_records_with_offsets(f_in, **fmtparams):
+    """
+    Yields (row, end_offset) for the CSV records of a binary file from its current position, where end_offset
+    is the byte offset just after the record. One csv.reader reads every line, so a quoted field may span
+    lines; the reader never reads past the end of a record, so the bytes read so far end exactly there.
+    Blank lines come out as empty rows.
+    """
+    offset = f_in.tell()
+
+    def lines():
+        nonlocal offset
+        for raw_line in iter(f_in.readline, b""):
+            offset += len(raw_line)
+            yield raw_line.decode("utf-8")
+
+    for row in csv.reader(lines(), **fmtparams):
+        yield row, offset
+
+
+class FileCheckpoint:
+    """
+    Progress of a job over one input file, saved as JSON next to its outputs.
+    The state records the input's path, size and mtime; if the input changed since, load() starts over.
+    Saves go through a temp file and os.replace, so a kill mid-save leaves the previous checkpoint intact.
+    """
+
+    def __init__(self, checkpoint_path, input_path):
+        self.checkpoint_path = checkpoint_path
+        self.input_path = input_path
+
+    def _input_signature(self):
+        stat = os.stat(self.input_path)
+        return {"input_path": os.path.abspath(self.input_path), "input_size": stat.st_size,
+                "input_mtime_ns": stat.st_mtime_ns}
+
+    def load(self, **defaults):
+        """Returns the saved state, or defaults with offset 0 and done False if there is no valid checkpoint."""
+        state = dict(defaults, offset=0, done=False)
+        if os.path.exists(self.checkpoint_path):
+            try:
+                with open(self.checkpoint_path, "r", encoding="utf-8") as f:
+                    saved = json.load(f)
+            except (OSError, ValueError) as e:
+                message = f"Ignoring unreadable checkpoint {self.checkpoint_path}: {e}"
+                print(message)
+                log_event(message, level="warning")
+                return state
+            if all(saved.get(key) == value for key, value in self._input_signature().items()):
+                state.update(saved)
+            else:
+                message = f"{self.input_path} changed since {self.checkpoint_path} was saved, starting over"
+                print(message)
+                log_event(message)
+        return state
+
+    def save(self, **state):
+        state.update(self._input_signature())
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def clear(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
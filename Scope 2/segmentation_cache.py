@@ -0,0 +1,139 @@
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                      PERSISTENT SEGMENTATION CACHE (LRU + SQLITE)                                         ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+
+def normalize_sentence(text):
+    """Collapses whitespace, as segment_batch does before sending a sentence to Farasa."""
+    return " ".join(text.split())
+
+
+def sentence_key(text, namespace=""):
+    """
+    128-bit key of a normalized sentence. 64 bits would make a collision likely over a billion sentences,
+    and a collision here silently returns another sentence's segmentation.
+    """
+    return hashlib.blake2b(f"{namespace}\0{normalize_sentence(text)}".encode("utf-8"), digest_size=16).digest()
+
+
+class SegmentationCache:
+    """
+    Maps sentence keys to segmented output, in two tiers: an in-memory LRU of memory_entries sentences in front
+    of an SQLite file that persists across runs. The file is in WAL mode with a busy timeout, so several
+    processes (pool workers or parallel runs) can open the same path and share it.
+    namespace separates outputs of different segmenters (e.g. "farasa" and "stub") stored in one file.
+    Failed segmentations (None) are never cached. One instance may be shared by several threads.
+    """
+
+    def __init__(self, path, memory_entries=100_000, namespace="", commit_every=10_000):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.namespace = namespace
+        self.commit_every = commit_every
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS segments (key BLOB PRIMARY KEY, segmented TEXT) WITHOUT ROWID")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def key(self, text):
+        return sentence_key(text, self.namespace)
+
+    def _remember(self, key, segmented):
+        self._lru[key] = segmented
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.memory_entries:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys):
+        """Returns {key: segmented} for the keys found in memory or on disk, counting a hit or miss per key."""
+        with self._lock:
+            return self._get_many(keys)
+
+    def _get_many(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                found[key] = self._lru[key]
+                self.memory_hits += 1
+            else:
+                missing.append(key)
+        unique_missing = list(dict.fromkeys(missing))
+        # SQLite allows at most 999 bound parameters per statement in older builds
+        for start in range(0, len(unique_missing), 900):
+            chunk = unique_missing[start:start + 900]
+            rows = self._connection.execute(
+                f"SELECT key, segmented FROM segments WHERE key IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall()
+            for key, segmented in rows:
+                found[key] = segmented
+                self._remember(key, segmented)
+        for key in missing:
+            if key in found:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        return found
+
+    def get(self, text):
+        key = self.key(text)
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items):
+        """Stores (key, segmented) pairs, skipping failed (None) segmentations."""
+        items = [(key, segmented) for key, segmented in items if segmented is not None]
+        if not items:
+            return
+        with self._lock:
+            self._put_many(items)
+
+    def _put_many(self, items):
+        for key, segmented in items:
+            self._remember(key, segmented)
+        self._connection.executemany("INSERT OR REPLACE INTO segments (key, segmented) VALUES (?, ?)", items)
+        self._pending += len(items)
+        if self._pending >= self.commit_every:
+            self._connection.commit()
+            self._pending = 0
+
+    def put(self, text, segmented):
+        self.put_many([(self.key(text), segmented)])
+
+    def stats(self):
+        """Returns the lookup counts and the overall hit rate since the cache was opened."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hits = self.memory_hits + self.disk_hits
+        return {
+            "lookups": lookups,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.commit()
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,208 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pipeline_log import attach_worker, log_event, log_queue
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                       BATCHED, MULTIPROCESS FARASA SEGMENTATION                                           ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+
+class StubSegmenter:
+    """
+    Stand-in for FarasaSegmenter that needs no JVM, for trying and benchmarking the pool.
+    Splits the definite article ("ال+كتاب") line by line like Farasa does, and sleeps call_overhead
+    seconds per segment() call to mimic Farasa's per-invocation cost.
+    """
+
+    def __init__(self, call_overhead=0.0):
+        self.call_overhead = call_overhead
+
+    def segment(self, text):
+        if self.call_overhead:
+            time.sleep(self.call_overhead)
+        return "\n".join(
+            " ".join(f"ال+{word[2:]}" if word.startswith("ال") and len(word) > 2 else word for word in line.split())
+            for line in text.split("\n")
+        )
+
+
+def make_segmenter(kind="farasa", **kwargs):
+    """Creates a "farasa" (FarasaSegmenter, interactive=False by default) or "stub" segmenter."""
+    if kind == "stub":
+        return StubSegmenter(**kwargs)
+    if kind == "farasa":
+        from farasa.segmenter import FarasaSegmenter
+
+        kwargs.setdefault("interactive", False)
+        return FarasaSegmenter(**kwargs)
+    raise ValueError(f"Unknown segmenter: {kind}")
+
+
+def segment_one(segmenter, text):
+    """Segments one sentence, returning None if Farasa cannot decode it."""
+    try:
+        return segmenter.segment(text)
+    except UnicodeDecodeError as e:
+        message = f"UnicodeDecodeError while segmenting text: {text[:30]}... Error: {e}"
+        print(message)
+        log_event(message, level="warning")
+        return None
+
+
+def segment_batch(segmenter, sentences):
+    """
+    Segments many sentences with a single Farasa call by joining them with newlines, which Farasa
+    processes line by line and keeps. Newlines inside a sentence are replaced by spaces first.
+    If the call fails or the output does not split back into one line per sentence, the batch
+    falls back to one call per sentence. Returns one result per sentence (None for failures).
+    """
+    cleaned = [" ".join(sentence.split()) for sentence in sentences]
+    try:
+        output = segmenter.segment("\n".join(cleaned)).split("\n")
+        if len(output) == len(cleaned):
+            return [line.strip() for line in output]
+        message = f"Batched segmentation returned {len(output)} lines for {len(cleaned)} sentences, retrying one by one"
+    except UnicodeDecodeError as e:
+        message = f"Batched segmentation failed ({e}), retrying one by one"
+    print(message)
+    log_event(message, level="warning")
+    return [segment_one(segmenter, sentence) for sentence in cleaned]
+
+
+_worker_segmenter = None
+
+
+def _init_worker(kind, segmenter_kwargs, event_queue):
+    # Each pool process starts its own segmenter (and JVM) once and keeps it for every batch
+    global _worker_segmenter
+    attach_worker(event_queue)
+    _worker_segmenter = make_segmenter(kind, **segmenter_kwargs)
+
+
+def _segment_in_worker(sentences):
+    return segment_batch(_worker_segmenter, sentences)
+
+
+class SegmentationPool:
+    """
+    Segments a stream of sentences on `workers` segmenter processes, batch_size sentences per Farasa call.
+    Results are yielded in input order, and at most 2 * workers batches are in flight, so memory stays
+    bounded on any input size. With workers=0 everything runs in the calling process.
+    With a SegmentationCache, every batch is looked up in the calling process first and only the distinct
+    sentences missing from it are sent to the workers, so all workers share one cache and results are
+    stored once, whichever worker produced them. Several threads may stream through one pool at once.
+
+        with SegmentationPool(workers=8) as pool:
+            for segmented in pool.segment_stream(sentences):
+                ...
+    """
+
+    def __init__(self, workers=4, batch_size=500, kind="farasa", cache=None, **segmenter_kwargs):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.kind = kind
+        self.cache = cache
+        self.segmenter_kwargs = segmenter_kwargs
+        self._executor = None
+        self._segmenter = None
+        # Threads may share the pool; the in-process segmenter must only see one batch at a time
+        self._segmenter_lock = threading.Lock()
+
+    def __enter__(self):
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker,
+                initargs=(self.kind, self.segmenter_kwargs, log_queue())
+            )
+        else:
+            self._segmenter = make_segmenter(self.kind, **self.segmenter_kwargs)
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _batches(self, sentences):
+        batch = []
+        for sentence in sentences:
+            batch.append(sentence)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _lookup(self, batch):
+        """Returns (keys, found, missing_keys, missing_sentences) of a batch; keys is None without a cache."""
+        if self.cache is None:
+            return None, None, None, batch
+        keys = [self.cache.key(sentence) for sentence in batch]
+        found = self.cache.get_many(keys)
+        missing = {}
+        for key, sentence in zip(keys, batch):
+            if key not in found and key not in missing:
+                missing[key] = sentence
+        return keys, found, list(missing), list(missing.values())
+
+    def _merge(self, keys, found, missing_keys, results):
+        if keys is None:
+            return results
+        self.cache.put_many(zip(missing_keys, results))
+        found.update(zip(missing_keys, results))
+        return [found[key] for key in keys]
+
+    def segment_batches(self, sentences):
+        """Yields lists of segmented sentences (None for failures), one list per input batch, in order."""
+        if self._executor is None:
+            for batch in self._batches(sentences):
+                keys, found, missing_keys, to_segment = self._lookup(batch)
+                with self._segmenter_lock:
+                    results = segment_batch(self._segmenter, to_segment) if to_segment else []
+                yield self._merge(keys, found, missing_keys, results)
+            return
+
+        in_flight = deque()
+        for batch in self._batches(sentences):
+            keys, found, missing_keys, to_segment = self._lookup(batch)
+            future = self._executor.submit(_segment_in_worker, to_segment) if to_segment else None
+            in_flight.append((keys, found, missing_keys, future))
+            if len(in_flight) >= 2 * self.workers:
+                keys, found, missing_keys, future = in_flight.popleft()
+                yield self._merge(keys, found, missing_keys, future.result() if future else [])
+        while in_flight:
+            keys, found, missing_keys, future = in_flight.popleft()
+            yield self._merge(keys, found, missing_keys, future.result() if future else [])
+
+    def segment_stream(self, sentences):
+        """Yields one segmented sentence (or None) per input sentence, in order."""
+        for results in self.segment_batches(sentences):
+            yield from results
+
+
+def benchmark_segmentation(num_sentences=20000, workers=(0, 1, 2, 4), batch_sizes=(1, 100, 1000), call_overhead=0.05):
+    """
+    Measures sentences/sec of SegmentationPool with the stub segmenter, whose call_overhead stands in for
+    Farasa's per-call JVM cost. batch_size=1 with workers=0 is the old one-call-per-sentence behaviour;
+    it is only run on the first 200 sentences to keep the benchmark short.
+    """
+    sentences = [f"الكتاب الجديد في المكتبة رقم {i} والقلم على الطاولة" for i in range(num_sentences)]
+    for batch_size in batch_sizes:
+        for worker_count in workers:
+            sample = sentences[:200] if batch_size == 1 else sentences
+            started = time.perf_counter()
+            with SegmentationPool(worker_count, batch_size, kind="stub", call_overhead=call_overhead) as pool:
+                count = sum(1 for _ in pool.segment_stream(sample))
+            rate = count / (time.perf_counter() - started)
+            print(f"batch_size={batch_size:>5} workers={worker_count}: {rate:,.0f} sentences/sec")
+
+
+if __name__ == "__main__":
+    benchmark_segmentation()
@@ -0,0 +1,105 @@
+import os
+from dataclasses import dataclass
+from concurrent.futures import ProcessPoolExecutor
+from pipeline_log import attach_worker, log_event, log_queue
+from stage_metrics import merge_counts, run_counted
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                            MULTIPROCESS SHARDED EXECUTOR                                                  ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+DEFAULT_SHARD_BYTES = 64 * 1024 * 1024
+
+
+@dataclass(frozen=True)
+class Shard:
+    """
+    Byte range [start, end) of a file. A shard owns every line whose first byte falls inside its range.
+    """
+    path: str
+    start: int
+    end: int
+    index: int
+
+
+def plan_shards(paths, shard_bytes=DEFAULT_SHARD_BYTES):
+    """
+    Splits every file into byte-range shards of at most shard_bytes, numbered in file then offset order.
+    Small files become a single shard.
+    """
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        start = 0
+        while True:
+            end = min(start + shard_bytes, size)
+            shards.append(Shard(str(path), start, end, len(shards)))
+            if end >= size:
+                break
+            start = end
+    return shards
+
+
+def iter_shard_lines(shard, encoding="utf-8"):
+    """
+    Yields the decoded lines owned by a shard. A line crossing the end of the range is read to its end,
+    and the partial line at the start of the range is left to the previous shard.
+    """
+    with open(shard.path, "rb") as f:
+        position = shard.start
+        if shard.start > 0:
+            # If the previous byte is a newline, readline() only consumes it and the first line is ours
+            f.seek(shard.start - 1)
+            position = shard.start - 1 + len(f.readline())
+        while position < shard.end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode(encoding)
+
+
+def shard_part_path(output_path, shard):
+    """Returns the temporary part file a shard writes for output_path."""
+    return f"{output_path}.part{shard.index:05d}"
+
+
+def resolve_workers(workers=None):
+    """Returns the worker count to use: workers if given, else every available core."""
+    return workers or os.cpu_count() or 1
+
+
+def _init_worker(event_queue, initializer, initargs):
+    attach_worker(event_queue)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+def run_sharded(worker, tasks, workers=None, initializer=None, initargs=()):
+    """
+    Calls worker(*task) for every task tuple on a process pool and returns the results in task order.
+    worker must be a module-level function so it can be pickled. With one worker or one task,
+    everything runs in this process. Rows the workers count (stage_metrics.add_rows/add_dropped)
+    are added to the calling process's running stage.
+    initializer(*initargs) runs once in every worker before its first task (or once here when running
+    in-process), e.g. to load a model or tokenizer into a module global the worker function reads.
+    """
+    tasks = list(tasks)
+    workers = min(resolve_workers(workers), len(tasks))
+    if workers <= 1:
+        if initializer is not None:
+            initializer(*initargs)
+        return [worker(*task) for task in tasks]
+
+    message = f"Running {worker.__name__} over {len(tasks)} shards with {workers} processes"
+    print(message)
+    log_event(message)
+    # Workers send their log events to this process's single log writer
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(log_queue(), initializer, initargs)) as executor:
+        outcomes = list(executor.map(run_counted, [worker] * len(tasks), *zip(*tasks)))
+    for _, counts in outcomes:
+        merge_counts(counts)
+    return [result for result, _ in outcomes]
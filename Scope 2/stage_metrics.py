@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from pipeline_dag import path_fingerprint
+from pipeline_log import log_event
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                    PER-STAGE THROUGHPUT AND RESOURCE METRICS                                              ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+_lock = threading.Lock()
+# Metrics the counting helpers add to: the running stage, or the current pool task inside a worker
+_active = None
+
+
+@dataclass
+class StageMetrics:
+    """
+    What one stage did. cpu_seconds covers this process and the pool workers that finished within the stage;
+    peak_rss_bytes is the largest sampled RSS of this process plus its children. bytes_in/bytes_out are the
+    sizes of the stage's input and output files; rows and per-filter drops come from the counting helpers.
+    """
+    name: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    rows_in: int = 0
+    rows_out: int = 0
+    dropped: dict = field(default_factory=dict)
+
+    def add(self, rows_in=0, rows_out=0, dropped=None):
+        with _lock:
+            self.rows_in += rows_in
+            self.rows_out += rows_out
+            for filter_name, count in (dropped or {}).items():
+                if count:
+                    self.dropped[filter_name] = self.dropped.get(filter_name, 0) + count
+
+
+def add_rows(rows_in=0, rows_out=0):
+    """Counts rows read and written by the running stage; a no-op outside a measured stage."""
+    if _active is not None:
+        _active.add(rows_in=rows_in, rows_out=rows_out)
+
+
+def add_dropped(dropped):
+    """Counts rows dropped by each filter of the running stage, given as {filter name: count}."""
+    if _active is not None:
+        _active.add(dropped=dropped)
+
+
+def counted_rows(rows):
+    """Yields rows unchanged and counts them as rows_in of the running stage, even if the stream stops early."""
+    count = 0
+    try:
+        for row in rows:
+            count += 1
+            yield row
+    finally:
+        add_rows(rows_in=count)
+
+
+def run_counted(fn, *args):
+    """
+    Calls fn(*args) with its own counters and returns (result, counts), so rows counted inside a pool worker
+    can be merged into the parent's stage with merge_counts (see sharded_executor.run_sharded).
+    """
+    global _active
+    saved = _active
+    _active = StageMetrics("task")
+    try:
+        result = fn(*args)
+        return result, {"rows_in": _active.rows_in, "rows_out": _active.rows_out, "dropped": _active.dropped}
+    finally:
+        _active = saved
+
+
+def merge_counts(counts):
+    if _active is not None:
+        _active.add(**counts)
+
+
+def paths_bytes(patterns):
+    return sum(size for pattern in patterns for _, size, _ in path_fingerprint(pattern))
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class _RssSampler:
+    """Samples the RSS of this process and its children every interval seconds on a daemon thread."""
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def sample(self):
+        import psutil
+
+        rss = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        if self._process is not None:
+            self.sample()
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self._process is not None:
+            self._stop.set()
+            self._thread.join()
+            self.sample()
+        else:
+            # Without psutil, fall back to the lifetime peak of this process (Linux reports kilobytes)
+            import resource
+            self.peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MetricsRecorder:
+    """
+    Collects StageMetrics for every stage measured with stage(), prints them as a table with report()
+    and saves them as JSON with save(), for comparing runs.
+
+        metrics = MetricsRecorder()
+        with metrics.stage("balance_text", inputs=["txt_files"], outputs=["output/balanced_processed_*"]):
+            ...   # add_rows / add_dropped calls made here (or in run_sharded workers) count toward the stage
+        print(metrics.report())
+        metrics.save("metrics/run.json")
+    """
+
+    def __init__(self, rss_interval=0.2):
+        self.rss_interval = rss_interval
+        self.started = datetime.now()
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, inputs=(), outputs=()):
+        global _active
+        metrics = StageMetrics(name, bytes_in=paths_bytes(inputs))
+        saved = _active
+        _active = metrics
+        wall_started = time.perf_counter()
+        cpu_started = _cpu_seconds()
+        try:
+            with _RssSampler(self.rss_interval) as sampler:
+                yield metrics
+        finally:
+            _active = saved
+            metrics.wall_seconds = round(time.perf_counter() - wall_started, 3)
+            metrics.cpu_seconds = round(_cpu_seconds() - cpu_started, 3)
+            metrics.peak_rss_bytes = sampler.peak
+            metrics.bytes_out = paths_bytes(outputs)
+            self.stages.append(metrics)
+
+    def report(self):
+        lines = [f"{'stage':<22}{'wall s':>10}{'cpu s':>10}{'peak MB':>10}{'MB in':>10}{'MB out':>10}"
+                 f"{'rows in':>12}{'rows out':>12}{'rows/s':>10}  dropped"]
+        for metrics in self.stages:
+            rate = metrics.rows_out / metrics.wall_seconds if metrics.wall_seconds else 0.0
+            dropped = ", ".join(f"{name}={count}" for name, count in sorted(metrics.dropped.items())) or "-"
+            lines.append(f"{metrics.name:<22}{metrics.wall_seconds:>10.1f}{metrics.cpu_seconds:>10.1f}"
+                         f"{metrics.peak_rss_bytes / 2**20:>10.0f}{metrics.bytes_in / 2**20:>10.1f}"
+                         f"{metrics.bytes_out / 2**20:>10.1f}{metrics.rows_in:>12}{metrics.rows_out:>12}"
+                         f"{rate:>10.0f}  {dropped}")
+        return "\n".join(lines)
+
+    def as_dict(self):
+        return {
+            "started": self.started.isoformat(timespec="seconds"),
+            "stages": [asdict(metrics) for metrics in self.stages],
+            "total_wall_seconds": round(sum(metrics.wall_seconds for metrics in self.stages), 3),
+            "peak_rss_bytes": max((metrics.peak_rss_bytes for metrics in self.stages), default=0),
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, indent=2)
+        log_event(f"Saved stage metrics to {path}")
+        return path
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from dedup import BloomFilter, Deduplicator, DiskHashSet, MemoryHashSet
+
+
+class DedupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "dedup_hashes.sqlite")
+        self.text = " ".join(f"word{i}" for i in range(60))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_exact_duplicates_across_sources(self):
+        for backend in ("memory", "bloom", "disk"):
+            deduplicator = Deduplicator("exact", backend, path=self.path, bloom_capacity=1000)
+            kept = [deduplicator.check(text, "first") for text in ("a", "b", "a", "c")]
+            kept += [deduplicator.check(text, "second") for text in ("b", "d")]
+            self.assertEqual(kept, [True, True, False, True, False, True], backend)
+            report = deduplicator.report()
+            self.assertEqual(report["first"]["exact_duplicates"], 1)
+            self.assertAlmostEqual(report["first"]["dedup_ratio"], 0.25)
+            self.assertAlmostEqual(report["second"]["dedup_ratio"], 0.5)
+            deduplicator.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def test_near_duplicates_with_small_edits_are_dropped(self):
+        deduplicator = Deduplicator("near", "memory")
+        edited = self.text.replace("word30", "wordX")
+        other = " ".join(f"other{i}" for i in range(60))
+        self.assertEqual([deduplicator.check(text) for text in (self.text, edited, other)], [True, False, True])
+        self.assertEqual(deduplicator.report()["default"]["near_duplicates"], 1)
+        deduplicator.close()
+
+    def test_band_keys_persist_with_the_disk_backend(self):
+        deduplicator = Deduplicator("both", "disk", path=self.path)
+        self.assertTrue(deduplicator.check(self.text))
+        deduplicator.close()
+        reopened = Deduplicator("near", "disk", path=self.path)
+        self.assertFalse(reopened.check(self.text.replace("word10", "wordY")))
+        reopened.close()
+
+    def test_disk_hash_set_round_trips_unsigned_hashes(self):
+        values = [0, 1, 2**63 - 1, 2**63, 2**64 - 1]
+        hashes = DiskHashSet(self.path)
+        self.assertEqual([hashes.add(value) for value in values], [True] * len(values))
+        hashes.close()
+        reopened = DiskHashSet(self.path)
+        self.assertEqual([reopened.add(value) for value in values], [False] * len(values))
+        self.assertTrue(reopened.add(2**64 - 2))
+        reopened.close()
+
+    def test_in_memory_sets_agree(self):
+        for hashes in (MemoryHashSet(), BloomFilter(capacity=1000, error_rate=1e-6)):
+            self.assertTrue(hashes.add(2**64 - 1))
+            self.assertFalse(hashes.add(2**64 - 1))
+            self.assertTrue(hashes.add(12345))
+            hashes.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
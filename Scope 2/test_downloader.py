@@ -0,0 +1,129 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pipeline_log
+from downloader import DownloadItem, DownloadManifest, download_item
+
+PAYLOAD = os.urandom(256 * 1024)
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves PAYLOAD with Range support. The server's script lists what each request should do."""
+
+    def do_GET(self):
+        self.server.requests.append(self.headers.get("Range"))
+        action = self.server.script.pop(0) if self.server.script else "ok"
+        if action == "503":
+            self.send_error(503)
+            return
+
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header:
+            start = int(range_header.split("=")[1].rstrip("-"))
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(PAYLOAD) - 1}/{len(PAYLOAD)}")
+        else:
+            self.send_response(200)
+        body = PAYLOAD[start:]
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if action == "drop":
+            # Promise the whole body, send half of it and hang up
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.connection.close()
+            return
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "pipeline.log")
+        pipeline_log.start_logging(self.log_path, flush_every=1)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        self.server.requests = []
+        self.server.script = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{self.server.server_address[1]}/corpus.bz2"
+        self.item = DownloadItem("corpus", url, os.path.join(self.tmp.name, "corpus.bz2"))
+        self.manifest = DownloadManifest(os.path.join(self.tmp.name, "download_manifest.json"))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        pipeline_log.stop_logging()
+        self.tmp.cleanup()
+
+    def download(self):
+        # Small chunks, so the half body sent before a dropped connection reaches the .part file
+        return download_item(self.item, self.manifest, retries=3, backoff=0.01, chunk_size=16 * 1024)
+
+    def logged_messages(self):
+        pipeline_log.stop_logging()
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            return [json.loads(line)["message"] for line in f]
+
+    def test_dropped_connection_resumes_with_range(self):
+        self.server.script = ["drop"]
+        self.assertEqual(self.download(), "downloaded")
+
+        with open(self.item.output_path, "rb") as f:
+            self.assertEqual(f.read(), PAYLOAD)
+        self.assertIsNone(self.server.requests[0])
+        resumed_from = int(self.server.requests[1].split("=")[1].rstrip("-"))
+        self.assertTrue(0 < resumed_from <= len(PAYLOAD) // 2)
+        self.assertEqual(self.manifest.entries["corpus"]["sha256"], hashlib.sha256(PAYLOAD).hexdigest())
+        self.assertFalse(os.path.exists(f"{self.item.output_path}.part"))
+        messages = self.logged_messages()
+        self.assertTrue(any(message.startswith("Download of corpus failed") for message in messages))
+        self.assertIn(f"Resuming corpus from byte {resumed_from}", messages)
+
+    def test_manifest_skips_completed_download(self):
+        self.assertEqual(self.download(), "downloaded")
+        reopened = DownloadManifest(self.manifest.manifest_path)
+        self.assertEqual(download_item(self.item, reopened), "skipped")
+        self.assertEqual(len(self.server.requests), 1)
+
+        # A truncated file on disk no longer matches the manifest and is fetched again
+        with open(self.item.output_path, "r+b") as f:
+            f.truncate(10)
+        self.assertEqual(download_item(self.item, reopened), "downloaded")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_recorded_outputs_skip_until_removed(self):
+        output = os.path.join(self.tmp.name, "extracted_corpus.txt")
+        with open(output, "w", encoding="utf-8") as f:
+            f.write("text\n")
+        self.manifest.record_outputs("corpus", self.item.url, [output])
+
+        reopened = DownloadManifest(self.manifest.manifest_path)
+        self.assertEqual(reopened.finished_outputs("corpus", self.item.url), [output])
+        self.assertIsNone(reopened.finished_outputs("corpus", f"{self.item.url}?v=2"))
+        os.remove(output)
+        self.assertIsNone(reopened.finished_outputs("corpus", self.item.url))
+
+        # An archive deleted after extraction is downloaded again once its entry is forgotten
+        self.assertEqual(self.download(), "downloaded")
+        self.manifest.mark_extracted("corpus")
+        os.remove(self.item.output_path)
+        self.assertEqual(self.download(), "skipped")
+        self.manifest.forget("corpus")
+        self.assertEqual(self.download(), "downloaded")
+
+    def test_retryable_status_is_retried(self):
+        self.server.script = ["503"]
+        self.assertEqual(self.download(), "downloaded")
+        self.assertEqual(len(self.server.requests), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+import pipeline_log
+from external_shuffle import ExternalShuffle, shuffle_file
+
+
+class ExternalShuffleTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        pipeline_log.start_logging(os.path.join(self.tmp.name, "pipeline.log"))
+        self.lines = [f"جملة رقم {i}\n" for i in range(2000)]
+
+    def tearDown(self):
+        pipeline_log.stop_logging()
+        self.tmp.cleanup()
+
+    def shuffled(self, memory_bytes, seed=1, num_buckets=None):
+        with ExternalShuffle(memory_bytes, seed, self.tmp.name, num_buckets) as shuffler:
+            shuffler.scatter(self.lines)
+            return list(shuffler)
+
+    def test_lines_are_permuted_reproducibly(self):
+        lines = self.shuffled(1024 * 1024)
+        self.assertEqual(sorted(lines), sorted(self.lines))
+        self.assertNotEqual(lines, self.lines)
+        self.assertEqual(lines, self.shuffled(1024 * 1024))
+        self.assertNotEqual(lines, self.shuffled(1024 * 1024, seed=2))
+
+    def test_oversized_buckets_are_shuffled_recursively(self):
+        depths = []
+        scatter = ExternalShuffle.scatter
+
+        def recording_scatter(shuffler, *args, **kwargs):
+            depths.append(shuffler._depth)
+            return scatter(shuffler, *args, **kwargs)
+
+        # Two buckets of about 15 KB each against a 4 KB budget
+        with mock.patch.object(ExternalShuffle, "scatter", recording_scatter):
+            lines = self.shuffled(4096, num_buckets=2)
+        self.assertEqual(sorted(lines), sorted(self.lines))
+        self.assertIn(1, depths)
+        self.assertEqual(os.listdir(self.tmp.name), ["pipeline.log"])
+
+    def test_line_offsets_count_against_the_budget(self):
+        with ExternalShuffle(1024 * 1024, 1, self.tmp.name, num_buckets=1) as shuffler:
+            shuffler.scatter(self.lines)
+            bucket = shuffler._buckets[0]
+            self.assertEqual(shuffler._bucket_memory(0), os.path.getsize(bucket) + 16 * len(self.lines))
+
+    def test_shuffle_file_keeps_the_header(self):
+        input_path = os.path.join(self.tmp.name, "pairs.csv")
+        output_path = os.path.join(self.tmp.name, "shuffled.csv")
+        with open(input_path, "w", encoding="utf-8") as f:
+            f.writelines(["header\n", *self.lines])
+        self.assertEqual(shuffle_file(input_path, output_path, 4096, seed=1, skip_header=True), len(self.lines))
+        with open(output_path, "r", encoding="utf-8") as f:
+            output = f.readlines()
+        self.assertEqual(output[0], "header\n")
+        self.assertEqual(sorted(output[1:]), sorted(self.lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
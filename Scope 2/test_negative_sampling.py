@@ -0,0 +1,36 @@
+import os
+import csv
+import tempfile
+import unittest
+from negative_sampling import balance_csv_file, escape_field, iter_balanced_rows, unescape_field
+
+
+class NegativeSamplingTest(unittest.TestCase):
+    def test_escape_round_trips(self):
+        for text in ["plain", "tab\there", "line\nbreak\r\n", "back\\slash\\t", "\\\t\\n", ""]:
+            escaped = escape_field(text)
+            self.assertFalse(set("\t\n\r") & set(escaped))
+            self.assertEqual(unescape_field(escaped), text)
+
+    def test_sentences_with_tabs_and_newlines_survive_the_shuffle(self):
+        pairs = [(f"first\t{i}", f"second\n{i}\\t") for i in range(50)]
+        rows = list(iter_balanced_rows(pairs, seed=1, memory_bytes=1024))
+        self.assertEqual(sorted(a for a, _, _ in rows), sorted(a for a, _ in pairs))
+        self.assertTrue({b for _, b, _ in rows} <= {b for _, b in pairs})
+        self.assertEqual(sum(label == "0" for _, _, label in rows), 25)
+
+    def test_balance_csv_file_with_quoted_tabs_and_newlines(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            input_path = os.path.join(tmp, "pairs.csv")
+            output_path = os.path.join(tmp, "balanced.csv")
+            with open(input_path, "w", encoding="utf-8", newline="") as f:
+                csv.writer(f).writerows([["a\tone", "b\ntwo", "1"], ["a three", "b\rfour", "1"]])
+            self.assertEqual(balance_csv_file(input_path, output_path, "sentence_a,sentence_b,label", seed=1), 2)
+            with open(output_path, "r", encoding="utf-8", newline="") as f:
+                rows = list(csv.reader(f))[1:]
+            self.assertEqual(sorted(row[0] for row in rows), sorted(["a\tone", "a three"]))
+            self.assertTrue({row[1] for row in rows} <= {"b\ntwo", "b\rfour"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+import pipeline_log
+from pipeline_dag import PipelineRunner
+
+
+class PipelineRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        pipeline_log.start_logging(os.path.join(self.tmp.name, "pipeline.log"))
+        self.input_path = self.path("links.json")
+        self.write(self.input_path, "{}")
+        self.calls = []
+        self.seed = 1
+
+    def tearDown(self):
+        pipeline_log.stop_logging()
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def write(self, path, text):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def stage(self, name):
+        def fn():
+            self.calls.append(name)
+            self.write(self.path(f"{name}.out"), name)
+        return fn
+
+    def runner(self):
+        # acquire -> balance -> segment, where balance needs acquire's in-run state (rerun_with)
+        runner = PipelineRunner(self.path("pipeline_state.json"))
+        runner.add("acquire", self.stage("acquire"), inputs=[self.input_path], outputs=[self.path("acquire.out")])
+        runner.add("balance", self.stage("balance"), outputs=[self.path("balance.out")], params={"seed": self.seed},
+                   deps=["acquire"], rerun_with=["acquire"])
+        runner.add("segment", self.stage("segment"), outputs=[self.path("segment.out")], deps=["balance"])
+        return runner
+
+    def run_pipeline(self, **kwargs):
+        self.calls = []
+        return self.runner().run(**kwargs)
+
+    def test_up_to_date_stages_are_skipped(self):
+        self.assertEqual(self.run_pipeline(), {"acquire": "ran", "balance": "ran", "segment": "ran"})
+        self.assertEqual(self.run_pipeline(), {"acquire": "skipped", "balance": "skipped", "segment": "skipped"})
+        self.assertEqual(self.calls, [])
+
+    def test_changed_inputs_and_missing_outputs_make_stages_stale(self):
+        self.run_pipeline()
+        os.remove(self.path("segment.out"))
+        self.assertEqual(self.runner().stale_stages(), {"segment": f"missing outputs: {self.path('segment.out')}"})
+        self.run_pipeline()
+        self.assertEqual(self.calls, ["segment"])
+
+        self.write(self.input_path, '{"xml_links": []}')
+        self.run_pipeline()
+        self.assertEqual(self.calls, ["acquire", "balance", "segment"])
+
+    def test_force_reruns_downstream_only(self):
+        self.run_pipeline()
+        self.assertEqual(self.run_pipeline(force=["segment"])["segment"], "ran")
+        self.assertEqual(self.calls, ["segment"])
+        with self.assertRaises(ValueError):
+            self.run_pipeline(force=["unknown"])
+        self.run_pipeline(force_all=True)
+        self.assertEqual(self.calls, ["acquire", "balance", "segment"])
+
+    def test_rerun_with_pulls_in_the_producer(self):
+        self.run_pipeline()
+        self.run_pipeline(force=["balance"])
+        self.assertEqual(self.calls, ["acquire", "balance", "segment"])
+
+        # A param change makes balance stale on its own, which must also re-run acquire
+        self.seed = 2
+        self.assertEqual(self.runner().expand_force(()), {"acquire"})
+        self.run_pipeline()
+        self.assertEqual(self.calls, ["acquire", "balance", "segment"])
+
+    def test_dry_run_runs_nothing(self):
+        self.run_pipeline()
+        results = self.run_pipeline(force=["balance"], dry_run=True)
+        self.assertEqual(results, {"acquire": "forced", "balance": "forced",
+                                   "segment": "upstream re-ran: balance"})
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.run_pipeline()["segment"], "skipped")
+
+    def test_output_paths_lists_existing_outputs(self):
+        self.run_pipeline()
+        self.assertEqual(self.runner().output_paths(),
+                         {self.path(f"{name}.out") for name in ("acquire", "balance", "segment")})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import os
+import csv
+import tempfile
+import unittest
+import pipeline_log
+from resumable_io import FileCheckpoint, iter_csv_records_with_offsets
+from segmentation_service import SegmentationPool
+from Unified_Script_Final import apply_segmentation_to_file
+
+
+class ResumableIOTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        pipeline_log.start_logging(os.path.join(self.tmp.name, "pipeline.log"))
+        self.rows = [["sentence_a", "sentence_b", "label"],
+                     ["الكتاب", "القلم", "1"],
+                     ["الكتاب, الجديد", "سطر أول\nسطر ثان", "0"],
+                     ["المكتبة", "الباب", "1"]]
+        self.path = os.path.join(self.tmp.name, "pairs.csv")
+        with open(self.path, "w", encoding="utf-8", newline="") as f:
+            csv.writer(f).writerows(self.rows)
+
+    def tearDown(self):
+        pipeline_log.stop_logging()
+        self.tmp.cleanup()
+
+    def records(self, offset=0):
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            return list(iter_csv_records_with_offsets(f))
+
+    def test_offsets_fall_after_whole_records(self):
+        records = self.records()
+        self.assertEqual([row for row, _ in records], self.rows)
+        self.assertEqual(records[-1][1], os.path.getsize(self.path))
+        # Resuming after the first data row starts at the quoted multi-line record, not inside it
+        self.assertEqual([row for row, _ in self.records(records[1][1])], self.rows[2:])
+        self.assertEqual([row for row, _ in self.records(records[2][1])], self.rows[3:])
+
+    def test_segmentation_resumes_over_a_multi_line_field(self):
+        output_base = os.path.join(self.tmp.name, "pairs_segmented")
+        checkpoint = FileCheckpoint(f"{output_base}.checkpoint.json", self.path)
+        checkpoint.save(offset=self.records()[1][1], chunk_number=2, done=False)
+        with SegmentationPool(workers=0, kind="stub") as pool:
+            apply_segmentation_to_file(self.path, output_base, pool, batch_size=10)
+        self.assertFalse(os.path.exists(f"{output_base}_batch_1.csv"))
+        with open(f"{output_base}_batch_2.csv", "r", encoding="utf-8", newline="") as f:
+            output = list(csv.reader(f))
+        self.assertEqual(output, [self.rows[0],
+                                  ["ال+كتاب, ال+جديد", "سطر أول سطر ثان", "0"],
+                                  ["ال+مكتبة", "ال+باب", "1"]])
+        self.assertTrue(checkpoint.load()["done"])
+
+
+if __name__ == "__main__":
+    unittest.main()
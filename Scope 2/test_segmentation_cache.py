@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+from segmentation_cache import SegmentationCache
+
+
+class SegmentationCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "segmentation_cache.sqlite")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hits_and_misses_across_reopen(self):
+        with SegmentationCache(self.path, namespace="stub") as cache:
+            self.assertIsNone(cache.get("الكتاب الجديد"))
+            cache.put("الكتاب الجديد", "ال+كتاب ال+جديد")
+            cache.put("فشل", None)
+            # Whitespace is normalised, so this is the same sentence and a memory hit
+            self.assertEqual(cache.get("  الكتاب   الجديد "), "ال+كتاب ال+جديد")
+            self.assertIsNone(cache.get("فشل"))
+            self.assertEqual(cache.stats(), {"lookups": 3, "memory_hits": 1, "disk_hits": 0, "misses": 2,
+                                             "hit_rate": 1 / 3})
+
+        with SegmentationCache(self.path, namespace="stub") as cache:
+            self.assertEqual(cache.get("الكتاب الجديد"), "ال+كتاب ال+جديد")
+            self.assertEqual(cache.get("الكتاب الجديد"), "ال+كتاب ال+جديد")
+            self.assertIsNone(cache.get("فشل"))
+            stats = cache.stats()
+            self.assertEqual((stats["disk_hits"], stats["memory_hits"], stats["misses"]), (1, 1, 1))
+
+        with SegmentationCache(self.path, namespace="farasa") as cache:
+            self.assertIsNone(cache.get("الكتاب الجديد"))
+
+    def test_lru_evicts_to_disk(self):
+        with SegmentationCache(self.path, memory_entries=2) as cache:
+            cache.put_many((cache.key(f"s{i}"), f"seg{i}") for i in range(3))
+            self.assertEqual(cache.get_many([cache.key("s0"), cache.key("s2")]),
+                             {cache.key("s0"): "seg0", cache.key("s2"): "seg2"})
+            self.assertEqual((cache.disk_hits, cache.memory_hits), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import json
+import tempfile
+import unittest
+import pipeline_log
+from segmentation_service import SegmentationPool, StubSegmenter, segment_batch
+
+
+class DroppingSegmenter(StubSegmenter):
+    """Loses the last line of a multi-line call, like Farasa on some inputs."""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def segment(self, text):
+        self.calls += 1
+        lines = super().segment(text).split("\n")
+        return "\n".join(lines[:-1] if len(lines) > 1 else lines)
+
+
+class UndecodableSegmenter(StubSegmenter):
+    """Fails to decode any call that contains "bad"."""
+
+    def segment(self, text):
+        if "bad" in text:
+            raise UnicodeDecodeError("utf-8", b"\xff", 0, 1, "invalid start byte")
+        return super().segment(text)
+
+
+class SegmentationServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.tmp.name, "pipeline.log")
+        pipeline_log.start_logging(self.log_path, flush_every=1)
+        self.sentences = [f"الكتاب رقم {i} في المكتبة" for i in range(57)]
+        self.expected = [StubSegmenter().segment(sentence) for sentence in self.sentences]
+
+    def tearDown(self):
+        pipeline_log.stop_logging()
+        self.tmp.cleanup()
+
+    def logged_messages(self):
+        pipeline_log.stop_logging()
+        with open(self.log_path, "r", encoding="utf-8") as f:
+            return [json.loads(line)["message"] for line in f]
+
+    def test_pool_keeps_input_order(self):
+        self.assertTrue(self.expected[0].startswith("ال+كتاب"))
+        for workers in (0, 2):
+            with SegmentationPool(workers=workers, batch_size=5, kind="stub") as pool:
+                self.assertEqual(list(pool.segment_stream(self.sentences)), self.expected, f"workers={workers}")
+
+    def test_line_count_mismatch_falls_back_to_one_call_per_sentence(self):
+        segmenter = DroppingSegmenter()
+        self.assertEqual(segment_batch(segmenter, self.sentences[:4]), self.expected[:4])
+        self.assertEqual(segmenter.calls, 5)
+        self.assertIn("Batched segmentation returned 3 lines for 4 sentences, retrying one by one",
+                      self.logged_messages())
+
+    def test_undecodable_sentence_becomes_none(self):
+        results = segment_batch(UndecodableSegmenter(), ["الكتاب", "bad text", "القلم"])
+        self.assertEqual(results, ["ال+كتاب", None, "ال+قلم"])
+
+    def test_newlines_inside_a_sentence_do_not_shift_results(self):
+        self.assertEqual(segment_batch(StubSegmenter(), ["الكتاب\nالجديد", "القلم"]), ["ال+كتاب ال+جديد", "ال+قلم"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import unittest
+import pipeline_log
+from sharded_executor import iter_shard_lines, plan_shards, run_sharded
+
+
+def count_lines(shard):
+    return sum(1 for _ in iter_shard_lines(shard))
+
+
+class ShardedExecutorTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        pipeline_log.start_logging(os.path.join(self.tmp.name, "pipeline.log"))
+        # Empty lines, multi-byte characters and no newline at the end of the file
+        self.lines = ["first line\n", "\n", "سطر عربي\n", "x\n", "a much longer line than the others\n", "\n", "last"]
+        self.path = os.path.join(self.tmp.name, "corpus.txt")
+        with open(self.path, "w", encoding="utf-8", newline="") as f:
+            f.writelines(self.lines)
+
+    def tearDown(self):
+        pipeline_log.stop_logging()
+        self.tmp.cleanup()
+
+    def test_every_line_is_owned_by_exactly_one_shard(self):
+        size = os.path.getsize(self.path)
+        for shard_bytes in range(1, size + 2):
+            shards = plan_shards([self.path], shard_bytes)
+            self.assertEqual(shards[-1].end, size)
+            lines = [line for shard in shards for line in iter_shard_lines(shard)]
+            self.assertEqual(lines, self.lines, f"shard_bytes={shard_bytes}")
+
+    def test_shard_starting_right_after_a_newline_owns_that_line(self):
+        first, second = plan_shards([self.path], len(self.lines[0].encode("utf-8")))[:2]
+        self.assertEqual(list(iter_shard_lines(first)), [self.lines[0]])
+        self.assertEqual(list(iter_shard_lines(second))[0], self.lines[1])
+
+    def test_run_sharded_keeps_task_order(self):
+        shards = plan_shards([self.path], 8)
+        expected = [count_lines(shard) for shard in shards]
+        self.assertEqual(run_sharded(count_lines, [(shard,) for shard in shards], workers=2), expected)
+        self.assertEqual(sum(expected), len(self.lines))
+
+
+if __name__ == "__main__":
+    unittest.main()
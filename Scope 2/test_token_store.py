@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from fast_tokenization import pad_collate
+from token_store import (ShardedTokenStore, TokenStore, TokenStoreDataset, TokenStoreWriter, open_token_store,
+                         shard_prefix, write_manifest)
+
+
+class TokenStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.prefix = os.path.join(self.tmp.name, "train")
+        self.examples = [[101, 7, 8, 102], [], [101, 65535, 102], [5] * 20]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, prefix, examples, vocab_size=50_000):
+        # A tiny buffer, so the examples are flushed across several writes
+        with TokenStoreWriter(prefix, vocab_size, buffer_tokens=3) as writer:
+            writer.extend(examples)
+        return {"prefix": prefix, "dtype": np.dtype(writer.dtype).name, "vocab_size": vocab_size,
+                "num_examples": writer.num_examples, "num_tokens": writer.num_tokens}
+
+    def test_round_trip(self):
+        self.write(self.prefix, self.examples)
+        store = TokenStore(self.prefix)
+        self.assertEqual(store.tokens.dtype, np.uint16)
+        self.assertEqual([example.tolist() for example in store], self.examples)
+        self.assertEqual(store[-1].tolist(), self.examples[-1])
+        self.assertEqual(store.lengths().tolist(), [4, 0, 3, 20])
+        with self.assertRaises(IndexError):
+            store[len(self.examples)]
+
+    def test_large_vocabularies_and_empty_stores(self):
+        self.write(self.prefix, [[70_000, 1]], vocab_size=100_000)
+        self.assertEqual(TokenStore(self.prefix)[0].tolist(), [70_000, 1])
+        self.write(self.prefix, [])
+        self.assertEqual(len(TokenStore(self.prefix)), 0)
+
+    def test_incomplete_store_is_not_opened(self):
+        writer = TokenStoreWriter(self.prefix, 50_000)
+        writer.append([1, 2])
+        with self.assertRaises(FileNotFoundError):
+            TokenStore(self.prefix)
+        writer.close()
+
+    def test_sharded_store_keeps_manifest_order(self):
+        shards = [self.write(shard_prefix(self.prefix, index), examples)
+                  for index, examples in enumerate([self.examples[:1], [], self.examples[1:]])]
+        manifest = write_manifest(self.prefix, shards)
+        self.assertEqual(manifest["num_examples"], len(self.examples))
+        self.assertEqual(manifest["shards"][0]["prefix"], "train.shard00000")
+        store = open_token_store(self.prefix)
+        self.assertIsInstance(store, ShardedTokenStore)
+        self.assertEqual([store[i].tolist() for i in range(len(store))], self.examples)
+        self.assertEqual([example.tolist() for example in store], self.examples)
+        self.assertEqual(store[-2].tolist(), self.examples[-2])
+        self.assertEqual(store.lengths().tolist(), [4, 0, 3, 20])
+
+    def test_dataset_truncates_and_pads_per_batch(self):
+        self.write(self.prefix, self.examples)
+        dataset = TokenStoreDataset(self.prefix, max_length=5)
+        self.assertEqual((len(dataset), dataset.vocab_size), (4, 50_000))
+        self.assertEqual(dataset[3]["input_ids"].tolist(), [5] * 5)
+        batch = pad_collate([dataset[0], dataset[2]], pad_token_id=0, return_tensors="np")
+        self.assertEqual(batch["input_ids"].tolist(), [[101, 7, 8, 102, 0, 0, 0, 0], [101, 65535, 102, 0, 0, 0, 0, 0]])
+        self.assertEqual(batch["attention_mask"].sum(axis=1).tolist(), [4, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import re
+import time
+import random
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                      PRECOMPILED TEXT NORMALIZATION AND FILTERS                                           ####
+####                                                                                                                           ####
+###################################################################################################################################
+
+ENGLISH_WORD = re.compile(r"\b[a-zA-Z]+\b")
+ARABIC_WORD = re.compile(r"[ء-ي]+")
+ARABIC_SENTENCE = re.compile(r"[ء-ي\s،.؛]+")
+# Punctuation clean_text removes; a few str.replace calls beat a regex on this short list
+PUNCTUATION = ".,;،؛"
+OSIAN_UNWANTED_CHARS = re.compile(r"[()\[\]:«»“”‘’—_,;!?|/\\]")
+OSIAN_UNWANTED_SEQUENCES = re.compile(r"--|\.\.")
+LEADING_NUMBER = re.compile(r"\d+ ")
+
+
+def contains_english_word(line):
+    """Checks if a line contains any English words."""
+    return ENGLISH_WORD.search(line) is not None
+
+
+def arabic_words(line):
+    """Returns the runs of Arabic letters in line."""
+    return ARABIC_WORD.findall(line)
+
+
+def extract_arabic_sentences(text, min_words=10):
+    """
+    Extracts meaningful Arabic sentences (runs of Arabic letters, spaces and Arabic punctuation)
+    of at least min_words words from text.
+    """
+    return [sentence for match in ARABIC_SENTENCE.findall(text)
+            if len((sentence := match.strip()).split()) >= min_words]
+
+
+def clean_text(text):
+    """
+    Cleans Arabic text: removes .,;،؛ and collapses whitespace runs into single spaces.
+    Same result as re.sub(r'\\s+', ' ', re.sub(r'[.,;،؛]', '', text)).strip(): str.split() and the
+    regex \\s agree on every Unicode whitespace character.
+    """
+    for char in PUNCTUATION:
+        if char in text:
+            text = text.replace(char, "")
+    return " ".join(text.split())
+
+
+def clean_sentence(text):
+    """
+    Cleans an OSIAN sentence: removes brackets, quotes and other unwanted punctuation, then "--" and "..",
+    collapses whitespace and drops a leading number. Same result as the four re.sub passes it replaces,
+    with the rarely needed passes skipped when they cannot match.
+    """
+    text = OSIAN_UNWANTED_CHARS.sub("", text)
+    if "--" in text or ".." in text:
+        text = OSIAN_UNWANTED_SEQUENCES.sub("", text)
+    text = " ".join(text.split())
+    if text[:1].isdecimal():
+        match = LEADING_NUMBER.match(text)
+        if match:
+            text = text[match.end():]
+    return text
+
+
+def clean_texts(texts):
+    """Batch version of clean_text."""
+    return [clean_text(text) for text in texts]
+
+
+def clean_sentences(texts):
+    """Batch version of clean_sentence."""
+    return [clean_sentence(text) for text in texts]
+
+
+def english_word_flags(lines):
+    """Batch version of contains_english_word: one bool per line."""
+    search = ENGLISH_WORD.search
+    return [search(line) is not None for line in lines]
+
+
+def benchmark_normalization(num_lines=100_000, seed=0):
+    """
+    Compares the per-line time of the previous re.sub/re.search/re.findall implementations with this module's
+    batch functions on synthetic Arabic lines, and checks that both give identical results.
+    """
+    def old_clean_text(text):
+        text = re.sub(r'[.,;،؛]', '', text)
+        return re.sub(r'\s+', ' ', text).strip()
+
+    def old_clean_sentence(text):
+        text = re.sub(r"[()\[\]:«»“”‘’—_,;!?|/\\]", "", text)
+        text = re.sub(r"(\-\-|\[\]|\.\.)", "", text)
+        text = re.sub(r"\s+", " ", text).strip()
+        return re.sub(r"^\d+\s+", "", text)
+
+    def old_contains_english_word(line):
+        return bool(re.search(r"\b[a-zA-Z]+\b", line))
+
+    def old_extract_arabic_sentences(text):
+        sentences = re.findall(r'[ء-ي\s،.؛]+', text)
+        return [sentence.strip() for sentence in sentences if len(sentence.strip().split()) >= 10]
+
+    rng = random.Random(seed)
+    tokens = ["الكتاب", "الجديد", "في", "المكتبة", "والقلم", "على", "الطاولة", "،", ".", "؛", "«قال»", "(2020)",
+              "--", "...", "12", "news", "\t"]
+    lines = [" ".join(rng.choice(tokens) for _ in range(rng.randint(5, 40))) for _ in range(num_lines)]
+
+    cases = [
+        ("clean_text", lambda: [old_clean_text(line) for line in lines], lambda: clean_texts(lines)),
+        ("clean_sentence", lambda: [old_clean_sentence(line) for line in lines], lambda: clean_sentences(lines)),
+        ("contains_english_word", lambda: [old_contains_english_word(line) for line in lines],
+         lambda: english_word_flags(lines)),
+        ("extract_arabic_sentences", lambda: [old_extract_arabic_sentences(line) for line in lines],
+         lambda: [extract_arabic_sentences(line) for line in lines]),
+    ]
+    for name, old, new in cases:
+        started = time.perf_counter()
+        expected = old()
+        old_seconds = time.perf_counter() - started
+        started = time.perf_counter()
+        result = new()
+        new_seconds = time.perf_counter() - started
+        assert result == expected, f"{name} results differ"
+        print(f"{name:<26} {old_seconds / num_lines * 1e6:6.2f} -> {new_seconds / num_lines * 1e6:6.2f} us/line "
+              f"({old_seconds / new_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    benchmark_normalization()
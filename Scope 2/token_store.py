@@ -0,0 +1,269 @@
+import os
+import json
+import time
+import numpy as np
+
+###################################################################################################################################
+####                                                                                                                           ####
+####                                        BINARY MEMORY-MAPPED TOKEN STORE                                                   ####
+####                                                                                                                           ####
+###################################################################################################################################
+# A store "{prefix}" is three files:
+#   {prefix}.tokens.bin   every example's token ids back to back (uint16, or uint32 for vocabularies over 65536)
+#   {prefix}.offsets.bin  int64 start offset of every example into the tokens, plus the total count at the end
+#   {prefix}.json         dtype, example and token counts; written last, so a store without it is incomplete
+# A sharded store "{prefix}" is one such store per shard, "{prefix}.shard00000" onwards, listed in order
+# by {prefix}.manifest.json (see write_manifest), which is written once every shard is complete.
+
+
+def token_dtype(vocab_size):
+    return np.uint16 if vocab_size <= np.iinfo(np.uint16).max + 1 else np.uint32
+
+
+def store_paths(prefix):
+    return f"{prefix}.tokens.bin", f"{prefix}.offsets.bin", f"{prefix}.json"
+
+
+def shard_prefix(prefix, index):
+    return f"{prefix}.shard{index:05d}"
+
+
+def manifest_path(prefix):
+    return f"{prefix}.manifest.json"
+
+
+class TokenStoreWriter:
+    """
+    Appends variable-length examples to a token store. Tokens and offsets are streamed to disk as they come,
+    so memory does not grow with the store. Use as a context manager; the store is readable once closed.
+    """
+
+    def __init__(self, prefix, vocab_size, buffer_tokens=1 << 20):
+        self.prefix = prefix
+        self.dtype = token_dtype(vocab_size)
+        self.vocab_size = vocab_size
+        self.buffer_tokens = buffer_tokens
+        self.num_examples = 0
+        self.num_tokens = 0
+        tokens_path, offsets_path, meta_path = store_paths(prefix)
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        self._tokens = open(tokens_path, "wb")
+        self._offsets = open(offsets_path, "wb")
+        self._buffer = []
+        self._buffered = 0
+        self._offset_buffer = [0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def append(self, ids):
+        self._buffer.append(ids)
+        self._buffered += len(ids)
+        self.num_tokens += len(ids)
+        self.num_examples += 1
+        self._offset_buffer.append(self.num_tokens)
+        if self._buffered >= self.buffer_tokens:
+            self.flush()
+
+    def extend(self, examples):
+        for ids in examples:
+            self.append(ids)
+
+    def flush(self):
+        if self._buffer:
+            np.concatenate([np.asarray(ids, dtype=self.dtype) for ids in self._buffer]).tofile(self._tokens)
+        np.asarray(self._offset_buffer, dtype=np.int64).tofile(self._offsets)
+        self._buffer = []
+        self._buffered = 0
+        self._offset_buffer = []
+
+    def close(self):
+        if self._tokens is None:
+            return
+        self.flush()
+        self._tokens.close()
+        self._offsets.close()
+        self._tokens = self._offsets = None
+        _, _, meta_path = store_paths(self.prefix)
+        with open(f"{meta_path}.tmp", "w", encoding="utf-8") as f:
+            json.dump({"dtype": np.dtype(self.dtype).name, "vocab_size": self.vocab_size,
+                       "num_examples": self.num_examples, "num_tokens": self.num_tokens}, f)
+        os.replace(f"{meta_path}.tmp", meta_path)
+
+
+class TokenStore:
+    """
+    Read-only, memory-mapped view of a token store. store[i] is a zero-copy numpy view of example i,
+    so a training Dataset can random-access any example without parsing or loading the file:
+        store = TokenStore("/content/tokenized/train")
+        DataLoader(store, batch_size=16, shuffle=True, collate_fn=partial(pad_collate, pad_token_id=pad_id))
+    """
+
+    def __init__(self, prefix):
+        tokens_path, offsets_path, meta_path = store_paths(prefix)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"No complete token store at {prefix} (missing {meta_path})")
+        with open(meta_path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.prefix = prefix
+        self.offsets = np.memmap(offsets_path, dtype=np.int64, mode="r")
+        if self.meta["num_tokens"]:
+            self.tokens = np.memmap(tokens_path, dtype=self.meta["dtype"], mode="r")
+        else:
+            # numpy cannot map an empty file
+            self.tokens = np.zeros(0, dtype=self.meta["dtype"])
+
+    def __len__(self):
+        return self.meta["num_examples"]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.tokens[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def lengths(self):
+        """Token count of every example, e.g. for length-bucketed batching."""
+        return np.diff(self.offsets)
+
+
+def write_manifest(prefix, shards):
+    """
+    Writes the manifest of a sharded store. shards lists, in example order, one dict per shard with at least
+    its "prefix" (made relative to the manifest), "dtype", "vocab_size", "num_examples" and "num_tokens".
+    """
+    directory = os.path.dirname(os.path.abspath(prefix))
+    shards = [dict(shard, prefix=os.path.relpath(os.path.abspath(shard["prefix"]), directory)) for shard in shards]
+    dtypes = {shard["dtype"] for shard in shards}
+    manifest = {
+        "dtype": dtypes.pop() if len(dtypes) == 1 else np.dtype(np.uint32).name,
+        "vocab_size": max((shard["vocab_size"] for shard in shards), default=0),
+        "num_examples": sum(shard["num_examples"] for shard in shards),
+        "num_tokens": sum(shard["num_tokens"] for shard in shards),
+        "shards": shards,
+    }
+    path = manifest_path(prefix)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+    return manifest
+
+
+class ShardedTokenStore:
+    """
+    Read-only view of a sharded store as one sequence of examples, in manifest order. Each shard is a
+    memory-mapped TokenStore; store[i] finds its shard with a binary search over the shard sizes.
+    """
+
+    def __init__(self, prefix):
+        path = manifest_path(prefix)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No complete sharded token store at {prefix} (missing {path})")
+        with open(path, "r", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.prefix = prefix
+        directory = os.path.dirname(os.path.abspath(prefix))
+        self.shards = [TokenStore(os.path.join(directory, shard["prefix"])) for shard in self.meta["shards"]]
+        self._ends = np.cumsum([len(shard) for shard in self.shards], dtype=np.int64)
+
+    def __len__(self):
+        return self.meta["num_examples"]
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        shard = int(np.searchsorted(self._ends, index, side="right"))
+        start = self._ends[shard - 1] if shard else 0
+        return self.shards[shard][index - start]
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def lengths(self):
+        return np.concatenate([shard.lengths() for shard in self.shards]) if self.shards else np.zeros(0, np.int64)
+
+
+def open_token_store(prefix):
+    """Opens the store at prefix, sharded (a manifest exists) or single."""
+    return ShardedTokenStore(prefix) if os.path.exists(manifest_path(prefix)) else TokenStore(prefix)
+
+
+class TokenStoreDataset:
+    """
+    Map-style training Dataset over the store at prefix (sharded or single): dataset[i] is {"input_ids": ...}
+    with example i's ids as int64, cut to max_length tokens. Only the examples of a batch are read from the
+    memory maps, so the split is never loaded whole. Batch it with fast_tokenization.pad_collate:
+        DataLoader(TokenStoreDataset(prefix, 512), batch_size=16, shuffle=True,
+                   collate_fn=partial(pad_collate, pad_token_id=tokenizer.pad_token_id))
+    """
+
+    def __init__(self, prefix, max_length=None):
+        self.store = open_token_store(prefix)
+        self.max_length = max_length
+
+    @property
+    def vocab_size(self):
+        return self.store.meta["vocab_size"]
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        ids = self.store[index]
+        if self.max_length:
+            ids = ids[:self.max_length]
+        return {"input_ids": ids.astype(np.int64)}
+
+
+def benchmark_token_store(num_examples=200_000, vocab_size=50_000, path="token_store_benchmark", seed=0):
+    """
+    Compares the size and load time of unpadded JSON-lines records with a token store of the same examples,
+    and the time to read 10,000 random examples from the store.
+    """
+    rng = np.random.default_rng(seed)
+    examples = [rng.integers(0, vocab_size, rng.integers(10, 200)).tolist() for _ in range(num_examples)]
+
+    with open(f"{path}.jsonl", "w", encoding="utf-8") as f:
+        for ids in examples:
+            f.write(json.dumps({"input_ids": ids}) + "\n")
+    with TokenStoreWriter(path, vocab_size) as writer:
+        writer.extend(examples)
+
+    started = time.perf_counter()
+    with open(f"{path}.jsonl", "r", encoding="utf-8") as f:
+        loaded = [json.loads(line)["input_ids"] for line in f]
+    json_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    store = TokenStore(path)
+    store_seconds = time.perf_counter() - started
+    assert len(loaded) == len(store) and all(store[i].tolist() == loaded[i] for i in (0, len(store) // 2, -1))
+
+    started = time.perf_counter()
+    for index in rng.integers(0, len(store), 10_000):
+        store[index].sum()
+    random_seconds = time.perf_counter() - started
+
+    json_bytes = os.path.getsize(f"{path}.jsonl")
+    store_bytes = sum(os.path.getsize(p) for p in store_paths(path))
+    print(f"JSON lines:  {json_bytes / 2**20:.1f} MB, {json_seconds:.2f} s to load")
+    print(f"token store: {store_bytes / 2**20:.1f} MB ({json_bytes / store_bytes:.1f}x smaller), "
+          f"{store_seconds * 1000:.1f} ms to open, {random_seconds / 10_000 * 1e6:.1f} us per random example")
+    del store
+    for p in (f"{path}.jsonl", *store_paths(path)):
+        os.remove(p)
+
+
+if __name__ == "__main__":
+    benchmark_token_store()
@@ -19,6 +19,7 @@ import pandas as pd
 import logging
 import json
 from datetime import datetime
+from functools import partial
 from tqdm import tqdm
 from transformers import (
     AutoModelForMaskedLM,
@@ -28,6 +29,8 @@ from transformers import (
 )
 from accelerate import Accelerator
 from torch.utils.data import Dataset, DataLoader
+from fast_tokenization import pad_collate
+from token_store import TokenStoreDataset, manifest_path, store_paths
 
 import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -50,6 +53,12 @@ LEARNING_RATE = 5e-5
 MAX_LENGTH = 512
 GRAD_ACC_STEPS = 4
 CHUNK_SIZE = 500
+# Token stores written by final_final_tokenization_only.py (TOKENIZED_FORMAT = "memmap"). When every split has one
+# under TOKENIZED_DIR, training reads them instead of the CSVs, with the tokenizer and resized model saved by
+# that script, since the stored ids include its added tokens
+TOKENIZED_DIR = "/content/tokenized"
+TOKENIZED_TOKENIZER_PATH = "/content/modernbert_tokenizer_updated"
+TOKENIZED_MODEL_PATH = "/content/modernbert_model_updated"
 
 def memory_usage():
     proc = psutil.Process()
@@ -62,6 +71,12 @@ def process_directory_files(directory):
             file_path = os.path.join(directory, file)
             for chunk in pd.read_csv(file_path, chunksize=CHUNK_SIZE):
                 all_chunks.append(chunk)
+        elif file.endswith('.parquet'):
+            # Segmented Parquet chunks: memory-mapped, read one record batch at a time
+            import pyarrow.parquet as pq
+            parquet_file = pq.ParquetFile(os.path.join(directory, file), memory_map=True)
+            for batch in parquet_file.iter_batches(batch_size=CHUNK_SIZE):
+                all_chunks.append(batch.to_pandas())
     return pd.concat(all_chunks, ignore_index=True)
 
 class CustomDataset(Dataset):
@@ -82,6 +97,19 @@ class CustomDataset(Dataset):
         encoding['labels'][encoding['input_ids'] == self.tokenizer.pad_token_id] = -100
         return encoding
 
+def token_store_prefix(split):
+    """Returns the token store of split under TOKENIZED_DIR, or None if it was not tokenized."""
+    prefix = os.path.join(TOKENIZED_DIR, split)
+    if os.path.exists(manifest_path(prefix)) or os.path.exists(store_paths(prefix)[2]):
+        return prefix
+    return None
+
+def token_store_collate(examples, pad_token_id):
+    # Same labels as CustomDataset: the input ids, with padding ignored by the loss
+    batch = pad_collate(examples, pad_token_id)
+    batch['labels'] = batch['input_ids'].masked_fill(batch['attention_mask'] == 0, -100)
+    return batch
+
 def evaluate_model(model, dataloader, accelerator):
     model.eval()
     total_loss = 0
@@ -109,20 +137,35 @@ def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
     accelerator = Accelerator(mixed_precision="fp16", gradient_accumulation_steps=GRAD_ACC_STEPS)
 
-    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
-    model = AutoModelForMaskedLM.from_pretrained(MODEL_NAME)
-
-    train_df = process_directory_files(TRAIN_DIR)
-    val_df = process_directory_files(VAL_DIR)
-    test_df = process_directory_files(TEST_DIR)
-
-    train_dataset = CustomDataset(train_df, tokenizer)
-    val_dataset = CustomDataset(val_df, tokenizer)
-    test_dataset = CustomDataset(test_df, tokenizer)
-
-    train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, pin_memory=True)
-    val_dataloader = DataLoader(val_dataset, batch_size=BATCH_SIZE, pin_memory=True)
-    test_dataloader = DataLoader(test_dataset, batch_size=BATCH_SIZE, pin_memory=True)
+    store_prefixes = [token_store_prefix(split) for split in ("train", "validation", "test")]
+    if all(store_prefixes):
+        # Pre-tokenized: examples are read from the memory-mapped stores and padded per batch
+        logging.info(f"Training on the token stores in {TOKENIZED_DIR}")
+        tokenizer = AutoTokenizer.from_pretrained(TOKENIZED_TOKENIZER_PATH)
+        model = AutoModelForMaskedLM.from_pretrained(TOKENIZED_MODEL_PATH)
+        train_dataset, val_dataset, test_dataset = [TokenStoreDataset(prefix, MAX_LENGTH) for prefix in store_prefixes]
+        num_embeddings = model.get_input_embeddings().num_embeddings
+        if train_dataset.vocab_size > num_embeddings:
+            raise ValueError(f"Token store vocabulary ({train_dataset.vocab_size}) is larger than the model's "
+                             f"embeddings ({num_embeddings}); use the model saved with the tokenizer")
+        collate_fn = partial(token_store_collate, pad_token_id=tokenizer.pad_token_id)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME)
+        model = AutoModelForMaskedLM.from_pretrained(MODEL_NAME)
+
+        train_df = process_directory_files(TRAIN_DIR)
+        val_df = process_directory_files(VAL_DIR)
+        test_df = process_directory_files(TEST_DIR)
+
+        train_dataset = CustomDataset(train_df, tokenizer)
+        val_dataset = CustomDataset(val_df, tokenizer)
+        test_dataset = CustomDataset(test_df, tokenizer)
+        collate_fn = None
+
+    train_dataloader = DataLoader(train_dataset, batch_size=BATCH_SIZE, shuffle=True, pin_memory=True,
+                                  collate_fn=collate_fn)
+    val_dataloader = DataLoader(val_dataset, batch_size=BATCH_SIZE, pin_memory=True, collate_fn=collate_fn)
+    test_dataloader = DataLoader(test_dataset, batch_size=BATCH_SIZE, pin_memory=True, collate_fn=collate_fn)
 
     optimizer = torch.optim.AdamW(model.parameters(), lr=LEARNING_RATE)
     scheduler = get_scheduler("linear", optimizer=optimizer, num_warmup_steps=0, num_training_steps=len(train_dataloader) * EPOCHS)